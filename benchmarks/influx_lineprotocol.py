@@ -0,0 +1,80 @@
+"""
+Benchmarks serializing telemetry and traces into InfluxDB line protocol with influxdb_client's Point (one object and a
+chain of tag/field calls per record) against the direct serializer in galileodb.influx.lineprotocol.
+
+Run with: python -m benchmarks.influx_lineprotocol
+"""
+import time
+
+from influxdb_client import Point, WritePrecision
+
+from galileodb.influx import lineprotocol
+from galileodb.model import Telemetry, RequestTrace
+
+RECORDS = 100000
+
+
+def telemetry_points(telemetry):
+    points = list()
+    for data in telemetry:
+        p = Point('telemetry') \
+            .time(lineprotocol.time_ns(data.timestamp), WritePrecision.NS) \
+            .field('value', float(data.value)) \
+            .tag('exp_id', data.exp_id) \
+            .tag('node', data.node) \
+            .tag('metric', data.metric) \
+            .tag('subsystem', data.subsystem)
+        points.append(p)
+    return '\n'.join(p.to_line_protocol() for p in points).encode('utf-8')
+
+
+def trace_points(traces):
+    points = list()
+    for trace in traces:
+        p = Point('traces') \
+            .time(lineprotocol.time_ns(trace.sent), WritePrecision.NS) \
+            .field('request_id', trace.request_id) \
+            .tag('client', trace.client) \
+            .tag('service', trace.service) \
+            .tag('server', trace.server) \
+            .tag('exp_id', trace.exp_id) \
+            .field('created', float(trace.created)) \
+            .field('sent', float(trace.sent)) \
+            .field('done', float(trace.done)) \
+            .field('status', int(trace.status)) \
+            .field('response', trace.response) \
+            .field('headers', trace.headers)
+        points.append(p)
+    return '\n'.join(p.to_line_protocol() for p in points).encode('utf-8')
+
+
+def measure(fn, records) -> float:
+    then = time.perf_counter()
+    fn(records)
+    return len(records) / (time.perf_counter() - then)
+
+
+def main():
+    now = time.time()
+    telemetry = [Telemetry(now + i / 1000, 'cpu', 'node-%d' % (i % 10), i / 3, 'exp') for i in range(RECORDS)]
+    traces = [
+        RequestTrace('req-%d' % i, 'client', 'service', now + i, now + i + 0.1, now + i + 0.2, 200, 'server', 'exp')
+        for i in range(RECORDS)
+    ]
+
+    assert telemetry_points(telemetry) == lineprotocol.serialize(telemetry, lineprotocol.telemetry_line)
+    assert trace_points(traces) == lineprotocol.serialize(traces, lineprotocol.trace_line)
+
+    print('| records | Point records/s | lineprotocol records/s |')
+    print('| telemetry | %8.0f | %8.0f |' % (
+        measure(telemetry_points, telemetry),
+        measure(lambda r: lineprotocol.serialize(r, lineprotocol.telemetry_line), telemetry)
+    ))
+    print('| traces | %8.0f | %8.0f |' % (
+        measure(trace_points, traces),
+        measure(lambda r: lineprotocol.serialize(r, lineprotocol.trace_line), traces)
+    ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmarks reading telemetry from InfluxDB by mapping FluxRecords from query_stream (the previous read path) against
+streaming plain CSV rows (iter_telemetry) and filling NumPy columns from them (get_telemetry_columns). By default, the
+queries go to a local stub server that answers every query with the same pivoted telemetry, set
+galileo_expdb_influxdb_url (and the other influxdb variables) and BENCHMARK_EXP_ID to benchmark a real server instead.
+
+Run with: python -m benchmarks.influx_query
+"""
+import datetime
+import http.server
+import json
+import os
+import threading
+import time
+
+from galileodb.factory import create_influxdb_from_env
+from galileodb.model import Telemetry
+
+ROWS = 100000
+COLUMNS = ['result', 'table', '_time', 'exp_id', 'metric', 'node', 'subsystem', 'value']
+
+
+def _response(annotated: bool) -> bytes:
+    lines = list()
+    if annotated:
+        lines.append('#datatype,string,long,dateTime:RFC3339Nano,string,string,string,string,double')
+        lines.append('#group,false,false,false,true,true,true,true,false')
+        lines.append('#default,_result,,,,,,,')
+    lines.append(',' + ','.join(COLUMNS))
+
+    start = datetime.datetime(2021, 6, 1, tzinfo=datetime.timezone.utc)
+    for i in range(ROWS):
+        t = (start + datetime.timedelta(milliseconds=i)).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        lines.append(f',_result,{i % 10},{t},exp,cpu,node-{i % 10},,{i / 3}')
+
+    return ('\r\n'.join(lines) + '\r\n').encode('utf-8')
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    responses = {True: _response(True), False: _response(False)}
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        data = self.responses[bool(body.get('dialect', {}).get('annotations'))]
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/csv')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def flux_records(db, exp_id):
+    # the read path before rows were streamed as CSV
+    query = db._flux_query('telemetry', exp_id)
+    for record in db.query.query_stream(query):
+        yield Telemetry(
+            timestamp=record.get_time().timestamp(),
+            metric=record.values['metric'],
+            node=record.values['node'],
+            value=record.values['value'],
+            exp_id=record.values['exp_id'],
+            subsystem=record.values.get('subsystem')
+        )
+
+
+def measure(fn) -> float:
+    then = time.perf_counter()
+    n = fn()
+    return n / (time.perf_counter() - then)
+
+
+def main():
+    env = dict(os.environ)
+    server = None
+    if 'galileo_expdb_influxdb_url' not in env:
+        server = http.server.ThreadingHTTPServer(('localhost', 0), StubHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        env['galileo_expdb_influxdb_url'] = 'http://localhost:%d' % server.server_address[1]
+    exp_id = env.get('BENCHMARK_EXP_ID', 'exp')
+
+    db = create_influxdb_from_env(env)
+    db.open()
+    try:
+        print('| read path | rows/s |')
+        print('| FluxRecord | %8.0f |' % measure(lambda: sum(1 for _ in flux_records(db, exp_id))))
+        print('| iter_telemetry (CSV) | %8.0f |' % measure(lambda: sum(1 for _ in db.iter_telemetry(exp_id))))
+        print('| get_telemetry_columns (CSV) | %8.0f |' % measure(lambda: len(db.get_telemetry_columns(exp_id))))
+    finally:
+        db.close()
+        if server is not None:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
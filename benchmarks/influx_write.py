@@ -0,0 +1,73 @@
+"""
+Benchmarks writing telemetry to InfluxDB in recorder-sized batches (36 points per save_telemetry call) with
+synchronous and batching writes. By default, the writes go to a local stub server that accepts every write after a
+simulated round trip of a few milliseconds, set galileo_expdb_influxdb_url (and the other influxdb variables) to
+benchmark a real server instead.
+
+Run with: python -m benchmarks.influx_write
+"""
+import http.server
+import os
+import threading
+import time
+
+from galileodb.factory import create_influxdb_from_env
+from galileodb.model import Telemetry
+
+CALLS = 200
+POINTS_PER_CALL = 36
+ROUND_TRIP = 0.005
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    points = 0
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        StubHandler.points += len(body.splitlines())
+        time.sleep(ROUND_TRIP)
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def run(env: dict):
+    db = create_influxdb_from_env(env)
+    db.open()
+
+    then = time.perf_counter()
+    for i in range(CALLS):
+        db.save_telemetry([Telemetry(i + j / POINTS_PER_CALL, 'cpu', 'node', j, 'exp') for j in range(POINTS_PER_CALL)])
+    recorded = time.perf_counter() - then
+    db.close()
+    written = time.perf_counter() - then
+
+    return CALLS * POINTS_PER_CALL / recorded, CALLS * POINTS_PER_CALL / written
+
+
+def main():
+    env = dict(os.environ)
+    server = None
+    if 'galileo_expdb_influxdb_url' not in env:
+        server = http.server.ThreadingHTTPServer(('localhost', 0), StubHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        env['galileo_expdb_influxdb_url'] = 'http://localhost:%d' % server.server_address[1]
+
+    try:
+        print('| mode | points/s (save calls) | points/s (until closed) |')
+        print('| synchronous | %8.0f | %8.0f |' % run(env))
+        print('| batching | %8.0f | %8.0f |' % run({
+            **env,
+            'galileo_expdb_influxdb_write_mode': 'batching',
+            'galileo_expdb_influxdb_batch_size': '5000',
+            'galileo_expdb_influxdb_flush_interval': '100',
+        }))
+    finally:
+        if server is not None:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Benchmarks trace ingestion into SQLite with and without idempotent traces (a unique index on EXP_ID and REQUEST_ID
+and INSERT OR IGNORE), for fresh traces and for batches that are re-submitted (e.g., when a spool is replayed after
+a write that actually succeeded).
+
+Run with: python -m benchmarks.sql_idempotent
+"""
+import os
+import tempfile
+import time
+
+from galileodb.model import RequestTrace
+from galileodb.sql.adapter import ExperimentSQLDatabase
+from galileodb.sql.driver.sqlite import SqliteAdapter
+
+BATCHES = 200
+BATCH_SIZE = 500
+
+
+def batches():
+    for b in range(BATCHES):
+        yield [
+            RequestTrace('req-%d-%d' % (b, i), 'client', 'service', i, i + 0.1, i + 0.2, 200, 'server', 'exp')
+            for i in range(BATCH_SIZE)
+        ]
+
+
+def run(idempotent: bool, resubmit: bool = False):
+    db_file = tempfile.mktemp('.sqlite', 'galileo_bench_', dir=os.getcwd())
+    db = ExperimentSQLDatabase(SqliteAdapter(db_file, profile='performance'), idempotent_traces=idempotent)
+    try:
+        db.open()
+        data = list(batches())
+
+        if resubmit:
+            for batch in data:
+                db.save_traces(batch)
+
+        then = time.perf_counter()
+        for batch in data:
+            db.save_traces(batch)
+        duration = time.perf_counter() - then
+
+        count = db.db.fetchone('SELECT COUNT(*) FROM traces')[0]
+        return BATCHES * BATCH_SIZE / duration, count
+    finally:
+        db.close()
+        for suffix in ['', '-wal', '-shm']:
+            if os.path.exists(db_file + suffix):
+                os.remove(db_file + suffix)
+
+
+def main():
+    print('| mode | traces/s | rows |')
+    print('| plain | %8.0f | %d |' % run(False))
+    print('| idempotent | %8.0f | %d |' % run(True))
+    print('| plain, re-submitted | %8.0f | %d |' % run(False, resubmit=True))
+    print('| idempotent, re-submitted | %8.0f | %d |' % run(True, resubmit=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmarks experiment scoped queries on SQLite with and without the indexes added by the schema migrations. Without
+indexes, query time grows with the total number of experiments stored, with indexes it stays roughly constant.
+
+Run with: python -m benchmarks.sql_indexes
+"""
+import os
+import random
+import tempfile
+import time
+
+from galileodb.model import Telemetry, RequestTrace, Experiment
+from galileodb.sql.adapter import ExperimentSQLDatabase
+from galileodb.sql.driver.sqlite import SqliteAdapter
+from galileodb.sql.migrations import migrate
+
+ROWS_PER_EXPERIMENT = 2000
+QUERIES = 20
+
+
+def populate(db: ExperimentSQLDatabase, experiments: int):
+    for i in range(experiments):
+        exp_id = 'exp-%d' % i
+        db.save_experiment(Experiment(exp_id, exp_id, 'benchmark', i, i + 1, i, 'FINISHED'))
+        db.save_telemetry([
+            Telemetry(i + j / ROWS_PER_EXPERIMENT, 'cpu', 'node-%d' % (j % 10), j, exp_id)
+            for j in range(ROWS_PER_EXPERIMENT)
+        ])
+        db.save_traces([
+            RequestTrace('%d-%d' % (i, j), 'client', 'service', i + j / 100, i + j / 100, i + j / 100, 200,
+                         exp_id=exp_id)
+            for j in range(100)
+        ])
+
+
+def run(experiments: int, indexed: bool) -> float:
+    db_file = tempfile.mktemp('.sqlite', 'galileo_bench_')
+    db = ExperimentSQLDatabase(SqliteAdapter(db_file))
+    try:
+        db.db.open()
+        db.db.executescript(db.read_schema_file())
+        migrate(db.db, target=None if indexed else 0)
+
+        populate(db, experiments)
+
+        then = time.perf_counter()
+        for _ in range(QUERIES):
+            exp_id = 'exp-%d' % random.randrange(experiments)
+            db.get_telemetry(exp_id)
+            db.get_traces(exp_id)
+            db.get_running_experiment()
+        return (time.perf_counter() - then) / QUERIES
+    finally:
+        db.close()
+        os.remove(db_file)
+
+
+def main():
+    print('| experiments | no indexes (ms/query) | indexes (ms/query) |')
+    for experiments in [10, 50, 200]:
+        plain = run(experiments, indexed=False)
+        indexed = run(experiments, indexed=True)
+        print('| %11d | %21.2f | %18.2f |' % (experiments, plain * 1000, indexed * 1000))
+
+
+if __name__ == '__main__':
+    main()
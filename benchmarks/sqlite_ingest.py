@@ -0,0 +1,72 @@
+"""
+Benchmarks small concurrent writes to SQLite, as issued by the recorder threads, while another thread keeps reading
+(like galileodb-ctl does). Compares the default setup (rollback journal, a commit per statement), group commit, and
+the performance profile (WAL, tuned PRAGMAs and a dedicated writer thread).
+
+Run with: python -m benchmarks.sqlite_ingest
+"""
+import os
+import tempfile
+import threading
+import time
+
+from galileodb.model import Telemetry
+from galileodb.sql.adapter import ExperimentSQLDatabase
+from galileodb.sql.driver.sqlite import SqliteAdapter
+
+THREADS = 16
+WRITES_PER_THREAD = 100
+
+
+def run(profile: str = 'default', group_commit_delay: float = None):
+    db_file = tempfile.mktemp('.sqlite', 'galileo_bench_', dir=os.getcwd())
+    adapter = SqliteAdapter(db_file, profile=profile, timeout=60)
+    db = ExperimentSQLDatabase(adapter)
+    try:
+        db.open()
+        if group_commit_delay is not None:
+            adapter.enable_group_commit(group_commit_delay)
+
+        done = threading.Event()
+        reads = [0]
+
+        def write(thread):
+            for i in range(WRITES_PER_THREAD):
+                db.save_telemetry([Telemetry(i, 'cpu', 'node-%d' % thread, i, 'exp')])
+
+        def read():
+            while not done.is_set():
+                db.get_telemetry('exp', node='node-0')
+                reads[0] += 1
+
+        threads = [threading.Thread(target=write, args=(n,)) for n in range(THREADS)]
+        reader = threading.Thread(target=read)
+
+        then = time.perf_counter()
+        reader.start()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        duration = time.perf_counter() - then
+        done.set()
+        reader.join()
+
+        assert len(db.get_telemetry('exp')) == THREADS * WRITES_PER_THREAD
+        return THREADS * WRITES_PER_THREAD / duration, reads[0] / duration
+    finally:
+        db.close()
+        for suffix in ['', '-wal', '-shm']:
+            if os.path.exists(db_file + suffix):
+                os.remove(db_file + suffix)
+
+
+def main():
+    print('| mode | writes/s | reads/s |')
+    print('| default | %8.0f | %7.0f |' % run())
+    print('| default, group commit | %8.0f | %7.0f |' % run(group_commit_delay=0))
+    print('| performance | %8.0f | %7.0f |' % run('performance'))
+
+
+if __name__ == '__main__':
+    main()
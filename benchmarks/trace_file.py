@@ -0,0 +1,70 @@
+"""
+Benchmarks writing traces into files on client hosts: reopening the file and creating a csv writer for every batch
+(the previous FileTraceWriter) against the FileTraceWriter that keeps the file open, uncompressed and gzip compressed.
+Batches have the size of the TraceLogger's default flush interval. Measures the traces per second and the resulting
+bytes per trace on disk.
+
+Run with: python -m benchmarks.trace_file
+"""
+import csv
+import os
+import shutil
+import tempfile
+import time
+
+from galileodb.model import RequestTrace
+from galileodb.trace import FileTraceWriter
+
+TRACES = 200000
+BATCH_SIZE = 20
+
+headers = '{"server": ["Server", "BaseHTTP/0.6 Python/3.9.5"], "content-type": ["Content-type", "text/html"]}'
+traces = [
+    RequestTrace('req-%d' % i, 'client', 'service', i, i + 0.1, i + 0.2, 200, 'server', 'exp', headers, 'hello')
+    for i in range(TRACES)
+]
+batches = [traces[i:i + BATCH_SIZE] for i in range(0, TRACES, BATCH_SIZE)]
+
+
+def reopening_write(path: str, batch):
+    # the write of the previous FileTraceWriter
+    with open(path, 'a') as fd:
+        writer = csv.writer(fd)
+        for row in batch:
+            writer.writerow(row)
+
+
+def measure(write, close, target_dir: str):
+    then = time.perf_counter()
+    for batch in batches:
+        write(batch)
+    close()
+    duration = time.perf_counter() - then
+
+    size = sum(os.path.getsize(os.path.join(target_dir, name)) for name in os.listdir(target_dir))
+    return TRACES / duration, size / TRACES
+
+
+def main():
+    print('| writer | traces/s | bytes/trace |')
+
+    target_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(target_dir, 'traces.csv')
+        print('| reopen per batch | %8.0f | %5.1f |' % measure(
+            lambda batch: reopening_write(path, batch), lambda: None, target_dir))
+    finally:
+        shutil.rmtree(target_dir)
+
+    for compression in [None, 'gzip']:
+        target_dir = tempfile.mkdtemp()
+        try:
+            writer = FileTraceWriter('bench', target_dir, compression=compression)
+            print('| FileTraceWriter, %s | %8.0f | %5.1f |' % (
+                compression or 'uncompressed', *measure(writer.write, writer.close, target_dir)))
+        finally:
+            shutil.rmtree(target_dir)
+
+
+if __name__ == '__main__':
+    main()
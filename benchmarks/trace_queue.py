@@ -0,0 +1,81 @@
+"""
+Benchmarks the transport of traces from a producer process to the TraceLogger process: one trace per message on a
+multiprocessing queue (the previous transport), batches as lists or packed chunks via a TraceBatcher, and packed
+chunks through the shared-memory RingBufferQueue. Measures the traces per second that arrive at the TraceLogger's
+writer.
+
+Run with: python -m benchmarks.trace_queue
+"""
+import multiprocessing
+import time
+
+from galileodb.flush import FlushPolicy
+from galileodb.model import RequestTrace
+from galileodb.trace import TraceLogger, TraceWriter, POISON
+from galileodb.tracequeue import TraceBatcher, RingBufferQueue
+
+TRACES = 100000
+BATCH_SIZE = 256
+
+
+class CountingWriter(TraceWriter):
+
+    def __init__(self, done, expected) -> None:
+        super().__init__()
+        self.done = done
+        self.expected = expected
+        self.count = 0
+
+    def write(self, traces):
+        self.count += len(traces)
+        if self.count >= self.expected:
+            self.done.set()
+
+
+def produce(queue, batch_size, packed):
+    traces = (RequestTrace('req-%d' % i, 'client', 'service', i, i + 0.1, i + 0.2, 200, 'server') for i in
+              range(TRACES))
+
+    if batch_size is None:
+        for trace in traces:
+            queue.put(trace)
+    else:
+        batcher = TraceBatcher(queue, batch_size, max_age=1, packed=packed)
+        batcher.put_many(traces)
+        batcher.close()
+
+
+def run(queue, batch_size=None, packed=False) -> float:
+    done = multiprocessing.Event()
+    policy = FlushPolicy(max_size=1000, max_age=0.05)
+    trace_logger = TraceLogger(queue, CountingWriter(done, TRACES), flush_policy=policy)
+    trace_logger.start()
+
+    then = time.perf_counter()
+    producer = multiprocessing.Process(target=produce, args=(queue, batch_size, packed))
+    producer.start()
+    done.wait()
+    duration = time.perf_counter() - then
+
+    producer.join()
+    queue.put(POISON)
+    trace_logger.join()
+    return TRACES / duration
+
+
+def main():
+    print('| transport | traces/s |')
+    print('| queue, one trace per message | %8.0f |' % run(multiprocessing.Queue()))
+    print('| queue, lists of %d traces | %8.0f |' % (BATCH_SIZE, run(multiprocessing.Queue(), BATCH_SIZE)))
+    print('| queue, packed chunks of %d traces | %8.0f |' % (
+        BATCH_SIZE, run(multiprocessing.Queue(), BATCH_SIZE, packed=True)))
+
+    ring = RingBufferQueue()
+    try:
+        print('| ring buffer, packed chunks of %d traces | %8.0f |' % (BATCH_SIZE, run(ring, BATCH_SIZE, packed=True)))
+    finally:
+        ring.unlink()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmarks the Redis transport of traces. First, encoding and decoding alone: the CSV lines of RedisTraceReporter
+(formatted with the line format and parsed by TracesSubscriber.parse), binary messages of one trace (encode_trace and
+decode_trace), and binary messages of many traces (encode_traces and decode_traces). Then, the traces per second that
+a TracesSubscriber receives from a RedisTraceReporter through a local Redis server (redislite), for each protocol.
+
+Run with: python -m benchmarks.trace_wire
+"""
+import os
+import tempfile
+import threading
+import time
+
+from galileodb.model import RequestTrace
+from galileodb.recorder.traces import TracesSubscriber
+from galileodb.reporter.traces import RedisTraceReporter, encode_trace, decode_trace, encode_traces, decode_traces
+
+TRACES = 100000
+BATCH_SIZE = 256
+REDIS_TRACES = 20000
+
+headers = '{"server": ["Server", "BaseHTTP/0.6 Python/3.9.5"], "content-type": ["Content-type", "text/html"]}'
+traces = [
+    RequestTrace('req-%d' % i, 'client', 'service', i, i + 0.1, i + 0.2, 200, 'server', 'exp', headers, 'hello\n')
+    for i in range(TRACES)
+]
+
+
+def csv_line(t: RequestTrace) -> str:
+    # the formatting of RedisTraceReporter._report_csv, without the publishing
+    return RedisTraceReporter.line_format % (
+        t.request_id, t.client, t.service, t.created, t.sent, t.done, t.status, t.server, t.exp_id,
+        t.headers.replace(',', '|'), t.response.replace('\n', '\\n')
+    )
+
+
+def measure(fn, items, n=None) -> float:
+    then = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (n or len(items)) / (time.perf_counter() - then)
+
+
+def through_redis(rds, protocol: str) -> float:
+    received = threading.Event()
+    subscriber = TracesSubscriber(rds, announce=False)
+
+    def consume():
+        n = 0
+        for batch in subscriber.run_batches():
+            n += len(batch)
+            if n >= REDIS_TRACES:
+                received.set()
+
+    thread = threading.Thread(target=consume)
+    thread.start()
+    while not rds.pubsub_numsub(RedisTraceReporter.channel)[0][1]:
+        time.sleep(0.01)
+
+    reporter = RedisTraceReporter(rds, protocol=protocol)
+    then = time.perf_counter()
+    for i in range(0, REDIS_TRACES, BATCH_SIZE):
+        reporter.report_multiple(traces[i:min(i + BATCH_SIZE, REDIS_TRACES)])
+    received.wait()
+    duration = time.perf_counter() - then
+
+    subscriber.close()
+    thread.join()
+    return REDIS_TRACES / duration
+
+
+def main():
+    lines = [csv_line(t) for t in traces]
+    messages = [encode_trace(t) for t in traces]
+    batches = [traces[i:i + BATCH_SIZE] for i in range(0, TRACES, BATCH_SIZE)]
+    batch_messages = [encode_traces(batch) for batch in batches]
+
+    print('| protocol | encode traces/s | decode traces/s | bytes/trace |')
+    print('| csv | %8.0f | %8.0f | %5.1f |' % (
+        measure(csv_line, traces), measure(TracesSubscriber.parse, lines),
+        sum(len(line.encode('utf-8')) for line in lines) / TRACES))
+    print('| binary | %8.0f | %8.0f | %5.1f |' % (
+        measure(encode_trace, traces), measure(decode_trace, messages),
+        sum(len(message) for message in messages) / TRACES))
+    print('| batch of %d | %8.0f | %8.0f | %5.1f |' % (
+        BATCH_SIZE, measure(encode_traces, batches, TRACES), measure(decode_traces, batch_messages, TRACES),
+        sum(len(message) for message in batch_messages) / TRACES))
+
+    try:
+        import redislite
+    except ImportError:
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        rds = redislite.Redis(os.path.join(tmp_dir, 'redis.db'), decode_responses=True)
+        try:
+            print()
+            print('| protocol | traces/s through Redis |')
+            for protocol in ['csv', 'binary', 'batch']:
+                print('| %s | %8.0f |' % (protocol, through_redis(rds, protocol)))
+        finally:
+            rds.shutdown()
+
+
+if __name__ == '__main__':
+    main()
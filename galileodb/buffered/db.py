@@ -0,0 +1,499 @@
+import collections
+import functools
+import logging
+import os
+import pickle
+import threading
+import time
+from typing import List, Dict, Iterator, Callable, Optional
+
+from galileodb.db import ExperimentDatabase
+from galileodb.model import Experiment, Telemetry, RequestTrace, NodeInfo, ExperimentEvent, ResampledTelemetry
+from galileodb.spool import Spool
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ('block', 'drop-oldest', 'spill')
+
+
+class SpillFile:
+    """
+    A file that batches which do not fit into memory are appended to, and from which they are read back once the
+    in-memory queue has been drained. Batches left over from a previous process are picked up as well. Items are read
+    back in chunks, the rest stays on disk, and the file is removed once all of it was read. A batch that was cut off
+    by a crash is cut off the file. The file can be appended to and read from by different threads.
+    """
+
+    def __init__(self, path: str) -> None:
+        super().__init__()
+        self.path = path
+        self._offset = 0  # the position in the file up to which batches were read
+        self._rest = list()  # the items of a batch that was read only in part
+        self._lock = threading.Lock()  # a batch that is being appended must not be read as an incomplete one
+
+    def __bool__(self):
+        with self._lock:
+            return bool(self._rest) or os.path.exists(self.path)
+
+    def append(self, items: List):
+        with self._lock:
+            with open(self.path, 'ab') as fd:
+                pickle.dump(items, fd)
+
+    def _batches(self, fd) -> Iterator[List]:
+        # yields the batches from the current position of fd, which is at the end of each yielded batch
+        size = os.fstat(fd.fileno()).st_size
+        while True:
+            position = fd.tell()
+            if position >= size:
+                return
+            try:
+                batch = pickle.load(fd)
+            except Exception as e:
+                # later appends must not end up behind the incomplete batch
+                logger.warning('skipping incomplete batch at the end of %s: %s', self.path, e)
+                os.truncate(self.path, position)
+                fd.seek(position)
+                return
+            yield batch
+
+    def count(self) -> int:
+        """
+        Returns the number of items that have not been taken yet.
+        """
+        with self._lock:
+            n = len(self._rest)
+            if os.path.exists(self.path):
+                with open(self.path, 'rb') as fd:
+                    fd.seek(self._offset)
+                    for batch in self._batches(fd):
+                        n += len(batch)
+            return n
+
+    def take(self, max_items: int = None) -> List:
+        """
+        Takes the next items from the file.
+
+        :param max_items: the maximum number of items to take (all if not set)
+        :return: the items in the order they were appended
+        """
+        with self._lock:
+            return self._take(max_items)
+
+    def _take(self, max_items: Optional[int]) -> List:
+        items = self._rest
+        self._rest = list()
+
+        if (max_items is None or len(items) < max_items) and os.path.exists(self.path):
+            with open(self.path, 'rb') as fd:
+                fd.seek(self._offset)
+                for batch in self._batches(fd):
+                    items.extend(batch)
+                    if max_items is not None and len(items) >= max_items:
+                        break
+                self._offset = fd.tell()
+                drained = self._offset >= os.fstat(fd.fileno()).st_size
+
+            if drained:
+                os.remove(self.path)
+                self._offset = 0
+
+        if max_items is not None and len(items) > max_items:
+            self._rest = items[max_items:]
+            del items[max_items:]
+
+        return items
+
+
+class WriteBehindQueue:
+    """
+    A bounded queue that accepts items immediately and writes them in batches on a background thread. A batch is
+    written once `batch_size` items are buffered, or once the oldest buffered item is `max_age` seconds old. When the
+    queue holds `max_size` items, the policy decides what happens to new items:
+
+    * block: put blocks until the worker has made room
+    * drop-oldest: the oldest buffered items are discarded
+    * spill: new items are appended to the spill file until the worker has drained the queue
+
+    Batches that fail to be written are passed to `fallback` (e.g., to append them to a Spool), or dropped.
+    """
+
+    def __init__(self, name: str, write: Callable[[List], None], max_size: int = 10000, batch_size: int = 1000,
+                 max_age: float = 1.0, policy: str = 'block', spill: SpillFile = None,
+                 fallback: Callable[[List], None] = None) -> None:
+        super().__init__()
+        if policy not in POLICIES:
+            raise ValueError('unknown queue policy %s' % policy)
+        if policy == 'spill' and spill is None:
+            raise ValueError('spill policy requires a spill file')
+
+        self.name = name
+        self.write = write
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.policy = policy
+        self.spill = spill
+        self.fallback = fallback
+
+        self.dropped = 0
+        self.failed = 0
+
+        self._items = collections.deque()
+        self._oldest: Optional[float] = None
+        self._accepted = 0
+        self._done = 0
+        self._spilled = 0  # the items that are (being) appended to the spill file and have not been taken yet
+        self._spilling = 0  # the number of puts that are appending to the spill file
+        self._flushing = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self.run, name='write-behind-%s' % name, daemon=True)
+
+    def __len__(self):
+        return len(self._items)
+
+    def start(self):
+        if self.spill:
+            # items spilled by a previous process, the worker reads them from the spill file before new items
+            leftover = self.spill.count()
+            logger.info('recovered %d spilled items of %s queue', leftover, self.name)
+            self._accepted += leftover
+            self._spilled += leftover
+        self._thread.start()
+
+    def put(self, items: List):
+        if not items:
+            return
+
+        with self._cond:
+            if self._closed:
+                raise ValueError('queue %s is closed' % self.name)
+
+            self._accepted += len(items)
+            overflow = len(self._items) + len(items) - self.max_size
+
+            spill = self.policy == 'spill' and (overflow > 0 or self._spilled > 0)
+            if spill:
+                # once items have been spilled, later items are spilled as well to keep the order
+                self._spilled += len(items)
+                self._spilling += 1
+            elif overflow > 0 and self.policy == 'block':
+                self._cond.wait_for(lambda: not self._items or len(self._items) + len(items) <= self.max_size)
+                if self._closed:
+                    # the worker has stopped while we waited
+                    self._accepted -= len(items)
+                    raise ValueError('queue %s is closed' % self.name)
+
+            elif overflow > 0 and self.policy == 'drop-oldest':
+                dropped = min(overflow, len(self._items))
+                for _ in range(dropped):
+                    self._items.popleft()
+                if overflow > dropped:
+                    items = items[overflow - dropped:]
+                self.dropped += overflow
+                self._done += overflow
+                logger.warning('%s queue is full, dropped %d items', self.name, overflow)
+
+            if not spill:
+                if self._oldest is None:
+                    self._oldest = time.monotonic()
+                self._items.extend(items)
+                self._cond.notify_all()
+                return
+
+        # the file is written outside the condition, so that neither other producers nor the worker wait for the disk
+        try:
+            self.spill.append(list(items))
+        except BaseException:
+            with self._cond:
+                self._spilled -= len(items)
+                self._accepted -= len(items)
+            raise
+        finally:
+            with self._cond:
+                self._spilling -= 1
+                self._cond.notify_all()
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Waits until all items that were put before the call have been written.
+
+        :param timeout: the maximum time to wait in seconds
+        :return: False if the timeout expired, True otherwise
+        """
+        with self._cond:
+            target = self._accepted
+            self._flushing += 1
+            self._cond.notify_all()
+            try:
+                return self._cond.wait_for(lambda: self._done >= target, timeout)
+            finally:
+                self._flushing -= 1
+
+    def close(self, timeout: float = None):
+        """
+        Writes all remaining items and stops the worker thread.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def run(self):
+        try:
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    return
+
+                try:
+                    self.write(batch)
+                except Exception:
+                    logger.exception('error writing batch of %d items from %s queue', len(batch), self.name)
+                    self._fail(batch)
+                finally:
+                    with self._cond:
+                        self._done += len(batch)
+                        self._cond.notify_all()
+        except Exception:
+            logger.exception('write-behind worker of %s queue failed', self.name)
+        finally:
+            self._stop()
+
+    def _stop(self):
+        with self._cond:
+            self._closed = True
+            items = list(self._items)
+            self._items.clear()
+            self._oldest = None
+            self._cond.notify_all()
+
+        if items:
+            self._fail(items)
+
+        # nothing is written after the worker has stopped, so flush must not wait for it
+        with self._cond:
+            lost = self._accepted - self._done - len(items)
+            if lost:
+                # items that could not be read back from the spill file
+                logger.error('%s queue lost %d items', self.name, lost)
+                self.failed += lost
+            self._done = self._accepted
+            self._cond.notify_all()
+
+    def _fail(self, batch: List):
+        if self.fallback is not None:
+            try:
+                self.fallback(batch)
+                return
+            except Exception:
+                logger.exception('error passing failed batch of %s queue to fallback', self.name)
+        self.failed += len(batch)
+
+    def _next_batch(self) -> Optional[List]:
+        with self._cond:
+            while True:
+                if not self._items and self._spilled > 0:
+                    # at most one queue worth of items, the rest stays on disk. puts keep spilling while the file is
+                    # read, as _spilled stays positive until the items are queued
+                    self._cond.release()
+                    try:
+                        items = self.spill.take(self.max_size)
+                    finally:
+                        self._cond.acquire()
+
+                    if items:
+                        self._items.extend(items)
+                        self._oldest = time.monotonic()
+                        self._spilled -= len(items)
+                    elif not self._spilling:
+                        # the rest of the file could not be read back, _stop accounts for the lost items
+                        self._spilled = 0
+
+                if self._items:
+                    age = time.monotonic() - self._oldest
+                    if len(self._items) >= self.batch_size or age >= self.max_age or self._flushing or self._closed:
+                        return self._pop_batch()
+                    self._cond.wait(self.max_age - age)
+                elif self._closed and not self._spilled:
+                    return None
+                else:
+                    self._cond.wait()
+
+    def _pop_batch(self) -> List:
+        n = min(self.batch_size, len(self._items))
+        batch = [self._items.popleft() for _ in range(n)]
+        if not self._items:
+            self._oldest = None
+        # wake up producers waiting for room
+        self._cond.notify_all()
+        return batch
+
+
+class BufferedExperimentDatabase(ExperimentDatabase):
+    """
+    Wraps an ExperimentDatabase with write-behind queues for telemetry, traces and events. save_telemetry,
+    save_traces, save_event(s) return immediately, and the records are coalesced into large batches that are written
+    to the wrapped database by one background thread per queue. All other calls are passed through synchronously.
+
+    Reads are not synchronized with the queues, call flush() first to read your own writes. close() drains the
+    queues before closing the wrapped database. Batches that fail to be written are appended to the spool, if one is
+    given.
+    """
+
+    db: ExperimentDatabase
+
+    def __init__(self, db: ExperimentDatabase, max_size: int = 10000, batch_size: int = 1000, max_age: float = 1.0,
+                 policy: str = 'block', spill_dir: str = None, spool: Spool = None) -> None:
+        super().__init__()
+        if policy not in POLICIES:
+            raise ValueError('unknown queue policy %s' % policy)
+        if policy == 'spill' and not spill_dir:
+            raise ValueError('spill policy requires a spill directory')
+
+        self.db = db
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.policy = policy
+        self.spill_dir = spill_dir
+        self.spool = spool
+
+        self.telemetry: Optional[WriteBehindQueue] = None
+        self.traces: Optional[WriteBehindQueue] = None
+        self.events: Optional[WriteBehindQueue] = None
+
+    def _create_queue(self, name: str, write: Callable[[List], None]) -> WriteBehindQueue:
+        spill = None
+        if self.policy == 'spill':
+            spill = SpillFile(os.path.join(self.spill_dir, name + '.spill'))
+
+        fallback = functools.partial(self.spool.append, name) if self.spool else None
+
+        return WriteBehindQueue(name, write, self.max_size, self.batch_size, self.max_age, self.policy, spill,
+                                fallback)
+
+    @property
+    def queues(self) -> List[WriteBehindQueue]:
+        return [q for q in (self.telemetry, self.traces, self.events) if q is not None]
+
+    def open(self):
+        self.db.open()
+
+        if self.spill_dir and not os.path.exists(self.spill_dir):
+            os.makedirs(self.spill_dir)
+
+        self.telemetry = self._create_queue('telemetry', self.db.save_telemetry)
+        self.traces = self._create_queue('traces', self.db.save_traces)
+        self.events = self._create_queue('events', self.db.save_events)
+
+        for q in self.queues:
+            q.start()
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Waits until all records saved before the call have been written to the wrapped database.
+
+        :param timeout: the maximum time to wait per queue in seconds
+        :return: False if the timeout expired, True otherwise
+        """
+        return all([q.flush(timeout) for q in self.queues])
+
+    def close(self):
+        for q in self.queues:
+            q.close()
+        if self.spool:
+            self.spool.close()
+        self.db.close()
+
+    def transaction(self):
+        return self.db.transaction()
+
+    def save_experiment(self, experiment: Experiment):
+        self.db.save_experiment(experiment)
+
+    def update_experiment(self, experiment: Experiment):
+        self.db.update_experiment(experiment)
+
+    def delete_experiment(self, exp_id: str):
+        self.flush()
+        self.db.delete_experiment(exp_id)
+
+    def purge_experiment(self, exp_id: str, batch_size: int = None, progress=None):
+        self.flush()
+        self.db.purge_experiment(exp_id, batch_size, progress)
+
+    def get_experiment(self, exp_id: str) -> Experiment:
+        return self.db.get_experiment(exp_id)
+
+    def save_metadata(self, exp_id: str, data: Dict):
+        self.db.save_metadata(exp_id, data)
+
+    def get_metadata(self, exp_id: str) -> Dict:
+        return self.db.get_metadata(exp_id)
+
+    def save_traces(self, traces: List[RequestTrace]):
+        self.traces.put(traces)
+
+    def touch_traces(self, experiment: Experiment):
+        # traces still queued would otherwise miss the backfill
+        self.traces.flush()
+        self.db.touch_traces(experiment)
+
+    def get_traces(self, exp_id: str = None, service: str = None, client: str = None, status: int = None,
+                   start: float = None, end: float = None) -> List[RequestTrace]:
+        return self.db.get_traces(exp_id, service, client, status, start, end)
+
+    def iter_traces(self, exp_id: str = None, chunk_size: int = None, service: str = None, client: str = None,
+                    status: int = None, start: float = None, end: float = None) -> Iterator[RequestTrace]:
+        return self.db.iter_traces(exp_id, chunk_size, service, client, status, start, end)
+
+    def get_traces_columns(self, exp_id: str = None, chunk_size: int = None, service: str = None, client: str = None,
+                           status: int = None, start: float = None, end: float = None):
+        return self.db.get_traces_columns(exp_id, chunk_size, service, client, status, start, end)
+
+    def save_telemetry(self, telemetry: List[Telemetry]):
+        self.telemetry.put(telemetry)
+
+    def get_telemetry(self, exp_id=None, node: str = None, metric: str = None, subsystem: str = None,
+                      start: float = None, end: float = None) -> List[Telemetry]:
+        return self.db.get_telemetry(exp_id, node, metric, subsystem, start, end)
+
+    def iter_telemetry(self, exp_id: str = None, chunk_size: int = None, node: str = None, metric: str = None,
+                       subsystem: str = None, start: float = None, end: float = None) -> Iterator[Telemetry]:
+        return self.db.iter_telemetry(exp_id, chunk_size, node, metric, subsystem, start, end)
+
+    def get_telemetry_columns(self, exp_id: str = None, chunk_size: int = None, node: str = None, metric: str = None,
+                              subsystem: str = None, start: float = None, end: float = None):
+        return self.db.get_telemetry_columns(exp_id, chunk_size, node, metric, subsystem, start, end)
+
+    def get_telemetry_resampled(self, exp_id: str, interval: float, agg=('mean', 'min', 'max', 'count'),
+                                node: str = None, metric: str = None, subsystem: str = None, start: float = None,
+                                end: float = None) -> List[ResampledTelemetry]:
+        return self.db.get_telemetry_resampled(exp_id, interval, agg, node, metric, subsystem, start, end)
+
+    def save_event(self, event: ExperimentEvent):
+        self.events.put([event])
+
+    def save_events(self, events: List[ExperimentEvent]):
+        self.events.put(events)
+
+    def get_events(self, exp_id=None, name: str = None, start: float = None,
+                   end: float = None) -> List[ExperimentEvent]:
+        return self.db.get_events(exp_id, name, start, end)
+
+    def iter_events(self, exp_id: str = None, chunk_size: int = None, name: str = None, start: float = None,
+                    end: float = None) -> Iterator[ExperimentEvent]:
+        return self.db.iter_events(exp_id, chunk_size, name, start, end)
+
+    def save_nodeinfos(self, infos: List[NodeInfo]):
+        self.db.save_nodeinfos(infos)
+
+    def find_all(self) -> List[Experiment]:
+        return self.db.find_all()
+
+    def get_running_experiment(self) -> Experiment:
+        return self.db.get_running_experiment()
@@ -1,4 +1,5 @@
 import argparse
+import os
 from datetime import datetime
 from galileodb.factory import create_experiment_database_from_env
 
@@ -8,6 +9,18 @@ def delete_exp(args):
     exp_db = create_experiment_database_from_env()
     exp_db.open()
 
+    if args.purge:
+        if exp_db.get_experiment(args.exp_id) is None:
+            print(f'could not find experiment {args.exp_id}')
+            return
+
+        def progress(table, deleted):
+            print(f'  {table}: {deleted} rows deleted')
+
+        exp_db.purge_experiment(args.exp_id, batch_size=args.batch_size, progress=progress)
+        print(f'purged {args.exp_id}')
+        return
+
     try:
         exp_db.delete_experiment(args.exp_id)
         print(f'deleted {args.exp_id}')
@@ -65,20 +78,104 @@ def get_running_experiment_id(args):
         print()
 
 
+def _open_spool(args):
+    from galileodb.spool import Spool
+
+    if not args.spool_dir:
+        print('no spool directory given (--spool_dir or galileo_expdb_spool_dir)')
+        return None
+    return Spool(args.spool_dir)
+
+
+def list_spool(args):
+    spool = _open_spool(args)
+    if spool is None:
+        return
+
+    found = False
+    for stream in spool.streams():
+        for path in spool.segments(stream):
+            batches = list(spool.read_segment(path))
+            records = sum(len(batch) for batch in batches)
+            print(f'| {stream:10s} | {os.path.basename(path):40s} | {len(batches):7d} batches | {records:9d} records |')
+            found = True
+
+    if not found:
+        print('spool is empty')
+
+
+def replay_spool(args):
+    from galileodb.spool import database_writers
+
+    spool = _open_spool(args)
+    if spool is None:
+        return
+
+    exp_db = create_experiment_database_from_env()
+    exp_db.open()
+    try:
+        for stream, write in database_writers(exp_db).items():
+            replayed = spool.replay(stream, write)
+            print(f'replayed {replayed} {stream} records')
+    finally:
+        exp_db.close()
+
+
+def migrate_influx(args):
+    from galileodb.factory import create_influxdb_from_env
+
+    if not args.exp_id:
+        print('no experiment given (--exp_id)')
+        return
+
+    print(f'migrating bucket of {args.exp_id} to the v2 schema...')
+    exp_db = create_influxdb_from_env()
+    exp_db.open()
+
+    def progress(measurement, copied):
+        print(f'  {measurement}: {copied} points copied')
+
+    try:
+        exp_db.migrate_schema(args.exp_id, batch_size=args.batch_size, progress=progress)
+        print(f'migrated {args.exp_id}')
+    except ValueError as e:
+        print(e)
+    finally:
+        exp_db.close()
+
+
 def main():
     parser = argparse.ArgumentParser()
     sp = parser.add_subparsers()
     sp_delete = sp.add_parser('delete', help='delete the experiment')
+    sp_delete.add_argument('--purge', action='store_true',
+                           help='also delete the telemetry, traces and events of the experiment (resumable)')
+    sp_delete.add_argument('--batch_size', type=int, required=False, help='the number of rows deleted at a time')
     sp_show = sp.add_parser('show', help='show the experiment')
     sp_list = sp.add_parser('list', help='list all experiments')
     parser.add_argument('--exp_id', help='the id of the experiment', required=False)
 
     sp_running_exp = sp.add_parser('get_running_exp_id', help='get the id of the currently running experiment')
 
+    sp_spool = sp.add_parser('spool', help='inspect or replay records that failed to be written')
+    sp_spool.add_argument('--spool_dir', default=os.getenv('galileo_expdb_spool_dir'),
+                          help='the spool directory (defaults to galileo_expdb_spool_dir)')
+    sp_spool_commands = sp_spool.add_subparsers()
+    sp_spool_list = sp_spool_commands.add_parser('list', help='list the spooled segments')
+    sp_spool_replay = sp_spool_commands.add_parser('replay', help='write the spooled records into the database')
+
+    sp_influx_migrate = sp.add_parser('influx-migrate',
+                                      help='rewrite the InfluxDB bucket of the experiment in the v2 schema')
+    sp_influx_migrate.add_argument('--batch_size', type=int, default=5000,
+                                   help='the number of points written at a time')
+
     sp_delete.set_defaults(func=delete_exp)
     sp_show.set_defaults(func=show_exp)
     sp_list.set_defaults(func=list_exp)
     sp_running_exp.set_defaults(func=get_running_experiment_id)
+    sp_spool_list.set_defaults(func=list_spool)
+    sp_spool_replay.set_defaults(func=replay_spool)
+    sp_influx_migrate.set_defaults(func=migrate_influx)
 
     args = parser.parse_args()
     args.func(args)
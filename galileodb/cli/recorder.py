@@ -6,7 +6,7 @@ import time
 
 import redis
 
-from galileodb.factory import create_experiment_database_from_env
+from galileodb.factory import create_experiment_database_from_env, create_spool_from_env
 from galileodb.model import Experiment, generate_experiment_id
 from galileodb.recorder import Recorder
 
@@ -59,16 +59,14 @@ def run(args):
     exp_db = create_experiment_database_from_env()
     exp_db.open()
 
-    # create and save the experiment
+    # create and save the experiment together with its metadata
     exp = create_experiment(args)
-    exp_db.save_experiment(exp)
-
-    # save metadata
-    exp_id = exp.id
-    save_metadata(exp_id, args, exp_db)
+    with exp_db.transaction():
+        exp_db.save_experiment(exp)
+        save_metadata(exp.id, args, exp_db)
 
     # main control loop
-    recorder = Recorder(rds, exp_db, exp.id)
+    recorder = Recorder(rds, exp_db, exp.id, spool=create_spool_from_env())
     try:
         logger.info('starting experiment recorder for exp %s', exp.id)
         recorder.start()
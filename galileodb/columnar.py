@@ -0,0 +1,168 @@
+"""
+Columnar (NumPy) representation of query results. Rows are transposed chunk-wise into one array per field, so that
+analysis code does not pay for the creation of a NamedTuple per row. String fields with few distinct values (nodes,
+metrics, services, ...) are dictionary-encoded into integer codes plus a lookup table.
+
+NumPy is an optional dependency that is only required when columnar results are requested.
+"""
+from itertools import islice
+from typing import Dict, List, Tuple, Iterable, Sequence
+
+import numpy as np
+
+FLOAT = 'float'
+INT = 'int'
+CATEGORY = 'category'
+STRING = 'string'
+
+TELEMETRY_COLUMNS: Tuple[Tuple[str, str], ...] = (
+    ('timestamp', FLOAT),
+    ('metric', CATEGORY),
+    ('node', CATEGORY),
+    ('value', FLOAT),
+    ('exp_id', CATEGORY),
+    ('subsystem', CATEGORY),
+)
+
+TRACE_COLUMNS: Tuple[Tuple[str, str], ...] = (
+    ('request_id', STRING),
+    ('client', CATEGORY),
+    ('service', CATEGORY),
+    ('created', FLOAT),
+    ('sent', FLOAT),
+    ('done', FLOAT),
+    ('status', INT),
+    ('server', CATEGORY),
+    ('exp_id', CATEGORY),
+)
+
+
+class Columns:
+    """
+    A columnar query result. Indexing with a field name returns the array of that field. For dictionary-encoded
+    fields, the array contains integer codes that index into ``categories[field]`` (-1 encodes NULL).
+    """
+    arrays: Dict[str, np.ndarray]
+    categories: Dict[str, List[str]]
+
+    def __init__(self, arrays: Dict[str, np.ndarray], categories: Dict[str, List[str]]) -> None:
+        super().__init__()
+        self.arrays = arrays
+        self.categories = categories
+
+    def __getitem__(self, field: str) -> np.ndarray:
+        return self.arrays[field]
+
+    def __contains__(self, field: str) -> bool:
+        return field in self.arrays
+
+    def __len__(self):
+        for array in self.arrays.values():
+            return len(array)
+        return 0
+
+    def keys(self):
+        return self.arrays.keys()
+
+    def decode(self, field: str) -> np.ndarray:
+        """
+        Resolves the codes of a dictionary-encoded field into an object array of the original values.
+
+        :param field: the field name
+        :return: an object array with the values of the field (None where the value was NULL)
+        """
+        codes = self.arrays[field]
+        if field not in self.categories:
+            return codes
+
+        lookup = np.array(self.categories[field] + [None], dtype=object)
+        return lookup[codes]  # code -1 indexes the trailing None
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __str__(self) -> str:
+        return 'Columns(%d rows, %s)' % (len(self), list(self.arrays.keys()))
+
+
+class ColumnBuilder:
+    """
+    Builds a Columns object from chunks of row tuples (e.g., the result of a cursor's fetchmany). The values of each
+    row must be ordered like the given column specification.
+    """
+
+    def __init__(self, columns: Sequence[Tuple[str, str]]) -> None:
+        super().__init__()
+        self.columns = columns
+        self._chunks = {name: list() for name, _ in columns}
+        self._lookups = {name: dict() for name, kind in columns if kind == CATEGORY}
+
+    def append(self, rows: Sequence[Sequence]):
+        n = len(rows)
+        if n == 0:
+            return
+
+        for (name, kind), values in zip(self.columns, zip(*rows)):
+            if kind == FLOAT:
+                array = np.array(values, dtype=np.float64)
+            elif kind == INT:
+                array = self._to_int(values, n)
+            elif kind == CATEGORY:
+                array = self._encode(self._lookups[name], values, n)
+            else:
+                array = np.array(values, dtype=object)
+
+            self._chunks[name].append(array)
+
+    def extend(self, rows: Iterable[Sequence], chunk_size: int = None):
+        chunk_size = chunk_size or 1000
+        rows = iter(rows)
+
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            self.append(chunk)
+
+    def build(self) -> Columns:
+        arrays = dict()
+        for name, kind in self.columns:
+            chunks = self._chunks[name]
+            if chunks:
+                arrays[name] = np.concatenate(chunks)
+            else:
+                arrays[name] = np.empty(0, dtype=self._dtype(kind))
+
+        categories = {name: list(lookup.keys()) for name, lookup in self._lookups.items()}
+
+        return Columns(arrays, categories)
+
+    @staticmethod
+    def _to_int(values, n) -> np.ndarray:
+        try:
+            return np.array(values, dtype=np.int64)
+        except TypeError:
+            # NULL values are mapped to -1, the default status of a RequestTrace
+            return np.fromiter((-1 if v is None else v for v in values), dtype=np.int64, count=n)
+
+    @staticmethod
+    def _encode(lookup: Dict[str, int], values, n) -> np.ndarray:
+        def code(value):
+            if value is None:
+                return -1
+            c = lookup.get(value)
+            if c is None:
+                c = lookup[value] = len(lookup)
+            return c
+
+        return np.fromiter(map(code, values), dtype=np.int32, count=n)
+
+    @staticmethod
+    def _dtype(kind):
+        if kind == FLOAT:
+            return np.float64
+        if kind == INT:
+            return np.int64
+        if kind == CATEGORY:
+            return np.int32
+        return object
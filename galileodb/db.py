@@ -1,8 +1,36 @@
+import contextlib
+import threading
 import time
+import weakref
 from abc import ABC
-from typing import List, Dict
+from typing import List, Dict, Iterator, Callable
 
-from galileodb.model import Experiment, Telemetry, NodeInfo, ExperimentEvent, RequestTrace
+from galileodb.model import Experiment, Telemetry, NodeInfo, ExperimentEvent, RequestTrace, ResampledTelemetry
+
+_experiment_listeners: List[weakref.WeakMethod] = list()
+_experiment_listeners_lock = threading.Lock()
+
+
+def on_experiments_changed(callback: Callable[[], None]):
+    """
+    Registers a bound method that is called whenever an experiment is saved, updated or deleted in this process (e.g.,
+    to invalidate a cached running experiment). The method is referenced weakly, so it does not keep its object alive.
+    """
+    with _experiment_listeners_lock:
+        _experiment_listeners.append(weakref.WeakMethod(callback))
+
+
+def experiments_changed():
+    """
+    Notifies the callbacks registered with on_experiments_changed. Called by the backends that store experiments.
+    """
+    with _experiment_listeners_lock:
+        callbacks = [ref() for ref in _experiment_listeners]
+        _experiment_listeners[:] = [ref for ref, callback in zip(_experiment_listeners, callbacks) if callback]
+
+    for callback in callbacks:
+        if callback is not None:
+            callback()
 
 
 class ExperimentDatabase(ABC):
@@ -13,6 +41,14 @@ class ExperimentDatabase(ABC):
     def close(self):
         raise NotImplementedError
 
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Returns a context manager that groups the writes within the block into one transaction, if the backend
+        supports transactions. The default implementation does nothing.
+        """
+        yield self
+
     def save_experiment(self, experiment: Experiment):
         raise NotImplementedError
 
@@ -22,6 +58,16 @@ class ExperimentDatabase(ABC):
     def delete_experiment(self, exp_id: str):
         raise NotImplementedError
 
+    def purge_experiment(self, exp_id: str, batch_size: int = None, progress=None):
+        """
+        Deletes an experiment together with all its telemetry, traces, events and node infos.
+
+        :param exp_id: the experiment id
+        :param batch_size: the maximum number of rows deleted at a time (if the backend deletes rows)
+        :param progress: an optional callback (table, rows deleted so far) to report progress
+        """
+        raise NotImplementedError
+
     def get_experiment(self, exp_id: str) -> Experiment:
         raise NotImplementedError
 
@@ -42,13 +88,104 @@ class ExperimentDatabase(ABC):
     def touch_traces(self, experiment: Experiment):
         raise NotImplementedError
 
-    def get_traces(self, exp_id: str) -> List[RequestTrace]:
+    def get_traces(self, exp_id: str, service: str = None, client: str = None, status: int = None,
+                   start: float = None, end: float = None) -> List[RequestTrace]:
+        """
+        Returns the traces of an experiment. The optional filters are pushed down to the backend, filters that are
+        None are ignored.
+
+        :param exp_id: the experiment id
+        :param service: only return traces of the given service
+        :param client: only return traces of the given client
+        :param status: only return traces with the given status code
+        :param start: only return traces created at or after the given timestamp
+        :param end: only return traces created before the given timestamp
+        :return: a list of RequestTrace tuples
+        """
+        raise NotImplementedError
+
+    def iter_traces(self, exp_id: str = None, chunk_size: int = None, service: str = None, client: str = None,
+                    status: int = None, start: float = None, end: float = None) -> Iterator[RequestTrace]:
+        """
+        Streams RequestTrace tuples instead of materializing the whole result like get_traces does.
+        :param exp_id: the experiment id
+        :param chunk_size: the number of rows fetched from the backend at a time (if the backend supports it)
+        :return: an iterator over RequestTrace tuples
+        """
         raise NotImplementedError
 
+    def get_traces_columns(self, exp_id: str = None, chunk_size: int = None, service: str = None,
+                           client: str = None, status: int = None, start: float = None,
+                           end: float = None) -> 'Columns':
+        """
+        Returns the traces of an experiment (without headers and response) as NumPy arrays per field (requires
+        numpy). See get_telemetry_columns.
+        """
+        from galileodb.columnar import ColumnBuilder, TRACE_COLUMNS
+
+        traces = self.iter_traces(exp_id, chunk_size, service=service, client=client, status=status, start=start,
+                                  end=end)
+
+        builder = ColumnBuilder(TRACE_COLUMNS)
+        builder.extend(traces, chunk_size)
+        return builder.build()
+
     def save_telemetry(self, telemetry: List[Telemetry]):
         raise NotImplementedError
 
-    def get_telemetry(self, exp_id=None) -> List[Telemetry]:
+    def get_telemetry(self, exp_id=None, node: str = None, metric: str = None, subsystem: str = None,
+                      start: float = None, end: float = None) -> List[Telemetry]:
+        """
+        Returns the telemetry of an experiment. The optional filters are pushed down to the backend, filters that
+        are None are ignored.
+
+        :param exp_id: the experiment id
+        :param node: only return telemetry of the given node
+        :param metric: only return telemetry of the given metric
+        :param subsystem: only return telemetry of the given subsystem
+        :param start: only return telemetry recorded at or after the given timestamp
+        :param end: only return telemetry recorded before the given timestamp
+        :return: a list of Telemetry tuples
+        """
+        raise NotImplementedError
+
+    def iter_telemetry(self, exp_id: str = None, chunk_size: int = None, node: str = None, metric: str = None,
+                       subsystem: str = None, start: float = None, end: float = None) -> Iterator[Telemetry]:
+        raise NotImplementedError
+
+    def get_telemetry_columns(self, exp_id: str = None, chunk_size: int = None, node: str = None,
+                              metric: str = None, subsystem: str = None, start: float = None,
+                              end: float = None) -> 'Columns':
+        """
+        Returns the telemetry of an experiment as NumPy arrays per field (requires numpy). The default
+        implementation transposes the result of iter_telemetry, backends may fill the arrays directly from their
+        cursors.
+
+        :param exp_id: the experiment id
+        :param chunk_size: the number of rows transposed at a time
+        :return: a galileodb.columnar.Columns object
+        """
+        from galileodb.columnar import ColumnBuilder, TELEMETRY_COLUMNS
+
+        telemetry = self.iter_telemetry(exp_id, chunk_size, node=node, metric=metric, subsystem=subsystem,
+                                        start=start, end=end)
+
+        builder = ColumnBuilder(TELEMETRY_COLUMNS)
+        builder.extend(telemetry, chunk_size)
+        return builder.build()
+
+    def get_telemetry_resampled(self, exp_id: str, interval: float, agg=('mean', 'min', 'max', 'count'),
+                                node: str = None, metric: str = None, subsystem: str = None, start: float = None,
+                                end: float = None) -> List[ResampledTelemetry]:
+        """
+        Returns the telemetry of an experiment aggregated into time windows of the given interval per node, metric
+        and subsystem. The aggregation runs in the backend, so only the aggregated series are transferred.
+
+        :param exp_id: the experiment id
+        :param interval: the window size in seconds (windows are aligned to multiples of the interval since epoch)
+        :param agg: the aggregates to calculate (any of galileodb.model.TELEMETRY_AGGREGATES)
+        :return: a list of ResampledTelemetry tuples ordered by time, where aggregates not requested are None
+        """
         raise NotImplementedError
 
     def save_event(self, event: ExperimentEvent):
@@ -57,7 +194,12 @@ class ExperimentDatabase(ABC):
     def save_events(self, events: List[ExperimentEvent]):
         raise NotImplementedError
 
-    def get_events(self, exp_id) -> List[ExperimentEvent]:
+    def get_events(self, exp_id, name: str = None, start: float = None,
+                   end: float = None) -> List[ExperimentEvent]:
+        raise NotImplementedError
+
+    def iter_events(self, exp_id: str = None, chunk_size: int = None, name: str = None, start: float = None,
+                    end: float = None) -> Iterator[ExperimentEvent]:
         raise NotImplementedError
 
     def save_nodeinfos(self, infos: List[NodeInfo]):
@@ -70,6 +212,7 @@ class ExperimentDatabase(ABC):
         exp.status = status
         exp.end = time.time()
         self.update_experiment(exp)
+        experiments_changed()
         self.touch_traces(exp)
 
     def get_running_experiment(self) -> Experiment:
@@ -1,6 +1,6 @@
 import logging
 import os
-from typing import MutableMapping
+from typing import MutableMapping, Optional
 
 from galileodb.db import ExperimentDatabase
 from galileodb.mixed.db import MixedExperimentDatabase
@@ -11,7 +11,28 @@ logger = logging.getLogger(__name__)
 
 def create_experiment_database_from_env(env: MutableMapping = os.environ) -> ExperimentDatabase:
     driver = env.get('galileo_expdb_driver', 'sqlite')
-    return create_experiment_database(driver)
+    db = create_experiment_database(driver, env)
+
+    if env.get('galileo_expdb_buffer_policy'):
+        db = create_buffered_from_env(db, env)
+
+    return db
+
+
+def create_buffered_from_env(db: ExperimentDatabase, env: MutableMapping = os.environ) -> ExperimentDatabase:
+    from galileodb.buffered.db import BufferedExperimentDatabase
+
+    params = {
+        'policy': env.get('galileo_expdb_buffer_policy', 'block'),
+        'max_size': int(env.get('galileo_expdb_buffer_size', '10000')),
+        'batch_size': int(env.get('galileo_expdb_buffer_batch_size', '1000')),
+        'max_age': float(env.get('galileo_expdb_buffer_max_age', '1')),
+        'spill_dir': env.get('galileo_expdb_buffer_spill_dir', None),
+        'spool': create_spool_from_env(env),
+    }
+
+    logger.info('buffering writes with parameters %s', params)
+    return BufferedExperimentDatabase(db, **params)
 
 
 def create_experiment_database(driver: str, env: MutableMapping = os.environ) -> ExperimentDatabase:
@@ -24,6 +45,9 @@ def create_experiment_database(driver: str, env: MutableMapping = os.environ) ->
         return create_mixeddb_from_env(env)
 
     if driver == 'sqlite':
+        if env.get('galileo_expdb_sqlite_shard_dir'):
+            return create_sharded_sqlite_from_env(env)
+
         db_adapter = create_sqlite_from_env(env)
 
     elif driver == 'mysql':
@@ -32,7 +56,29 @@ def create_experiment_database(driver: str, env: MutableMapping = os.environ) ->
     else:
         raise ValueError('unknown database driver %s' % driver)
 
-    return ExperimentSQLDatabase(db_adapter)
+    configure_group_commit(db_adapter, env)
+    return ExperimentSQLDatabase(db_adapter, idempotent_traces=_idempotent_traces(env))
+
+
+def _idempotent_traces(env: MutableMapping) -> bool:
+    return env.get('galileo_expdb_idempotent_traces', 'false').lower() in ('1', 'true', 'yes')
+
+
+def configure_group_commit(db_adapter, env: MutableMapping = os.environ):
+    delay = env.get('galileo_expdb_group_commit_delay')
+    if delay:
+        delay = float(delay)
+        logger.info('enabling group commit with a delay of %.3fs', delay)
+        db_adapter.enable_group_commit(delay)
+
+
+def create_spool_from_env(env: MutableMapping = os.environ) -> Optional['Spool']:
+    spool_dir = env.get('galileo_expdb_spool_dir')
+    if not spool_dir:
+        return None
+
+    from galileodb.spool import Spool
+    return Spool(spool_dir, fsync=env.get('galileo_expdb_spool_fsync', 'false').lower() in ('1', 'true', 'yes'))
 
 
 def create_influxdb_from_env(env: MutableMapping = os.environ):
@@ -47,7 +93,36 @@ def create_influxdb_from_env(env: MutableMapping = os.environ):
         'org_id': env.get('galileo_expdb_influxdb_org_id', 'org-id')
     }
 
-    return InfluxExperimentDatabase(InfluxDBClient(**params), org_name=params['org'], org_id=params['org_id'])
+    return InfluxExperimentDatabase(InfluxDBClient(**params), org_name=params['org'], org_id=params['org_id'],
+                                    write_options=create_influxdb_write_options_from_env(env),
+                                    schema=env.get('galileo_expdb_influxdb_schema', 'v2'))
+
+
+def create_influxdb_write_options_from_env(env: MutableMapping = os.environ):
+    from influxdb_client import WriteOptions
+    from influxdb_client.client.write_api import WriteType
+
+    mode = env.get('galileo_expdb_influxdb_write_mode', 'synchronous')
+    try:
+        write_type = WriteType[mode]
+    except KeyError:
+        raise ValueError('unknown influxdb write mode %s' % mode)
+
+    # all intervals are in milliseconds, as in WriteOptions
+    params = {
+        'write_type': write_type,
+        'batch_size': int(env.get('galileo_expdb_influxdb_batch_size', '1000')),
+        'flush_interval': int(env.get('galileo_expdb_influxdb_flush_interval', '1000')),
+        'jitter_interval': int(env.get('galileo_expdb_influxdb_jitter_interval', '0')),
+        'retry_interval': int(env.get('galileo_expdb_influxdb_retry_interval', '5000')),
+        'max_retries': int(env.get('galileo_expdb_influxdb_max_retries', '5')),
+        'max_retry_delay': int(env.get('galileo_expdb_influxdb_max_retry_delay', '125000')),
+        'exponential_base': int(env.get('galileo_expdb_influxdb_exponential_base', '2')),
+        'max_close_wait': int(env.get('galileo_expdb_influxdb_max_close_wait', '300000')),
+    }
+
+    logger.info('read influxdb write options from environment %s', params)
+    return WriteOptions(**params)
 
 
 def create_mysql_from_env(env: MutableMapping = os.environ):
@@ -67,9 +142,22 @@ def create_mysql_from_env(env: MutableMapping = os.environ):
 def create_sqlite_from_env(env: MutableMapping = os.environ):
     from galileodb.sql.driver.sqlite import SqliteAdapter
     db_file = env.get('galileo_expdb_sqlite_path', './galileodb.sqlite')
+    profile = env.get('galileo_expdb_sqlite_profile', 'default')
+
+    logger.info('creating db adapter to SQLite %s with profile %s', os.path.realpath(db_file), profile)
+    return SqliteAdapter(db_file, profile=profile)
+
+
+def create_sharded_sqlite_from_env(env: MutableMapping = os.environ):
+    from galileodb.sql.shard import ShardedSqliteExperimentDatabase
+    db_file = env.get('galileo_expdb_sqlite_path', './galileodb.sqlite')
+    shard_dir = env.get('galileo_expdb_sqlite_shard_dir')
+    profile = env.get('galileo_expdb_sqlite_profile', 'default')
 
-    logger.info('creating db adapter to SQLite %s', os.path.realpath(db_file))
-    return SqliteAdapter(db_file)
+    logger.info('creating sharded SQLite database with catalog %s and shards in %s', os.path.realpath(db_file),
+                os.path.realpath(shard_dir))
+    return ShardedSqliteExperimentDatabase(db_file, shard_dir, profile=profile,
+                                           idempotent_traces=_idempotent_traces(env))
 
 
 def create_mixeddb_from_env(env: MutableMapping = os.environ):
@@ -0,0 +1,233 @@
+"""
+Flush policies decide when the recorders and the TraceLogger write their buffered records to the database: when the
+buffer holds `max_size` records, when its oldest record is `max_age` seconds old, or when the (estimated) size of the
+buffered records exceeds `max_bytes`. A size limit alone flushes low-rate streams far too late, and flushes high-rate
+streams far too often, so an adaptive policy additionally grows the batch size while writes are slow.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Optional, Callable, MutableMapping, List
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_size(record) -> int:
+    """
+    Cheaply estimates the serialized size of a record (a tuple) in bytes.
+    """
+    size = 0
+    for value in record:
+        size += len(value) if isinstance(value, str) else 8
+    return size
+
+
+class FlushPolicy:
+
+    def __init__(self, max_size: int = 36, max_age: float = None, max_bytes: int = None, adaptive=False,
+                 max_size_limit: int = None, target_latency: float = 0.05,
+                 sizeof: Callable[[object], int] = estimate_size) -> None:
+        """
+        :param max_size: flush when the buffer holds this many records
+        :param max_age: flush when the oldest buffered record is this many seconds old
+        :param max_bytes: flush when the buffered records have (about) this size in bytes
+        :param adaptive: grow max_size (up to max_size_limit) while writes take longer than target_latency, and shrink
+                         it back when they are fast again
+        :param max_size_limit: the largest batch size an adaptive policy grows to (defaults to 32 * max_size)
+        :param target_latency: the write latency in seconds an adaptive policy aims for
+        :param sizeof: estimates the size of a record in bytes (only used if max_bytes is set)
+        """
+        super().__init__()
+        self.initial_size = max_size
+        self.max_size = max_size
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.adaptive = adaptive
+        self.max_size_limit = max_size_limit or max_size * 32
+        self.target_latency = target_latency
+        self.sizeof = sizeof
+
+        self.size = 0
+        self.bytes = 0
+        self.oldest: Optional[float] = None
+
+    @classmethod
+    def from_env(cls, max_size: int, env: MutableMapping = os.environ) -> 'FlushPolicy':
+        max_age = env.get('galileo_expdb_flush_max_age', '5')
+        max_bytes = env.get('galileo_expdb_flush_max_bytes')
+
+        return cls(
+            max_size=max_size,
+            max_age=float(max_age) if max_age else None,
+            max_bytes=int(max_bytes) if max_bytes else None,
+            adaptive=env.get('galileo_expdb_flush_adaptive', 'false').lower() in ('1', 'true', 'yes'),
+        )
+
+    def add(self, record=None, n: int = 1):
+        """
+        Registers records that were added to the buffer.
+
+        :param record: the record (used to estimate the buffer size in bytes)
+        :param n: the number of records
+        """
+        if self.oldest is None:
+            self.oldest = time.monotonic()
+        self.size += n
+        if self.max_bytes is not None and record is not None:
+            self.bytes += self.sizeof(record)
+
+    def add_all(self, records: List):
+        """
+        Registers a batch of records that were added to the buffer.
+        """
+        if not records:
+            return
+        if self.oldest is None:
+            self.oldest = time.monotonic()
+        self.size += len(records)
+        if self.max_bytes is not None:
+            self.bytes += sum(map(self.sizeof, records))
+
+    def should_flush(self) -> bool:
+        if self.size == 0:
+            return False
+        if self.size >= self.max_size:
+            return True
+        if self.max_bytes is not None and self.bytes >= self.max_bytes:
+            return True
+        if self.max_age is not None and time.monotonic() - self.oldest >= self.max_age:
+            return True
+        return False
+
+    def time_until_due(self) -> Optional[float]:
+        """
+        Returns the time in seconds until the buffer is due because of its age, or None if it is empty or there is no
+        age limit.
+        """
+        if self.size == 0 or self.max_age is None:
+            return None
+        return max(0., self.oldest + self.max_age - time.monotonic())
+
+    def flushed(self, latency: float = None):
+        """
+        Registers that the buffer was flushed.
+
+        :param latency: the time in seconds the write took
+        """
+        full = self.size >= self.max_size
+
+        self.size = 0
+        self.bytes = 0
+        self.oldest = None
+
+        if not self.adaptive or latency is None:
+            return
+
+        if full and latency > self.target_latency:
+            # writes are expensive, amortize them over more records
+            self.max_size = min(self.max_size * 2, self.max_size_limit)
+            logger.debug('write took %.3fs, growing batch size to %d', latency, self.max_size)
+        elif latency < self.target_latency / 4 and self.max_size > self.initial_size:
+            self.max_size = max(self.max_size // 2, self.initial_size)
+            logger.debug('write took %.3fs, shrinking batch size to %d', latency, self.max_size)
+
+
+class FlushTimer(threading.Thread):
+    """
+    Periodically flushes a buffer whose records have become too old, for buffers that are otherwise only checked when
+    a new record arrives. The `flush` callable is invoked while holding `lock`, which the owner of the buffer also
+    holds while adding records.
+    """
+
+    def __init__(self, policy: FlushPolicy, flush: Callable[[], None], lock, interval: float = None) -> None:
+        super().__init__(name='flush-timer', daemon=True)
+        self.policy = policy
+        self.flush = flush
+        self.lock = lock
+        self.interval = interval or max(0.1, (policy.max_age or 1) / 4)
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            with self.lock:
+                if self.policy.should_flush():
+                    try:
+                        self.flush()
+                    except Exception:
+                        logger.exception('error during timed flush')
+
+
+class FlushBuffer:
+    """
+    A thread-safe buffer of records that are passed to `write` in batches as decided by a FlushPolicy. If the write
+    fails, the records are passed to `fallback` (e.g., to append them to a Spool). Without a fallback, the records
+    remain in the buffer and the exception is raised.
+    """
+
+    def __init__(self, write: Callable[[List], None], policy: FlushPolicy,
+                 fallback: Callable[[List], None] = None) -> None:
+        super().__init__()
+        self.write = write
+        self.policy = policy
+        self.fallback = fallback
+        self.records = list()
+        self.lock = threading.RLock()
+        self._timer: Optional[FlushTimer] = None
+
+    def __len__(self):
+        return len(self.records)
+
+    def append(self, record):
+        with self.lock:
+            self.records.append(record)
+            self.policy.add(record)
+            if self.policy.should_flush():
+                self.flush()
+
+    def extend(self, records: List):
+        with self.lock:
+            self.records.extend(records)
+            self.policy.add_all(records)
+            if self.policy.should_flush():
+                self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self.records:
+                return
+
+            then = time.monotonic()
+            try:
+                self.write(self.records)
+            except Exception as e:
+                if self.fallback is None:
+                    raise
+                logger.warning('error writing %d records, passing them to fallback: %s', len(self.records), e)
+                self.fallback(self.records)
+            # the writer may hold on to the list, so it is replaced rather than cleared
+            self.records = list()
+            self.policy.flushed(time.monotonic() - then)
+
+    def clear(self):
+        with self.lock:
+            self.records = list()
+            self.policy.flushed()
+
+    def start_timer(self):
+        """
+        Starts a thread that flushes the buffer once its records are older than the policy's max_age, even if no
+        further records arrive.
+        """
+        if self.policy.max_age is None or self._timer is not None:
+            return
+        self._timer = FlushTimer(self.policy, self.flush, self.lock)
+        self._timer.start()
+
+    def stop_timer(self):
+        if self._timer is not None:
+            self._timer.stop()
+            self._timer = None
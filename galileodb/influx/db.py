@@ -1,41 +1,129 @@
 import datetime
+import functools
 import logging
-from typing import List, Dict
+import threading
+from typing import List, Dict, Iterator, Callable, Tuple, Optional, Sequence
 
-from influxdb_client import InfluxDBClient, Point, WriteOptions, WriteApi, QueryApi, WritePrecision, BucketsApi
+from influxdb_client import InfluxDBClient, WriteOptions, WriteApi, QueryApi, WritePrecision, BucketsApi
 from influxdb_client.client.delete_api import DeleteApi
-from influxdb_client.client.flux_table import FluxRecord
-from influxdb_client.client.write_api import WriteType
+from influxdb_client.client.write_api import WriteType, SYNCHRONOUS
+from influxdb_client.domain.dialect import Dialect
 
 from galileodb import ExperimentDatabase, Experiment, NodeInfo, Telemetry
-from galileodb.model import ExperimentEvent, RequestTrace
+from galileodb.influx import lineprotocol
+from galileodb.model import ExperimentEvent, RequestTrace, ResampledTelemetry, TELEMETRY_AGGREGATES
 
 logger = logging.getLogger()
 
+SCHEMAS = ('v1', 'v2')
+
+# plain CSV without annotations, results are parsed by column name
+_CSV_DIALECT = Dialect(header=True, annotations=[], date_time_format='RFC3339Nano')
+
+# the columns read for each measurement. `ts` only exists in v1, whereas the point time `_time` is the timestamp in v2
+_TELEMETRY_COLUMNS = ['_time', 'ts', 'metric', 'node', 'value', 'exp_id', 'subsystem']
+_TRACE_COLUMNS = ['request_id', 'client', 'service', 'created', 'sent', 'done', 'status', 'server', 'exp_id',
+                  'headers', 'response']
+_EVENT_COLUMNS = ['_time', 'ts', 'exp_id', 'name', 'value']
+
+
+@functools.lru_cache(maxsize=4096)
+def _epoch_seconds(value: str) -> int:
+    return int(datetime.datetime.fromisoformat(value).replace(tzinfo=datetime.timezone.utc).timestamp())
+
+
+def _parse_time(value: str) -> float:
+    """
+    Parses an RFC3339 UTC time with up to nanosecond precision (e.g., 2021-06-09T09:39:02.123456789Z) into seconds.
+    """
+    seconds, _, fraction = value.rstrip('Z').partition('.')
+    # many points share the same second, so only the (cached) seconds part goes through datetime
+    return _epoch_seconds(seconds) + (float('0.' + fraction) if fraction else 0.)
+
+
+def _timestamp(time: str, ts: Optional[str]) -> float:
+    # v1 points carry the original float timestamp as tag
+    return float(ts) if ts is not None else _parse_time(time)
+
 
 class InfluxExperimentDatabase(ExperimentDatabase):
+    """
+    Stores telemetry, traces and events in one bucket per experiment. Points are written in one of two schemas:
+
+    * v1: all attributes of a record except its value (or request id) are tags, including the float timestamp `ts`,
+      which creates a new series for each point
+    * v2: only the dimensions (exp_id, node, metric, subsystem, client, service, server, name) are tags, all other
+      attributes are fields, and the timestamp is the nanosecond point time (for traces offset by a hash of the
+      request id, see lineprotocol.trace_time_ns)
+
+    Reads handle both schemas, so buckets written with v1 remain readable. migrate_schema rewrites a v1 bucket in the
+    v2 schema.
+    """
     client: InfluxDBClient
     writer: WriteApi
     query: QueryApi
     delete: DeleteApi
     bucket: BucketsApi
 
-    def __init__(self, client: InfluxDBClient, org_name: str = 'galileo', org_id='org-id') -> None:
+    def __init__(self, client: InfluxDBClient, org_name: str = 'galileo', org_id='org-id',
+                 write_options: WriteOptions = None,
+                 error_callback: Callable[[Tuple[str, str, str], object, Exception], None] = None,
+                 schema: str = 'v2') -> None:
+        """
+        :param client: the InfluxDBClient
+        :param org_name: the organization name
+        :param org_id: the organization id
+        :param write_options: the options of the write API, defaults to synchronous writes. With batching writes,
+                              save_* calls return immediately and points are written in the background
+        :param error_callback: called with the (bucket, org, precision) tuple, the line protocol data and the
+                               exception of each batch that could not be written after all retries. With asynchronous
+                               writes, a failed write is detected on a later save_* call or on close
+        :param schema: the schema points are written in (v1 or v2)
+        """
         super().__init__()
+        if schema not in SCHEMAS:
+            raise ValueError('unknown influxdb schema %s' % schema)
         self.client = client
         self.org_name = org_name
         self.org_id = org_id
-        self.write_options = WriteOptions(write_type=WriteType.synchronous)
+        self.write_options = write_options or WriteOptions(write_type=WriteType.synchronous)
+        self.error_callback = error_callback
+        self.schema = schema
+        self.failed_batches = 0
+        self.writer = None
+
+        # the (conf, data, result) of asynchronous writes whose result has not been checked yet
+        self._pending = list()
+        self._pending_lock = threading.Lock()
 
     def open(self):
-        self.writer = self.client.write_api(self.write_options)
+        if self.write_options.write_type == WriteType.batching:
+            self.writer = self.client.write_api(self.write_options, error_callback=self._on_write_error,
+                                                retry_callback=self._on_write_retry)
+        else:
+            self.writer = self.client.write_api(self.write_options)
         self.query = self.client.query_api()
         self.bucket = self.client.buckets_api()
         self.delete = self.client.delete_api()
 
     def close(self):
+        self._check_pending(wait=True)
+        if self.writer is not None:
+            # with batching writes, this blocks until the buffered points have been written (or max_close_wait)
+            self.writer.close()
+            self.writer = None
         self.client.close()
 
+    def _on_write_error(self, conf: Tuple[str, str, str], data, exception: Exception):
+        self.failed_batches += 1
+        logger.error('error writing batch to bucket %s: %s', conf[0], exception)
+        if self.error_callback is not None:
+            self.error_callback(conf, data, exception)
+
+    @staticmethod
+    def _on_write_retry(conf: Tuple[str, str, str], data, exception: Exception):
+        logger.warning('retrying batch write to bucket %s: %s', conf[0], exception)
+
     def save_experiment(self, experiment: Experiment):
         raise NotImplementedError()
 
@@ -49,6 +137,75 @@ class InfluxExperimentDatabase(ExperimentDatabase):
         else:
             self.bucket.delete_bucket(exp_bucket)
 
+    def purge_experiment(self, exp_id: str, batch_size: int = None, progress=None):
+        # all data of an experiment lives in the experiment's bucket
+        self.delete_experiment(exp_id)
+
+    def migrate_schema(self, exp_id: str, batch_size: int = 5000, progress=None):
+        """
+        Rewrites all telemetry, traces and events of the experiment's bucket in the v2 schema. The points are copied
+        into a new bucket, which replaces the experiment's bucket once all points have been copied. A migration that
+        was interrupted can simply be run again: while copying, the original bucket is left untouched, and after the
+        original bucket was deleted, the complete copy is renamed.
+
+        :param exp_id: the experiment id (and bucket name)
+        :param batch_size: the number of points written at a time
+        :param progress: called with the measurement and number of points copied so far after each batch
+        """
+        source = self.bucket.find_bucket_by_name(exp_id)
+        target_name = exp_id + '.migrating'
+        target = self.bucket.find_bucket_by_name(target_name)
+
+        if source is None:
+            if target is None:
+                raise ValueError('no bucket for experiment %s' % exp_id)
+            # interrupted between deleting the original bucket and renaming the copy, which is complete by then
+            logger.info('finishing interrupted schema migration of %s', exp_id)
+            target.name = exp_id
+            self.bucket.update_bucket(target)
+            return
+
+        if target is not None:
+            # a partial copy left over from an interrupted migration
+            self.bucket.delete_bucket(target)
+        target = self.bucket.create_bucket(bucket_name=target_name, org_id=self.org_id,
+                                           retention_rules=source.retention_rules)
+
+        measurements = [
+            ('telemetry', self.iter_telemetry(exp_id), lineprotocol.telemetry_line),
+            ('traces', self.iter_traces(exp_id), lineprotocol.trace_line),
+            ('events', self.iter_events(exp_id), lineprotocol.event_line),
+        ]
+
+        writer = self.client.write_api(SYNCHRONOUS)
+        try:
+            for measurement, records, to_line in measurements:
+                copied = 0
+                batch = list()
+                for record in records:
+                    batch.append(record)
+                    if len(batch) >= batch_size:
+                        data = lineprotocol.serialize(batch, to_line, 'v2')
+                        writer.write(bucket=target_name, org=self.org_name, record=data,
+                                     write_precision=WritePrecision.NS)
+                        copied += len(batch)
+                        batch = list()
+                        if progress:
+                            progress(measurement, copied)
+
+                if batch:
+                    data = lineprotocol.serialize(batch, to_line, 'v2')
+                    writer.write(bucket=target_name, org=self.org_name, record=data, write_precision=WritePrecision.NS)
+                    copied += len(batch)
+                    if progress:
+                        progress(measurement, copied)
+        finally:
+            writer.close()
+
+        self.bucket.delete_bucket(source)
+        target.name = exp_id
+        self.bucket.update_bucket(target)
+
     def get_experiment(self, exp_id: str) -> Experiment:
         raise NotImplementedError()
 
@@ -61,71 +218,89 @@ class InfluxExperimentDatabase(ExperimentDatabase):
     def get_metadata(self, exp_id: str) -> Dict:
         raise NotImplementedError()
 
+    def get_traces(self, exp_id: str, service=None, client=None, status=None, start=None,
+                   end=None) -> List[RequestTrace]:
+        return list(self.iter_traces(exp_id, service=service, client=client, status=status, start=start, end=end))
+
+    def iter_traces(self, exp_id: str = None, chunk_size: int = None, service=None, client=None, status=None,
+                    start=None, end=None) -> Iterator[RequestTrace]:
+        # query_rows parses the HTTP response incrementally, so there is no chunking to configure.
+        # the point time of a trace is (within lineprotocol.TRACE_TIME_WINDOW_NS) the time it was sent, which is never
+        # before it was created, so the start of the range is pushed down less the window, whereas the created bounds
+        # are checked on the `created` column. status and created are tags in v1 and fields in v2, so they are
+        # compared after the pivot in a way that works for both.
+        rows = self._query_traces(exp_id, _TRACE_COLUMNS, service, client, status, start, end)
+        return map(self._row_to_trace, rows)
+
+    def get_traces_columns(self, exp_id: str = None, chunk_size: int = None, service=None, client=None, status=None,
+                           start=None, end=None):
+        from galileodb.columnar import ColumnBuilder, TRACE_COLUMNS
+
+        # the rows are projected onto the trace columns, so headers and responses are never transferred
+        fields = [name for name, _ in TRACE_COLUMNS]
+        rows = self._query_traces(exp_id, fields, service, client, status, start, end)
+
+        # numpy parses the float and int columns from their string values
+        builder = ColumnBuilder(TRACE_COLUMNS)
+        builder.extend(rows, chunk_size)
+        return builder.build()
+
+    def _query_traces(self, exp_id, columns, service, client, status, start, end) -> Iterator[List[Optional[str]]]:
+        predicates = list()
+        if status is not None:
+            predicates.append(f'string(v: r["status"]) == {self._flux_string(int(status))}')
+        if start is not None:
+            predicates.append(f'float(v: r["created"]) >= {self._flux_float(start)}')
+        if end is not None:
+            predicates.append(f'float(v: r["created"]) < {self._flux_float(end)}')
+
+        if start is not None:
+            start = float(start) - lineprotocol.TRACE_TIME_WINDOW_NS / 1e9
+
+        return self.query_rows('traces', exp_id, columns, start=start, predicates=predicates, service=service,
+                               client=client)
+
     @staticmethod
-    def _map_flux_record_to_request_trace(record: FluxRecord) -> RequestTrace:
-        return RequestTrace(
-            request_id=record.get_value(),
-            client=record.values['client'],
-            service=record.values['service'],
-            done=float(record.values['done']),
-            created=float(record.values['created']),
-            sent=float(record.values['sent']),
-            status=int(record.values['status']),
-            server=record.values['server'],
-            exp_id=record.values['exp_id'],
-            headers=record.values.get('headers', None),
-            response=record.values['response']
-        )
-
-    def get_traces(self, exp_id: str) -> List[RequestTrace]:
-        records = self._query_for_measurement("traces", exp_id)
-        events = list()
-
-        for record in records:
-            events.append(self._map_flux_record_to_request_trace(record))
-
-        return events
+    def _row_to_trace(row: List[Optional[str]]) -> RequestTrace:
+        request_id, client, service, created, sent, done, status, server, exp_id, headers, response = row
+        return RequestTrace(request_id, client, service, float(created), float(sent), float(done), int(status),
+                            server, exp_id, headers, response)
 
     # https://github.com/influxdata/influxdb-client-python/blob/eadbf6ac014582127e2df54698682e2924973e19/examples/nanosecond_precision.py#L37
 
-    def get_telemetry(self, exp_id=None) -> List[Telemetry]:
-        records = self._query_for_measurement("telemetry", exp_id)
-        events = list()
+    def get_telemetry(self, exp_id=None, node=None, metric=None, subsystem=None, start=None,
+                      end=None) -> List[Telemetry]:
+        return list(self.iter_telemetry(exp_id, node=node, metric=metric, subsystem=subsystem, start=start, end=end))
+
+    def iter_telemetry(self, exp_id: str = None, chunk_size: int = None, node=None, metric=None, subsystem=None,
+                       start=None, end=None) -> Iterator[Telemetry]:
+        rows = self.query_rows('telemetry', exp_id, _TELEMETRY_COLUMNS, start=start, end=end, node=node,
+                               metric=metric, subsystem=subsystem)
+        return map(self._row_to_telemetry, rows)
+
+    def get_telemetry_columns(self, exp_id: str = None, chunk_size: int = None, node=None, metric=None,
+                              subsystem=None, start=None, end=None):
+        from galileodb.columnar import ColumnBuilder, TELEMETRY_COLUMNS
 
-        for record in records:
-            events.append(self._map_flux_record_to_telemetry(record))
+        rows = self.query_rows('telemetry', exp_id, _TELEMETRY_COLUMNS, start=start, end=end, node=node,
+                               metric=metric, subsystem=subsystem)
+        # only the timestamp is converted in python, numpy parses the values from their strings
+        rows = ([_timestamp(time, ts), m, n, value, e, sub] for time, ts, m, n, value, e, sub in rows)
 
-        return events
+        builder = ColumnBuilder(TELEMETRY_COLUMNS)
+        builder.extend(rows, chunk_size)
+        return builder.build()
 
     @staticmethod
-    def _map_flux_record_to_telemetry(record: FluxRecord):
-        return Telemetry(
-            timestamp=float(record.values['ts']),
-            metric=record.values['metric'],
-            node=record.values['node'],
-            value=record.get_value(),
-            exp_id=record.values['exp_id'],
-            subsystem=record.values.get('subsystem')
-        )
+    def _row_to_telemetry(row: List[Optional[str]]) -> Telemetry:
+        time, ts, metric, node, value, exp_id, subsystem = row
+        return Telemetry(_timestamp(time, ts), metric, node, float(value), exp_id, subsystem)
 
     def save_telemetry(self, telemetry: List[Telemetry]):
         if len(telemetry) == 0:
             return
 
-        points: List[Point] = list()
-        for data in telemetry:
-            strftime = datetime.datetime.utcfromtimestamp(float(data.timestamp))
-            p = Point("telemetry") \
-                .time(strftime, WritePrecision.MS) \
-                .tag('ts', float(data.timestamp)) \
-                .field('value', float(data.value)) \
-                .tag('exp_id', data.exp_id) \
-                .tag('node', data.node) \
-                .tag('metric', data.metric) \
-                .tag('subsystem', data.subsystem)
-            points.append(p)
-
-        self.writer.write(bucket=telemetry[0].exp_id, org=self.org_name, record=points)
+        self._write(telemetry[0].exp_id, telemetry, lineprotocol.telemetry_line)
 
     def save_event(self, event: ExperimentEvent):
         return self.save_events([event])
@@ -134,72 +309,187 @@ class InfluxExperimentDatabase(ExperimentDatabase):
         if len(traces) == 0:
             return
 
-        points: List[Point] = list()
-        for trace in traces:
-            strftime = datetime.datetime.utcfromtimestamp(float(trace.sent))
-            p = Point("traces") \
-                .time(strftime, WritePrecision.MS) \
-                .field("request_id", trace.request_id) \
-                .tag("client", trace.client) \
-                .tag("service", trace.service) \
-                .tag("created", float(trace.created)) \
-                .tag("sent", float(trace.sent)) \
-                .tag("done", float(trace.done)) \
-                .tag("status", int(trace.status)) \
-                .tag("server", trace.server) \
-                .tag("exp_id", trace.exp_id) \
-                .tag("response", trace.response) \
-                .tag("headers", trace.headers)
-            points.append(p)
-
-        self.writer.write(bucket=traces[0].exp_id, org=self.org_name, record=points)
+        self._write(traces[0].exp_id, traces, lineprotocol.trace_line)
 
     def save_events(self, events: List[ExperimentEvent]):
         if len(events) == 0:
             return
 
-        points: List[Point] = list()
+        self._write(events[0].exp_id, events, lineprotocol.event_line)
+
+    def _write(self, bucket: str, records: List, to_line: Callable):
+        write_type = self.write_options.write_type
+
+        if write_type == WriteType.batching:
+            # the batching writer counts each item towards the batch size, so each point has to be its own item
+            data = lineprotocol.lines(records, to_line, self.schema)
+        else:
+            data = lineprotocol.serialize(records, to_line, self.schema)
+        result = self.writer.write(bucket=bucket, org=self.org_name, record=data, write_precision=WritePrecision.NS)
+
+        if write_type == WriteType.asynchronous:
+            # the asynchronous writer only reports errors through the result, which nobody else would check
+            with self._pending_lock:
+                self._pending.append(((bucket, self.org_name, WritePrecision.NS), data, result))
+            self._check_pending()
+
+    def _check_pending(self, wait=False):
+        """
+        Passes the asynchronous writes that have failed to _on_write_error.
+
+        :param wait: wait for all pending writes, instead of only checking those that have completed
+        """
+        with self._pending_lock:
+            if wait:
+                done, self._pending = self._pending, list()
+            else:
+                done = [p for p in self._pending if p[2].ready()]
+                self._pending = [p for p in self._pending if not p[2].ready()]
+
+        for conf, data, result in done:
+            try:
+                result.get()
+            except Exception as e:
+                self._on_write_error(conf, data, e)
+
+    @staticmethod
+    def _flux_string(value) -> str:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('${', '\\${')
+        return f'"{value}"'
+
+    @staticmethod
+    def _flux_float(value) -> str:
+        return '%.7f' % float(value)
+
+    @staticmethod
+    def _flux_time(timestamp: float) -> str:
+        return datetime.datetime.utcfromtimestamp(float(timestamp)).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+    def _flux_query(self, measurement: str, exp_id: str, start: float = None, end: float = None,
+                    predicates: List[str] = None, pivot=True, columns: Sequence[str] = None, **tags) -> str:
+        """
+        Builds a query for all records of a measurement. The time range [start, end) is pushed down into the range()
+        call, and each tag that is not None into a filter() call. The fields of each point are then pivoted into
+        one record, each additional Flux predicate is applied to the pivoted records, and the records are projected
+        onto the given columns.
+        """
+        if start is None:
+            start = '1970-01-01'
+        else:
+            start = self._flux_time(start)
 
-        for event in events:
-            strftime = datetime.datetime.utcfromtimestamp(float(event.timestamp))
-            p = Point("events") \
-                .time(strftime, WritePrecision.MS) \
-                .tag("ts", float(event.timestamp)) \
-                .tag("name", event.name) \
-                .field("value", event.value) \
-                .tag("exp_id", event.exp_id)
-            points.append(p)
+        if end is None:
+            stop = datetime.datetime.utcnow() + datetime.timedelta(days=1)
+            stop = stop.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        else:
+            stop = self._flux_time(end)
+
+        query = f'''
+               from(bucket: {self._flux_string(exp_id)})
+                 |> range(start: {start}, stop: {stop})
+                 |> filter(fn: (r) => r["_measurement"] == "{measurement}")'''
+
+        for tag, value in tags.items():
+            if value is not None:
+                query += f'''
+                 |> filter(fn: (r) => r["{tag}"] == {self._flux_string(value)})'''
+
+        if pivot:
+            query += '''
+                 |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")'''
+
+        for predicate in predicates or []:
+            query += f'''
+                 |> filter(fn: (r) => {predicate})'''
+
+        if columns:
+            query += f'''
+                 |> keep(columns: [{", ".join(self._flux_string(c) for c in columns)}])'''
+
+        return query
+
+    def query_rows(self, measurement: str, exp_id: str, columns: Sequence[str], start: float = None,
+                   end: float = None, predicates: List[str] = None, pivot=True,
+                   **tags) -> Iterator[List[Optional[str]]]:
+        """
+        Streams the records of a measurement as rows of raw string values, without creating a FluxRecord per row.
+        The response is parsed incrementally, so results of any size are read in bounded memory.
+
+        :param measurement: the measurement (telemetry, traces or events)
+        :param exp_id: the experiment id
+        :param columns: the columns to return, in this order (values of missing columns are None)
+        :param start: only return points at or after the given timestamp
+        :param end: only return points before the given timestamp
+        :param predicates: additional Flux predicates on the (pivoted) records
+        :param pivot: whether to pivot the fields of each point into one row
+        :param tags: tag filters, filters that are None are ignored
+        :return: an iterator over lists of values (None where the value is empty)
+        """
+        query = self._flux_query(measurement, exp_id, start, end, predicates, pivot=pivot, columns=columns, **tags)
+        logger.debug('running flux query %s', query)
+        return self._csv_rows(self.query.query_csv(query, dialect=_CSV_DIALECT), columns)
 
-        self.writer.write(bucket=events[0].exp_id, org=self.org_name, record=points)
+    @staticmethod
+    def _csv_rows(rows: Iterator[List[str]], columns: Sequence[str]) -> Iterator[List[Optional[str]]]:
+        indices = None
+        for row in rows:
+            if not row or row == ['']:
+                # tables with different columns (e.g., traces without headers) are separated by an empty line
+                indices = None
+                continue
+
+            if indices is None or row[1:3] == ['result', 'table']:
+                header = {name: i for i, name in enumerate(row)}
+                indices = [header.get(column) for column in columns]
+                continue
+
+            yield [(row[i] or None) if i is not None else None for i in indices]
+
+    def get_telemetry_resampled(self, exp_id: str, interval: float, agg=('mean', 'min', 'max', 'count'),
+                                node=None, metric=None, subsystem=None, start=None,
+                                end=None) -> List[ResampledTelemetry]:
+        unknown = set(agg) - set(TELEMETRY_AGGREGATES)
+        if unknown:
+            raise ValueError('unknown aggregates %s' % unknown)
+
+        query = self._flux_query('telemetry', exp_id, start, end, ['r["_field"] == "value"'], pivot=False, node=node,
+                                 metric=metric, subsystem=subsystem)
+        # the grouping drops all other tags (in particular `ts`), so that windows span all points of a series
+        query += f'''
+                 |> group(columns: ["exp_id", "node", "metric", "subsystem"])'''
+
+        windows = dict()
+        for a in agg:
+            aggregate_query = query + f'''
+                 |> aggregateWindow(every: {int(interval * 1e9)}ns, fn: {a}, timeSrc: "_start", createEmpty: false)'''
+
+            logger.debug('running flux query %s', aggregate_query)
+            for record in self.query.query_stream(aggregate_query):
+                key = (
+                    record.get_time().timestamp(),
+                    record.values['metric'],
+                    record.values['node'],
+                    record.values['exp_id'],
+                    record.values.get('subsystem')
+                )
+                windows.setdefault(key, dict())[a] = record.get_value()
+
+        result = [ResampledTelemetry(*key, **values) for key, values in windows.items()]
+        result.sort(key=lambda r: (r.timestamp, r.node, r.metric))
+        return result
+
+    def get_events(self, exp_id, name=None, start=None, end=None) -> List[ExperimentEvent]:
+        return list(self.iter_events(exp_id, name=name, start=start, end=end))
+
+    def iter_events(self, exp_id: str = None, chunk_size: int = None, name=None, start=None,
+                    end=None) -> Iterator[ExperimentEvent]:
+        rows = self.query_rows('events', exp_id, _EVENT_COLUMNS, start=start, end=end, name=name)
+        return map(self._row_to_event, rows)
 
     @staticmethod
-    def _map_flux_record_to_exp_event(record: FluxRecord) -> ExperimentEvent:
-        return ExperimentEvent(
-            exp_id=record.values['exp_id'],
-            timestamp=float(record.values['ts']),
-            name=record.values['name'],
-            value=record.get_value()
-        )
-
-    def _query_for_measurement(self, measurement: str, exp_id: str):
-        stop = datetime.datetime.utcnow() + datetime.timedelta(days=1)
-        stop = stop.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-        records = self.query.query_stream(
-            f'''  
-               from(bucket: "{exp_id}")
-                 |> range(start: 1970-01-01, stop: {stop})
-                 |> filter(fn: (r) => r["_measurement"] == "{measurement}")    
-            '''
-        )
-        return records
-
-    def get_events(self, exp_id) -> List[ExperimentEvent]:
-        records = self._query_for_measurement("events", exp_id)
-        events = []
-        for record in records:
-            events.append(InfluxExperimentDatabase._map_flux_record_to_exp_event(record))
-
-        return events
+    def _row_to_event(row: List[Optional[str]]) -> ExperimentEvent:
+        time, ts, exp_id, name, value = row
+        return ExperimentEvent(exp_id, _timestamp(time, ts), name, value)
 
     def save_nodeinfos(self, infos: List[NodeInfo]):
         raise NotImplementedError()
@@ -0,0 +1,173 @@
+"""
+Serializes telemetry, traces and events directly into InfluxDB line protocol. The output is the same as that of
+influxdb_client's Point (tags and fields sorted by key, the same escaping, and trailing '.0' trimmed from floats), but
+without creating an object and a chain of method calls per record, which dominates the cost of writing high rates of
+telemetry.
+"""
+import hashlib
+import math
+from typing import Iterable, Optional, Callable, Tuple, List
+
+from galileodb.model import Telemetry, RequestTrace, ExperimentEvent
+
+# the v2 point time of a trace is within this many nanoseconds of the time it was sent (see trace_time_ns)
+TRACE_TIME_WINDOW_NS = 1000000
+
+_ESCAPE_KEY = str.maketrans({
+    ',': r'\,',
+    '=': r'\=',
+    ' ': r'\ ',
+    '\n': r'\n',
+    '\t': r'\t',
+    '\r': r'\r',
+})
+
+_ESCAPE_STRING = str.maketrans({
+    '"': r'\"',
+    '\\': r'\\',
+})
+
+
+def time_ns(timestamp) -> int:
+    """
+    Converts a timestamp in (float) seconds into integer nanoseconds.
+    """
+    # points are identified by measurement, tags and time, so deriving the time deterministically from the record
+    # makes writing the same record twice overwrite the existing point instead of adding a duplicate
+    return int(round(float(timestamp) * 1e9))
+
+
+def trace_time_ns(t: RequestTrace) -> int:
+    """
+    Returns the point time of a trace in the v2 schema: the time the trace was sent, truncated to the millisecond,
+    plus an offset below one millisecond derived from a 64 bit hash of the request id. The request id is a field, so
+    traces of the same exp_id, client, service and server with the same point time are the same point, and the later
+    one overwrites the earlier. With a million offsets, this is unlikely, but not impossible: of n such traces sent
+    within the same millisecond, about n * (n - 1) / 2,000,000 pairs collide (e.g., 0.5% for 100 traces). The offset is
+    deterministic, so writing the same trace twice still overwrites it. The point time is less than
+    TRACE_TIME_WINDOW_NS away from `sent`, which is stored exactly as field.
+    """
+    digest = hashlib.blake2b((t.request_id or '').encode('utf-8'), digest_size=8).digest()
+    sent = time_ns(t.sent)
+    return sent - sent % TRACE_TIME_WINDOW_NS + int.from_bytes(digest, 'big') % TRACE_TIME_WINDOW_NS
+
+
+def escape_tag(value) -> str:
+    """
+    Escapes a tag value, or returns an empty string if the tag should be omitted.
+    """
+    if value is None:
+        return ''
+    value = str(value).translate(_ESCAPE_KEY)
+    if value.endswith('\\'):
+        value += ' '
+    return value
+
+
+def _tag(key: str, value) -> str:
+    value = escape_tag(value)
+    return f',{key}={value}' if value else ''
+
+
+def format_field(value) -> Optional[str]:
+    """
+    Formats a field value, or returns None if the field should be omitted.
+    """
+    if value is None:
+        return None
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            return None
+        s = repr(value)
+        return s[:-2] if s.endswith('.0') else s
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, int):
+        return f'{value}i'
+    if isinstance(value, str):
+        return '"' + value.translate(_ESCAPE_STRING) + '"'
+    raise ValueError('unsupported field type %s' % type(value))
+
+
+def line(measurement: str, tags: Iterable[Tuple[str, object]], fields: Iterable[Tuple[str, object]],
+         timestamp_ns: int) -> Optional[str]:
+    """
+    Serializes one point. Tag and field keys must be sorted and must not need escaping.
+
+    :return: the line, or None if the point has no fields
+    """
+    tag_set = ''.join([_tag(key, value) for key, value in tags])
+
+    field_set = list()
+    for key, value in fields:
+        value = format_field(value)
+        if value is not None:
+            field_set.append(f'{key}={value}')
+
+    if not field_set:
+        return None
+
+    return f'{measurement}{tag_set} {",".join(field_set)} {timestamp_ns}'
+
+
+def telemetry_line(t: Telemetry, schema: str = 'v2') -> Optional[str]:
+    # the hot path of the recorders, so the line is assembled without the generic line()
+    value = format_field(float(t.value))
+    if value is None:
+        return None
+
+    tag_set = _tag('exp_id', t.exp_id) + _tag('metric', t.metric) + _tag('node', t.node) + \
+        _tag('subsystem', t.subsystem)
+    if schema == 'v1':
+        tag_set += _tag('ts', float(t.timestamp))
+
+    return f'telemetry{tag_set} value={value} {time_ns(t.timestamp)}'
+
+
+def trace_line(t: RequestTrace, schema: str = 'v2') -> Optional[str]:
+    if schema == 'v1':
+        tags = [
+            ('client', t.client), ('created', float(t.created)), ('done', float(t.done)), ('exp_id', t.exp_id),
+            ('headers', t.headers), ('response', t.response), ('sent', float(t.sent)), ('server', t.server),
+            ('service', t.service), ('status', int(t.status))
+        ]
+        fields = [('request_id', t.request_id)]
+        return line('traces', tags, fields, time_ns(t.sent))
+
+    tags = [('client', t.client), ('exp_id', t.exp_id), ('server', t.server), ('service', t.service)]
+    fields = [
+        ('created', float(t.created)), ('done', float(t.done)), ('headers', t.headers),
+        ('request_id', t.request_id), ('response', t.response), ('sent', float(t.sent)), ('status', int(t.status))
+    ]
+    return line('traces', tags, fields, trace_time_ns(t))
+
+
+def event_line(e: ExperimentEvent, schema: str = 'v2') -> Optional[str]:
+    tags = [('exp_id', e.exp_id), ('name', e.name)]
+    if schema == 'v1':
+        tags.append(('ts', float(e.timestamp)))
+
+    return line('events', tags, [('value', e.value)], time_ns(e.timestamp))
+
+
+def lines(records: Iterable, to_line: Callable[[object, str], Optional[str]], schema: str = 'v2') -> List[str]:
+    """
+    Serializes a batch of records into a list of lines, omitting records without fields.
+
+    :param records: the records
+    :param to_line: telemetry_line, trace_line or event_line
+    :param schema: the schema (v1 or v2)
+    """
+    result = [to_line(record, schema) for record in records]
+    return [lp for lp in result if lp is not None]
+
+
+def serialize(records: Iterable, to_line: Callable[[object, str], Optional[str]], schema: str = 'v2') -> bytes:
+    """
+    Serializes a batch of records into newline separated line protocol.
+
+    :param records: the records
+    :param to_line: telemetry_line, trace_line or event_line
+    :param schema: the schema (v1 or v2)
+    """
+    return '\n'.join(lines(records, to_line, schema)).encode('utf-8')
@@ -1,45 +1,142 @@
-from typing import List, Dict
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Iterator, Callable, Optional
 
 from galileodb import ExperimentDatabase, Experiment, NodeInfo, Telemetry
 from galileodb.influx.db import InfluxExperimentDatabase
-from galileodb.model import ExperimentEvent, RequestTrace
+from galileodb.model import ExperimentEvent, RequestTrace, ResampledTelemetry
 from galileodb.sql.adapter import ExperimentSQLDatabase
 
+logger = logging.getLogger(__name__)
+
+
+class MixedBackendError(Exception):
+    """
+    Raised when more than one of the concurrently called backend operations failed. The exceptions of all failed
+    operations are in `errors`, in the order the operations were given.
+    """
+
+    def __init__(self, errors: List[BaseException]) -> None:
+        super().__init__('%d backend operations failed: %s' % (len(errors), '; '.join(map(repr, errors))))
+        self.errors = errors
+
 
 class MixedExperimentDatabase(ExperimentDatabase):
     """
     Implements the ExperimentDatabase using InfluxDB for telemetry, traces and events and
     SQL for experiment metadata
+
+    Opening and closing call both backends concurrently on a small thread pool, so they take about as long as the
+    slower backend rather than the sum of both. gather can be used to do the same for composite reads.
+
+    The SQL part of save, delete and purge runs on the calling thread, so it takes part in a transaction the caller
+    opened, but InfluxDB buckets are not transactional: a bucket created within a transaction is not removed if the
+    transaction is rolled back. Deleting or purging the InfluxDB data happens only after the SQL part succeeded, and
+    within a transaction only once it has been committed.
     """
 
     influxdb: InfluxExperimentDatabase
     sqldb: ExperimentSQLDatabase
 
-    def __init__(self, influxdb: InfluxExperimentDatabase, sqldb: ExperimentSQLDatabase):
+    def __init__(self, influxdb: InfluxExperimentDatabase, sqldb: ExperimentSQLDatabase, max_workers: int = 2):
         self.influxdb = influxdb
         self.sqldb = sqldb
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pid = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None or self._pid != os.getpid():
+            # the threads of a pool inherited from the parent process do not exist in a forked child
+            self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='mixed-db')
+            self._pid = os.getpid()
+        return self._executor
+
+    def gather(self, *calls: Callable[[], object]) -> List:
+        """
+        Runs the given callables concurrently and waits for all of them, e.g.,
+        ``experiment, traces = db.gather(lambda: db.get_experiment(exp_id), lambda: db.get_traces(exp_id))``.
+
+        :return: the results of the calls in the given order
+        :raises: the exception of the failed call if one call failed, or a MixedBackendError if several calls failed
+        """
+        futures = [self._get_executor().submit(call) for call in calls]
+
+        results = list()
+        errors = list()
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                errors.append(e)
+
+        self._raise_errors(errors)
+        return results
+
+    @staticmethod
+    def _raise_errors(errors: List[BaseException]):
+        if len(errors) == 1:
+            raise errors[0]
+        if errors:
+            raise MixedBackendError(errors)
 
     def open(self):
-        self.influxdb.open()
-        self.sqldb.open()
+        self.gather(self.influxdb.open, self.sqldb.open)
 
     def close(self):
-        self.influxdb.close()
-        self.sqldb.close()
+        try:
+            self.gather(self.influxdb.close, self.sqldb.close)
+        finally:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown()
+            self._executor = None
+
+    def transaction(self):
+        # only the experiment metadata in the SQL database is transactional
+        return self.sqldb.transaction()
 
     def save_experiment(self, experiment: Experiment):
-        self.sqldb.save_experiment(experiment)
-        self.influxdb.client.buckets_api().create_bucket(
-            bucket_name=experiment.id,
-            org_id=self.influxdb.org_id
-        )
+        buckets = self.influxdb.client.buckets_api()
+
+        if self.sqldb.db.in_transaction():
+            # the row is inserted first so a failing insert does not create a bucket, but the bucket is not removed if
+            # the caller's transaction is rolled back later
+            self.sqldb.save_experiment(experiment)
+            buckets.create_bucket(bucket_name=experiment.id, org_id=self.influxdb.org_id)
+            return
+
+        bucket = self._get_executor().submit(buckets.create_bucket, bucket_name=experiment.id,
+                                             org_id=self.influxdb.org_id)
+
+        sql_error = None
+        try:
+            self.sqldb.save_experiment(experiment)
+        except Exception as e:
+            sql_error = e
+
+        bucket_error = bucket.exception()
+
+        if sql_error is not None and bucket_error is None:
+            # the experiment does not exist without its row, don't leave an orphaned bucket behind
+            try:
+                buckets.delete_bucket(bucket.result())
+            except Exception as e:
+                logger.warning('could not delete bucket of experiment %s that failed to be saved: %s', experiment.id, e)
+
+        self._raise_errors([e for e in (sql_error, bucket_error) if e is not None])
 
     def update_experiment(self, experiment: Experiment):
         self.sqldb.update_experiment(experiment)
 
     def delete_experiment(self, exp_id: str):
         self.sqldb.delete_experiment(exp_id)
-        self.influxdb.delete_experiment(exp_id)
+        # the bucket cannot be restored, so it is only deleted once the deletion of the row is committed
+        self.sqldb.db.after_commit(lambda: self.influxdb.delete_experiment(exp_id))
+
+    def purge_experiment(self, exp_id: str, batch_size: int = None, progress=None):
+        self.sqldb.purge_experiment(exp_id, batch_size, progress)
+        self.sqldb.db.after_commit(lambda: self.influxdb.purge_experiment(exp_id))
 
     def get_experiment(self, exp_id: str) -> Experiment:
         return self.sqldb.get_experiment(exp_id)
@@ -57,14 +154,37 @@ class MixedExperimentDatabase(ExperimentDatabase):
         # not necessary, as traces are stored in experiment InfluxDB bucket
         pass
 
-    def get_traces(self, exp_id: str) -> List[RequestTrace]:
-        return self.influxdb.get_traces(exp_id)
+    def get_traces(self, exp_id: str, service: str = None, client: str = None, status: int = None, start: float = None,
+                   end: float = None) -> List[RequestTrace]:
+        return self.influxdb.get_traces(exp_id, service, client, status, start, end)
+
+    def iter_traces(self, exp_id: str = None, chunk_size: int = None, service: str = None, client: str = None,
+                    status: int = None, start: float = None, end: float = None) -> Iterator[RequestTrace]:
+        return self.influxdb.iter_traces(exp_id, chunk_size, service, client, status, start, end)
+
+    def get_traces_columns(self, exp_id: str = None, chunk_size: int = None, service: str = None, client: str = None,
+                           status: int = None, start: float = None, end: float = None):
+        return self.influxdb.get_traces_columns(exp_id, chunk_size, service, client, status, start, end)
 
     def save_telemetry(self, telemetry: List[Telemetry]):
         self.influxdb.save_telemetry(telemetry)
 
-    def get_telemetry(self, exp_id=None) -> List[Telemetry]:
-        return self.influxdb.get_telemetry(exp_id)
+    def get_telemetry(self, exp_id=None, node: str = None, metric: str = None, subsystem: str = None,
+                      start: float = None, end: float = None) -> List[Telemetry]:
+        return self.influxdb.get_telemetry(exp_id, node, metric, subsystem, start, end)
+
+    def iter_telemetry(self, exp_id: str = None, chunk_size: int = None, node: str = None, metric: str = None,
+                       subsystem: str = None, start: float = None, end: float = None) -> Iterator[Telemetry]:
+        return self.influxdb.iter_telemetry(exp_id, chunk_size, node, metric, subsystem, start, end)
+
+    def get_telemetry_columns(self, exp_id: str = None, chunk_size: int = None, node: str = None, metric: str = None,
+                              subsystem: str = None, start: float = None, end: float = None):
+        return self.influxdb.get_telemetry_columns(exp_id, chunk_size, node, metric, subsystem, start, end)
+
+    def get_telemetry_resampled(self, exp_id: str, interval: float, agg=('mean', 'min', 'max', 'count'),
+                                node: str = None, metric: str = None, subsystem: str = None, start: float = None,
+                                end: float = None) -> List[ResampledTelemetry]:
+        return self.influxdb.get_telemetry_resampled(exp_id, interval, agg, node, metric, subsystem, start, end)
 
     def save_event(self, event: ExperimentEvent):
         self.influxdb.save_event(event)
@@ -72,8 +192,12 @@ class MixedExperimentDatabase(ExperimentDatabase):
     def save_events(self, events: List[ExperimentEvent]):
         self.influxdb.save_events(events)
 
-    def get_events(self, exp_id) -> List[ExperimentEvent]:
-        return self.influxdb.get_events(exp_id)
+    def get_events(self, exp_id, name: str = None, start: float = None, end: float = None) -> List[ExperimentEvent]:
+        return self.influxdb.get_events(exp_id, name, start, end)
+
+    def iter_events(self, exp_id: str = None, chunk_size: int = None, name: str = None, start: float = None,
+                    end: float = None) -> Iterator[ExperimentEvent]:
+        return self.influxdb.iter_events(exp_id, chunk_size, name, start, end)
 
     def save_nodeinfos(self, infos: List[NodeInfo]):
         self.sqldb.save_nodeinfos(infos)
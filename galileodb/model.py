@@ -45,6 +45,22 @@ class Telemetry(NamedTuple):
     subsystem: str = None
 
 
+class ResampledTelemetry(NamedTuple):
+    timestamp: float  # start of the time window
+    metric: str
+    node: str
+    exp_id: str
+    subsystem: str = None
+    mean: float = None
+    min: float = None
+    max: float = None
+    count: int = None
+    sum: float = None
+
+
+TELEMETRY_AGGREGATES = ('mean', 'min', 'max', 'count', 'sum')
+
+
 class NodeInfo(NamedTuple):
     node: str
     data: Dict[str, str]
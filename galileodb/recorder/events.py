@@ -1,13 +1,16 @@
 """
 Clients can publish into the redis topic 'galileo/events' with values: '<timestamp> <name> [<value>]'.
 """
+import functools
 import logging
 import os
 import threading
 from typing import Iterator
 
 from galileodb import ExperimentDatabase
+from galileodb.flush import FlushPolicy, FlushBuffer
 from galileodb.model import ExperimentEvent, Event
+from galileodb.spool import Spool
 
 logger = logging.getLogger(__name__)
 
@@ -71,22 +74,25 @@ class ExperimentEventRecorder:
 
 
 class BatchingExperimentEventRecorder:
-    def __init__(self, rds, db: ExperimentDatabase, exp_id: str, flush_every=36) -> None:
+    def __init__(self, rds, db: ExperimentDatabase, exp_id: str, flush_every=36,
+                 flush_policy: FlushPolicy = None, spool: Spool = None) -> None:
         self.rds = rds
         self.db = db
         self.exp_id = exp_id
-        self.flush_every = int(os.getenv('galileo_expdb_event_logger_flush', flush_every))
 
-        self._buffer = list()
+        flush_every = int(os.getenv('galileo_expdb_event_logger_flush', flush_every))
+        fallback = functools.partial(spool.append, 'events') if spool else None
+        self._buffer = FlushBuffer(self._write, flush_policy or FlushPolicy.from_env(flush_every), fallback)
         self._subscriber = None
-        self._i = 0
 
     def run(self):
         self._subscriber = RedisEventSubscriber(self.rds)
+        self._buffer.start_timer()
         try:
             for event in self._subscriber.listen():
                 self._record(event)
         finally:
+            self._buffer.stop_timer()
             self.flush()
 
     def close(self):
@@ -94,23 +100,18 @@ class BatchingExperimentEventRecorder:
             self._subscriber.close()
 
     def flush(self):
-        if not self._buffer:
+        if not len(self._buffer):
             logger.debug('event buffer empty')
             return
 
-        logger.debug('saving %s event records of experiment "%s"', len(self._buffer), self.exp_id)
+        self._buffer.flush()
 
-        self.db.save_events(self._buffer)
-        self._buffer.clear()
+    def _write(self, events):
+        logger.debug('saving %s event records of experiment "%s"', len(events), self.exp_id)
+        self.db.save_events(events)
 
     def _record(self, event: Event):
         self._buffer.append(ExperimentEvent(self.exp_id, *event))
-        self._increment_and_flush()
-
-    def _increment_and_flush(self):
-        self._i = (self._i + 1) % self.flush_every
-        if self._i == 0:
-            self.flush()
 
 
 class ExperimentEventRecorderThread(threading.Thread):
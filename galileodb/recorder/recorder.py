@@ -1,25 +1,51 @@
+import os
+
 from galileodb.recorder.events import ExperimentEventRecorderThread, ExperimentEventRecorder, \
     BatchingExperimentEventRecorder
+from galileodb.recorder.streams import RedisStreamTraceRecorder, RedisStreamEventRecorder
 from galileodb.recorder.telemetry import ExperimentTelemetryRecorder
 from galileodb.recorder.traces import RedisTraceRecorder
+from galileodb.spool import Spool, SpoolReplayer, database_writers
 from galileodb.trace import DatabaseTraceWriter
 
 
 class Recorder:
 
-    def __init__(self, rds, exp_db, experiment_id) -> None:
+    def __init__(self, rds, exp_db, experiment_id, spool: Spool = None, transport: str = None) -> None:
+        """
+        :param rds: the Redis client
+        :param exp_db: the experiment database
+        :param experiment_id: the experiment to record
+        :param spool: the spool for records that cannot be written
+        :param transport: how traces and events are received, 'pubsub' (channels) or 'streams' (consumer groups of
+                          Redis streams), defaults to the env variable galileo_expdb_transport or 'pubsub'
+        """
         self.rds = rds
         self.exp_db = exp_db
         self.experiment_id = experiment_id
+        self.spool = spool
+        self.transport = transport or os.getenv('galileo_expdb_transport', 'pubsub')
 
-        self.telemetry_recorder = ExperimentTelemetryRecorder(rds, exp_db, experiment_id)
-        self.event_recorder = ExperimentEventRecorderThread(BatchingExperimentEventRecorder(rds, exp_db, experiment_id))
-        self.trace_recorder = RedisTraceRecorder(rds, experiment_id, DatabaseTraceWriter(exp_db))
+        self.telemetry_recorder = ExperimentTelemetryRecorder(rds, exp_db, experiment_id, spool=spool)
+        trace_writer = DatabaseTraceWriter(exp_db, experiment_id)
+        if self.transport == 'pubsub':
+            self.event_recorder = ExperimentEventRecorderThread(
+                BatchingExperimentEventRecorder(rds, exp_db, experiment_id, spool=spool))
+            self.trace_recorder = RedisTraceRecorder(rds, experiment_id, trace_writer, spool=spool)
+        elif self.transport == 'streams':
+            self.event_recorder = RedisStreamEventRecorder(rds, exp_db, experiment_id, spool=spool)
+            self.trace_recorder = RedisStreamTraceRecorder(rds, experiment_id, trace_writer, spool=spool)
+        else:
+            raise ValueError('unknown transport %s, expected pubsub or streams' % self.transport)
+        # records that failed to be written are re-submitted once the database recovers
+        self.spool_replayer = SpoolReplayer(spool, database_writers(exp_db)) if spool else None
 
     def start(self):
         self.telemetry_recorder.start()
         self.event_recorder.start()
         self.trace_recorder.start()
+        if self.spool_replayer:
+            self.spool_replayer.start()
 
     def join(self, timeout=None):
         self.telemetry_recorder.join(timeout)
@@ -30,3 +56,8 @@ class Recorder:
         self.telemetry_recorder.stop(timeout)
         self.event_recorder.stop(timeout)
         self.trace_recorder.stop(timeout)
+        if self.spool_replayer:
+            self.spool_replayer.stop(timeout)
+            # a last attempt, whatever remains is left for galileodb-ctl spool replay
+            self.spool_replayer.replay()
+            self.spool.close()
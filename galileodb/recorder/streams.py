@@ -0,0 +1,254 @@
+"""
+Recorders that consume the Redis streams written by galileodb.reporter.streams as part of a consumer group. Entries
+are read in batches and only acknowledged once the batch was written (or spooled), so entries of a failed write are
+read again, and entries of a recorder that died are claimed by the other consumers of the group (or by the recorder
+started in its place) once they have not been acknowledged for galileo_expdb_stream_claim_idle milliseconds. The
+recorders of one experiment share a group, each entry is then recorded by exactly one of them.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from abc import ABC
+from typing import List, Tuple, Optional, Dict
+
+import redis
+
+from galileodb.db import ExperimentDatabase
+from galileodb.model import RequestTrace, ExperimentEvent
+from galileodb.recorder.traces import _raw_client
+from galileodb.reporter.streams import TRACES_STREAM, EVENTS_STREAM
+from galileodb.reporter.traces import decode_trace
+from galileodb.spool import Spool
+from galileodb.trace import TraceWriter
+
+logger = logging.getLogger(__name__)
+
+Entry = Tuple[bytes, Optional[Dict[bytes, bytes]]]
+
+
+def default_consumer_name() -> str:
+    return '%s-%d' % (socket.gethostname(), os.getpid())
+
+
+def claim_idle_from_env() -> Optional[int]:
+    """
+    Returns the time in milliseconds after which recorders claim unacknowledged entries of other consumers, or None if
+    claiming is disabled (galileo_expdb_stream_claim_idle=0).
+    """
+    claim_idle = int(os.getenv('galileo_expdb_stream_claim_idle', '30000'))
+    return claim_idle if claim_idle > 0 else None
+
+
+class RedisStreamConsumer:
+    """
+    Reads the entries of a stream as a consumer of a consumer group. The first reads return the entries that were
+    delivered to this consumer before but not acknowledged (e.g., by a previous run that crashed), after that new
+    entries are read. If `claim_idle` is set, entries that other consumers of the group did not acknowledge within that
+    many milliseconds are claimed as well.
+    """
+
+    def __init__(self, rds, stream: str, group: str, consumer: str = None, batch_size: int = 1000, block: int = 1000,
+                 start_id: str = '$', claim_idle: int = None) -> None:
+        """
+        :param rds: the Redis client
+        :param stream: the key of the stream
+        :param group: the name of the consumer group, which is created if it does not exist
+        :param consumer: the name of the consumer within the group (defaults to <hostname>-<pid>)
+        :param batch_size: the maximum number of entries per read
+        :param block: the maximum time in milliseconds a read waits for new entries
+        :param start_id: the id after which a newly created group starts reading ('$' for only new entries)
+        :param claim_idle: the time in milliseconds after which unacknowledged entries of other consumers are claimed
+        """
+        super().__init__()
+        self.rds = _raw_client(rds)
+        self.stream = stream
+        self.group = group
+        self.consumer = consumer or default_consumer_name()
+        self.batch_size = batch_size
+        self.block = block
+        self.start_id = start_id
+        self.claim_idle = claim_idle
+
+        self._read_pending = True
+        self._next_claim = 0
+
+    def create_group(self):
+        try:
+            self.rds.xgroup_create(self.stream, self.group, id=self.start_id, mkstream=True)
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    def read(self) -> List[Entry]:
+        """
+        Reads the next batch of entries, waiting up to `block` milliseconds for new ones. Entries that were trimmed from
+        the stream before they were acknowledged are returned with None as fields.
+        """
+        if self._read_pending:
+            entries = self._read('0')
+            if entries:
+                return entries
+            self._read_pending = False
+
+        if self.claim_idle is not None and time.monotonic() >= self._next_claim:
+            self._next_claim = time.monotonic() + self.claim_idle / 1000
+            entries = self._claim()
+            if entries:
+                return entries
+
+        return self._read('>', self.block)
+
+    def _read(self, last_id: str, block: int = None) -> List[Entry]:
+        response = self.rds.xreadgroup(self.group, self.consumer, {self.stream: last_id}, count=self.batch_size,
+                                       block=block)
+        if not response:
+            return []
+        # [[stream, [(id, fields), ...]]]
+        return response[0][1]
+
+    def _claim(self) -> List[Entry]:
+        response = self.rds.xautoclaim(self.stream, self.group, self.consumer, self.claim_idle, count=self.batch_size)
+        # [next start id, [(id, fields), ...], (deleted ids, since Redis 7)]
+        entries = [entry for entry in response[1] if entry[0] is not None]
+        if entries:
+            logger.info('claimed %d entries of %s from other consumers', len(entries), self.stream)
+        return entries
+
+    def retry(self):
+        """
+        Makes the next read return the entries that were read but not acknowledged again.
+        """
+        self._read_pending = True
+
+    def ack(self, ids: List[bytes]):
+        if ids:
+            self.rds.xack(self.stream, self.group, *ids)
+
+
+class RedisStreamRecorder(threading.Thread, ABC):
+    """
+    Reads batches of entries from a RedisStreamConsumer, decodes and writes them, and acknowledges them once they were
+    written. If writing fails, the records are appended to the spool (and acknowledged), or, without a spool, read and
+    written again after `retry_delay` seconds. Entries that cannot be decoded are logged and acknowledged.
+    """
+    spool_stream: str
+
+    def __init__(self, consumer: RedisStreamConsumer, spool: Spool = None, retry_delay: float = 1) -> None:
+        super().__init__()
+        self.consumer = consumer
+        self.spool = spool
+        self.retry_delay = retry_delay
+        self._closed = threading.Event()
+
+    def stop(self, timeout=None):
+        """
+        Equivalent to recorder.close() and recorder.join(timeout).
+
+        :param timeout: the join timeout
+        """
+        self.close()
+        self.join(timeout=timeout)
+
+    def close(self):
+        # the recorder stops after the current read, which waits at most consumer.block milliseconds
+        self._closed.set()
+
+    def run(self):
+        self.consumer.create_group()
+
+        while not self._closed.is_set():
+            try:
+                entries = self.consumer.read()
+            except redis.ConnectionError as e:
+                logger.warning('error reading from stream %s: %s', self.consumer.stream, e)
+                self._closed.wait(self.retry_delay)
+                continue
+
+            if entries and not self._record(entries):
+                self.consumer.retry()
+                self._closed.wait(self.retry_delay)
+
+    def _record(self, entries: List[Entry]) -> bool:
+        records = list()
+        for entry_id, fields in entries:
+            if fields is None:
+                continue
+            try:
+                records.append(self._decode(fields))
+            except Exception as e:
+                logger.error('error decoding entry %s of stream %s: %s', entry_id, self.consumer.stream, e)
+
+        if records:
+            try:
+                self._write(records)
+            except Exception as e:
+                if self.spool is None:
+                    logger.warning('error writing %d records, retrying in %s seconds: %s', len(records),
+                                   self.retry_delay, e)
+                    return False
+                logger.warning('error writing %d records, passing them to the spool: %s', len(records), e)
+                self.spool.append(self.spool_stream, records)
+
+        self.consumer.ack([entry_id for entry_id, _ in entries])
+        return True
+
+    def _decode(self, fields: Dict[bytes, bytes]):
+        raise NotImplementedError
+
+    def _write(self, records: List):
+        raise NotImplementedError
+
+
+class RedisStreamTraceRecorder(RedisStreamRecorder):
+    spool_stream = 'traces'
+
+    def __init__(self, rds, exp_id: str, writer: TraceWriter, stream: str = TRACES_STREAM, group: str = None,
+                 consumer: RedisStreamConsumer = None, spool: Spool = None) -> None:
+        """
+        :param rds: the Redis client
+        :param exp_id: the experiment the traces are recorded for
+        :param writer: the writer of the traces
+        :param stream: the key of the stream
+        :param group: the consumer group (defaults to one group per experiment)
+        :param consumer: a consumer to read the stream with, instead of one created from stream and group (which
+                         claims entries of other consumers after galileo_expdb_stream_claim_idle milliseconds)
+        :param spool: the spool for traces that cannot be written
+        """
+        consumer = consumer or RedisStreamConsumer(rds, stream, group or experiment_group(exp_id),
+                                                   claim_idle=claim_idle_from_env())
+        super().__init__(consumer, spool)
+        self.exp_id = exp_id
+        self.writer = writer
+
+    def _decode(self, fields: Dict[bytes, bytes]) -> RequestTrace:
+        return decode_trace(fields[b't'])._replace(exp_id=self.exp_id)
+
+    def _write(self, traces: List[RequestTrace]):
+        self.writer.write(traces)
+
+
+class RedisStreamEventRecorder(RedisStreamRecorder):
+    spool_stream = 'events'
+
+    def __init__(self, rds, db: ExperimentDatabase, exp_id: str, stream: str = EVENTS_STREAM, group: str = None,
+                 consumer: RedisStreamConsumer = None, spool: Spool = None) -> None:
+        consumer = consumer or RedisStreamConsumer(rds, stream, group or experiment_group(exp_id),
+                                                   claim_idle=claim_idle_from_env())
+        super().__init__(consumer, spool)
+        self.db = db
+        self.exp_id = exp_id
+
+    def _decode(self, fields: Dict[bytes, bytes]) -> ExperimentEvent:
+        value = fields.get(b'value')
+        return ExperimentEvent(self.exp_id, fields[b'timestamp'].decode('utf-8'), fields[b'name'].decode('utf-8'),
+                               value.decode('utf-8') if value is not None else None)
+
+    def _write(self, events: List[ExperimentEvent]):
+        logger.debug('saving %s event records of experiment "%s"', len(events), self.exp_id)
+        self.db.save_events(events)
+
+
+def experiment_group(exp_id: str) -> str:
+    return 'galileodb-recorder/%s' % exp_id
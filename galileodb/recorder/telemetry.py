@@ -1,32 +1,35 @@
+import functools
 import logging
 
 from telemc import TelemetryRecorder, Telemetry, TelemetryController
 
 from galileodb.model import Telemetry as GalileoTelemetry, NodeInfo
 from galileodb.db import ExperimentDatabase
+from galileodb.flush import FlushPolicy, FlushBuffer
+from galileodb.spool import Spool
 
 logger = logging.getLogger(__name__)
 
 
 class ExperimentTelemetryRecorder(TelemetryRecorder):
 
-    # TODO: need locks?
-
-    def __init__(self, rds, db: ExperimentDatabase, exp_id: str, flush_every=36) -> None:
+    def __init__(self, rds, db: ExperimentDatabase, exp_id: str, flush_every=36,
+                 flush_policy: FlushPolicy = None, spool: Spool = None) -> None:
         super().__init__(rds)
         self.db = db
         self.exp_id = exp_id
 
-        self.flush_every = flush_every
-        self.i = 0
-        self.buffer = list()
+        fallback = functools.partial(spool.append, 'telemetry') if spool else None
+        self.buffer = FlushBuffer(self._write, flush_policy or FlushPolicy.from_env(flush_every), fallback)
 
     def run(self):
         try:
             logger.debug('starting ExperimentTelemetryRecorder for experiment %s', self.exp_id)
+            self.buffer.start_timer()
             super().run()
         finally:
             logger.debug('closing ExperimentTelemetryRecorder for experiment %s', self.exp_id)
+            self.buffer.stop_timer()
             self._flush()
 
     def save_nodeinfos(self):
@@ -49,15 +52,9 @@ class ExperimentTelemetryRecorder(TelemetryRecorder):
 
         self.buffer.append(GalileoTelemetry(float(t.timestamp), t.metric, t.node, val, self.exp_id, t.subsystem))
 
-        self.i = (self.i + 1) % self.flush_every
-        if self.i == 0:
-            self._flush()
-
     def _flush(self):
-        if not self.buffer:
-            return
-
-        logger.debug('saving %s telemetry records of experiment "%s"', len(self.buffer), self.exp_id)
+        self.buffer.flush()
 
-        self.db.save_telemetry(self.buffer)
-        self.buffer.clear()
+    def _write(self, telemetry):
+        logger.debug('saving %s telemetry records of experiment "%s"', len(telemetry), self.exp_id)
+        self.db.save_telemetry(telemetry)
@@ -1,10 +1,18 @@
+import functools
 import logging
 import threading
+import time
+import uuid
 from abc import ABC
-from typing import Iterator
+from typing import Iterator, List
 
+import redis
+
+from galileodb.flush import FlushPolicy, FlushBuffer
 from galileodb.model import RequestTrace
-from galileodb.reporter.traces import RedisTraceReporter
+from galileodb.reporter.traces import RedisTraceReporter, is_binary_message, decode_trace, decode_traces, \
+    announce_wire_version, withdraw_wire_version
+from galileodb.spool import Spool
 from galileodb.trace import TraceWriter
 
 logger = logging.getLogger(__name__)
@@ -32,79 +40,156 @@ class TraceRecorder(threading.Thread, ABC):
 
     def run(self):
         self._sub = TracesSubscriber(self.rds)
-        sub = self._sub.run()
+        sub = self._sub.run_batches()
 
         try:
-            for trace in sub:
-                self._record(trace)
+            for traces in sub:
+                self._record_batch(traces)
         finally:
             self._sub.close()
 
+    def _record_batch(self, traces: List[RequestTrace]):
+        for trace in traces:
+            self._record(trace)
+
     def _record(self, service_request: RequestTrace):
         raise NotImplementedError
 
 
 class RedisTraceRecorder(TraceRecorder):
 
-    def __init__(self, rds, exp_id: str, writer: TraceWriter, flush_every=36) -> None:
+    def __init__(self, rds, exp_id: str, writer: TraceWriter, flush_every=36,
+                 flush_policy: FlushPolicy = None, spool: Spool = None) -> None:
         super().__init__(rds)
         self.exp_id = exp_id
         self.writer = writer
-        self.buffer = list()
 
-        self.flush_every = flush_every
-        self.i = 0
+        fallback = functools.partial(spool.append, 'traces') if spool else None
+        self.buffer = FlushBuffer(self.writer.write, flush_policy or FlushPolicy.from_env(flush_every), fallback)
 
     def run(self):
         try:
             logger.debug('starting RedisTraceRecorder for experiment %s', self.exp_id)
+            self.buffer.start_timer()
             super().run()
         finally:
             logger.debug('closing RedisTraceRecorder for experiment %s', self.exp_id)
+            self.buffer.stop_timer()
             self._flush()
 
+    def _record_batch(self, traces: List[RequestTrace]):
+        exp_id = self.exp_id
+        self.buffer.extend([t._replace(exp_id=exp_id) for t in traces])
+
     def _record(self, t: RequestTrace):
         t = t._replace(exp_id=self.exp_id)
         self.buffer.append(t)
 
-        self.i = (self.i + 1) % self.flush_every
-        if self.i == 0:
-            self._flush()
-
     def _flush(self):
-        self.writer.write(self.buffer)
-        self.buffer.clear()
+        self.buffer.flush()
+
+
+def _raw_client(rds):
+    """
+    Returns a client that shares the connection settings of the given one, but does not decode responses, as binary
+    trace messages are not valid UTF-8.
+    """
+    pool = rds.connection_pool
+    if not pool.connection_kwargs.get('decode_responses'):
+        return rds
+
+    kwargs = dict(pool.connection_kwargs, decode_responses=False)
+    return redis.Redis(connection_pool=redis.ConnectionPool(connection_class=pool.connection_class, **kwargs))
 
 
 class TracesSubscriber:
-    def __init__(self, rds, channel=None) -> None:
+    """
+    Subscribes to the traces published by RedisTraceReporters. Both CSV lines and binary messages (of one or many
+    traces) are accepted, and unless `announce` is False, the subscriber announces the latest version of binary
+    messages it reads while it is subscribed, so reporters using the 'auto' protocol switch to it. The announcement
+    expires after `announce_ttl` seconds, and is refreshed well before that, so that subscribers that died without
+    withdrawing it hold back the reporters only for a short time.
+    """
+
+    def __init__(self, rds, channel=None, announce=True, announce_ttl: float = 30) -> None:
         super().__init__()
         self.rds = rds
         self.channel = channel or RedisTraceReporter.channel
         self.line_format = RedisTraceReporter.line_format
+        self.announce = announce
+        self.announce_ttl = announce_ttl
+        self.subscriber_id = uuid.uuid4().hex
         self.pubsub = None
 
     def run(self) -> Iterator[RequestTrace]:
-        self.pubsub = self.rds.pubsub()
+        for traces in self.run_batches():
+            yield from traces
+
+    def run_batches(self) -> Iterator[List[RequestTrace]]:
+        """
+        Like run(), but yields the traces of each message as one list.
+        """
+        raw = _raw_client(self.rds)
+        self.pubsub = raw.pubsub()
+
+        refresh_interval = self.announce_ttl / 3
+        refresh = 0
 
         try:
             self.pubsub.subscribe(self.channel)
 
-            for item in self.pubsub.listen():
+            while self.pubsub.subscribed:
+                if self.announce and time.monotonic() >= refresh:
+                    announce_wire_version(self.rds, self.subscriber_id, self.announce_ttl)
+                    refresh = time.monotonic() + refresh_interval
+
+                # unlike listen(), wakes up in time to refresh the announcement
+                item = self.pubsub.get_message(timeout=refresh_interval)
+                if item is None:
+                    continue
                 data = item['data']
                 if type(data) == int:
                     continue
                 try:
-                    yield self.parse(data)
+                    yield self.decode_batch(data)
                 except Exception as e:
                     logger.error('error parsing data string `%s`: %s', data, e)
         finally:
+            if self.announce:
+                try:
+                    withdraw_wire_version(self.rds, self.subscriber_id)
+                except redis.RedisError as e:
+                    logger.warning('could not withdraw protocol announcement: %s', e)
             self.pubsub.close()
+            if raw is not self.rds:
+                raw.connection_pool.disconnect()
 
     def close(self):
         if self.pubsub:
             self.pubsub.unsubscribe()
 
+    @classmethod
+    def decode_batch(cls, data) -> List[RequestTrace]:
+        """
+        Decodes a message of one or many traces, which is either a binary message or a CSV line (as str or bytes).
+        """
+        if is_binary_message(data):
+            return decode_traces(data)
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        return [cls.parse(data)]
+
+    @classmethod
+    def decode(cls, data) -> RequestTrace:
+        """
+        Decodes a message that is either a binary message or a CSV line (as str or bytes).
+        """
+        if is_binary_message(data):
+            return decode_trace(data)
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        return cls.parse(data)
+
     @staticmethod
     def parse(line: str) -> RequestTrace:
         # FIXME: this is turning into a bad line-based protocol ...
@@ -0,0 +1,63 @@
+"""
+Reporters that append traces and events to Redis streams instead of publishing them into pub/sub channels. Entries
+in a stream remain until they are trimmed, so recorders that pause (e.g., during a slow database write) or restart
+do not lose data, and several recorders can share the load as a consumer group (see galileodb.recorder.streams).
+Streams are capped at roughly `maxlen` entries.
+"""
+import os
+from typing import Iterable
+
+from galileodb.model import RequestTrace, Event
+from galileodb.reporter.traces import encode_trace
+
+TRACES_STREAM = 'galileo/results/traces/stream'
+EVENTS_STREAM = 'galileo/events/stream'
+
+
+def stream_maxlen_from_env() -> int:
+    return int(os.getenv('galileo_expdb_stream_maxlen', '100000'))
+
+
+class RedisStreamTraceReporter:
+    """
+    Appends traces as binary messages (see galileodb.reporter.traces.encode_trace) to a Redis stream.
+    """
+
+    def __init__(self, rds, stream: str = TRACES_STREAM, maxlen: int = None) -> None:
+        """
+        :param rds: the Redis client
+        :param stream: the key of the stream
+        :param maxlen: the approximate maximum number of entries in the stream (defaults to galileo_expdb_stream_maxlen)
+        """
+        super().__init__()
+        self.rds = rds
+        self.stream = stream
+        self.maxlen = maxlen if maxlen is not None else stream_maxlen_from_env()
+
+    def report_multiple(self, traces: Iterable[RequestTrace]):
+        rds = self.rds.pipeline(transaction=False)
+        stream = self.stream
+        maxlen = self.maxlen
+
+        for t in traces:
+            rds.xadd(stream, {'t': encode_trace(t)}, maxlen=maxlen, approximate=True)
+
+        rds.execute()
+
+
+class RedisStreamEventReporter:
+    """
+    Appends events to a Redis stream, with the fields timestamp, name and (unless it is None) value.
+    """
+
+    def __init__(self, rds, stream: str = EVENTS_STREAM, maxlen: int = None) -> None:
+        self.rds = rds
+        self.stream = stream
+        self.maxlen = maxlen if maxlen is not None else stream_maxlen_from_env()
+
+    def report(self, event: Event):
+        fields = {'timestamp': event.timestamp, 'name': event.name}
+        if event.value is not None:
+            fields['value'] = event.value
+
+        self.rds.xadd(self.stream, fields, maxlen=self.maxlen, approximate=True)
@@ -1,23 +1,275 @@
-from typing import Iterable
+import os
+import struct
+import time
+from typing import Iterable, List
 
 from galileodb.model import RequestTrace
 
+PROTOCOL_CSV = 'csv'
+PROTOCOL_BINARY = 'binary'
+PROTOCOL_BATCH = 'batch'
+PROTOCOL_AUTO = 'auto'
+PROTOCOLS = (PROTOCOL_CSV, PROTOCOL_BINARY, PROTOCOL_BATCH, PROTOCOL_AUTO)
+
+# binary messages start with a byte that no CSV line starts with, followed by the version of the encoding
+WIRE_MAGIC = 0
+WIRE_TRACE = 1  # a message of one trace
+WIRE_BATCH = 2  # a message of many traces
+WIRE_VERSION = WIRE_BATCH  # the latest version, which subscribers announce
+
+_wire_header = bytes([WIRE_MAGIC, WIRE_TRACE])
+# header, created, sent, done, status, followed by the lengths (in characters) of the string fields, -1 for None
+_wire_trace = struct.Struct('<BBdddi7i')
+# header and the number of traces, followed by the fields of each trace as _wire_record, followed by all strings
+_wire_batch = struct.Struct('<BBI')
+_wire_record = struct.Struct('<dddi7i')
+
+
+def encode_trace(t: RequestTrace) -> bytes:
+    """
+    Encodes a trace into a binary message: a struct of the header (magic byte and version), the numeric fields and the
+    lengths of the strings, followed by the strings as one UTF-8 encoded text. Unlike the CSV lines, the strings are
+    not escaped, so any characters in headers or responses round-trip as is.
+    """
+    # unrolled, as this is called for every trace a client sends
+    r, c, sv, created, sent, done, status, server, e, h, resp = t
+    return _wire_trace.pack(
+        WIRE_MAGIC, WIRE_TRACE, created, sent, done, status,
+        len(r) if r is not None else -1, len(c) if c is not None else -1, len(sv) if sv is not None else -1,
+        len(server) if server is not None else -1, len(e) if e is not None else -1, len(h) if h is not None else -1,
+        len(resp) if resp is not None else -1
+    ) + ''.join([s for s in (r, c, sv, server, e, h, resp) if s]).encode('utf-8', 'surrogatepass')
+
+
+def is_binary_message(data) -> bool:
+    return isinstance(data, bytes) and data[:1] == _wire_header[:1]
+
+
+def decode_trace(data: bytes) -> RequestTrace:
+    """
+    Decodes a binary message created by encode_trace.
+
+    :raises ValueError: if the data is not a binary message of a known version, or is truncated
+    """
+    if data[:2] != _wire_header:
+        raise ValueError('not a binary trace message of version %d' % WIRE_TRACE)
+    if len(data) < _wire_trace.size:
+        raise ValueError('trace message has %d bytes, expected at least %d' % (len(data), _wire_trace.size))
+
+    _, _, created, sent, done, status, *lengths = _wire_trace.unpack_from(data)
+    text = data[_wire_trace.size:].decode('utf-8', 'surrogatepass')
+
+    strings = list()
+    i = 0
+    for n in lengths:
+        if n < 0:
+            strings.append(None)
+        else:
+            strings.append(text[i:i + n])
+            i += n
+
+    if i != len(text):
+        raise ValueError('trace message has %d characters of strings, expected %d' % (len(text), i))
+
+    request_id, client, service, server, exp_id, headers, response = strings
+    # skips the argument handling of RequestTrace(...), which is a sizable part of decoding
+    return tuple.__new__(RequestTrace, (request_id, client, service, created, sent, done, status, server, exp_id,
+                                        headers, response))
+
+
+def encode_traces(traces: List[RequestTrace]) -> bytes:
+    """
+    Encodes traces into one binary message. The message has the same layout as that of encode_trace, except that the
+    header holds the number of traces and is followed by the numeric fields and string lengths of each trace, and then
+    the strings of all traces as one UTF-8 encoded text.
+    """
+    records = list()
+    strings = list()
+    pack = _wire_record.pack
+    for r, c, sv, created, sent, done, status, server, e, h, resp in traces:
+        records.append(pack(
+            created, sent, done, status,
+            len(r) if r is not None else -1, len(c) if c is not None else -1, len(sv) if sv is not None else -1,
+            len(server) if server is not None else -1, len(e) if e is not None else -1,
+            len(h) if h is not None else -1, len(resp) if resp is not None else -1
+        ))
+        strings += [s for s in (r, c, sv, server, e, h, resp) if s]
+
+    return b''.join([
+        _wire_batch.pack(WIRE_MAGIC, WIRE_BATCH, len(records)),
+        *records,
+        ''.join(strings).encode('utf-8', 'surrogatepass')
+    ])
+
+
+def decode_traces(data: bytes) -> List[RequestTrace]:
+    """
+    Decodes a binary message created by encode_traces or encode_trace.
+
+    :raises ValueError: if the data is not a binary message of a known version, or is truncated
+    """
+    if data[:2] == _wire_header:
+        return [decode_trace(data)]
+    if data[:2] != bytes([WIRE_MAGIC, WIRE_BATCH]):
+        raise ValueError('not a binary trace message of version %d or %d' % (WIRE_TRACE, WIRE_BATCH))
+
+    _, _, n = _wire_batch.unpack_from(data)
+    end = _wire_batch.size + n * _wire_record.size
+    if len(data) < end:
+        raise ValueError('trace message has %d bytes, expected at least %d' % (len(data), end))
+
+    text = data[end:].decode('utf-8', 'surrogatepass')
+    new = tuple.__new__
+
+    traces = list()
+    i = 0
+    for created, sent, done, status, *lengths in _wire_record.iter_unpack(memoryview(data)[_wire_batch.size:end]):
+        strings = list()
+        for length in lengths:
+            if length < 0:
+                strings.append(None)
+            else:
+                strings.append(text[i:i + length])
+                i += length
+
+        request_id, client, service, server, exp_id, headers, response = strings
+        traces.append(new(RequestTrace, (request_id, client, service, created, sent, done, status, server, exp_id,
+                                         headers, response)))
+
+    if i != len(text):
+        raise ValueError('trace message has %d characters of strings, expected %d' % (len(text), i))
+
+    return traces
+
+
+def encoded_size(t: RequestTrace) -> int:
+    """
+    Estimates the size of a trace in a message created by encode_traces (exact for ASCII strings).
+    """
+    return _wire_record.size + sum([len(s) for s in (t.request_id, t.client, t.service, t.server, t.exp_id, t.headers,
+                                                     t.response) if s])
+
 
 class RedisTraceReporter:
+    """
+    Publishes traces into a Redis channel, either as CSV lines or binary messages of one trace (see encode_trace), one
+    message per trace, or as binary messages of many traces (see encode_traces), one message per up to
+    `max_batch_bytes` of encoded traces. With the protocol 'auto', the reporter uses the latest protocol the
+    subscribers announced they can read (see TracesSubscriber), so old recorders keep receiving CSV lines. Each
+    subscriber announces its version under a key of its own that expires unless the subscriber refreshes it, and the
+    reporter uses the lowest version of all live subscribers (see announced_wire_version). Subscribers that never
+    announce a version still need CSV lines, so unless every subscriber of the channel has a live announcement, the
+    reporter falls back to CSV. The announcements are looked up again every `negotiate_interval` seconds, or as soon as
+    the number of subscribers that received the published messages changes.
+    """
     channel = 'galileo/results/traces'
+    protocol_key = 'galileo/results/traces/protocol'
     line_format = '%s,%s,%s,%.7f,%.7f,%.7f,%d,%s,%s,%s,%s'
 
-    def __init__(self, rds) -> None:
+    def __init__(self, rds, protocol: str = None, negotiate_interval: float = 30,
+                 max_batch_bytes: int = None) -> None:
+        """
+        :param rds: the Redis client
+        :param protocol: csv, binary, batch or auto (defaults to the env variable galileo_expdb_trace_protocol, or auto)
+        :param negotiate_interval: the seconds after which the versions announced by the subscribers are looked up again
+        :param max_batch_bytes: the approximate maximum size of a batch message (defaults to the env variable
+                                galileo_expdb_trace_batch_bytes, or 64 KiB)
+        """
         super().__init__()
         self.rds = rds
 
+        if protocol is None:
+            protocol = os.getenv('galileo_expdb_trace_protocol', PROTOCOL_AUTO)
+        if protocol not in PROTOCOLS:
+            raise ValueError('unknown trace protocol %s, expected one of %s' % (protocol, ', '.join(PROTOCOLS)))
+        self.protocol = protocol
+        self.negotiate_interval = negotiate_interval
+
+        if max_batch_bytes is None:
+            max_batch_bytes = int(os.getenv('galileo_expdb_trace_batch_bytes', str(64 * 1024)))
+        self.max_batch_bytes = max_batch_bytes
+
+        self._negotiated = None
+        self._negotiated_expires = 0
+        self._receivers = None
+
+    def negotiated_protocol(self) -> str:
+        """
+        Returns the protocol the traces are currently sent with (csv, binary or batch).
+        """
+        if self.protocol != PROTOCOL_AUTO:
+            return self.protocol
+
+        now = time.monotonic()
+        if now >= self._negotiated_expires:
+            version = announced_wire_version(self.rds, self.channel)
+            if version >= WIRE_BATCH:
+                self._negotiated = PROTOCOL_BATCH
+            elif version >= WIRE_TRACE:
+                self._negotiated = PROTOCOL_BINARY
+            else:
+                self._negotiated = PROTOCOL_CSV
+            self._negotiated_expires = now + self.negotiate_interval
+
+        return self._negotiated
+
+    def _received(self, receivers: List[int]):
+        """
+        Takes the number of subscribers each message was published to, and negotiates the protocol again with the next
+        report if it changed, e.g., because a recorder that announced a version left, or one that did not joined.
+        """
+        if not receivers:
+            return
+        if self._receivers is not None and any(n != self._receivers for n in receivers):
+            self._negotiated_expires = 0
+        self._receivers = receivers[-1]
+
     def report_multiple(self, traces: Iterable[RequestTrace]):
+        protocol = self.negotiated_protocol()
+        if protocol == PROTOCOL_BATCH:
+            self._report_batches(traces)
+        elif protocol == PROTOCOL_BINARY:
+            self._report_binary(traces)
+        else:
+            self._report_csv(traces)
+
+    def _report_batches(self, traces: Iterable[RequestTrace]):
+        rds = self.rds.pipeline()
+        key = self.channel
+        max_bytes = self.max_batch_bytes
+
+        batch = list()
+        size = 0
+        for t in traces:
+            n = encoded_size(t)
+            if batch and size + n > max_bytes:
+                rds.publish(key, encode_traces(batch))
+                batch = list()
+                size = 0
+            batch.append(t)
+            size += n
+
+        if batch:
+            rds.publish(key, encode_traces(batch))
+
+        self._received(rds.execute())
+
+    def _report_binary(self, traces: Iterable[RequestTrace]):
+        rds = self.rds.pipeline()
+        key = self.channel
+
+        for t in traces:
+            rds.publish(key, encode_trace(t))
+
+        self._received(rds.execute())
+
+    def _report_csv(self, traces: Iterable[RequestTrace]):
         rds = self.rds.pipeline()
         key = self.channel
         fmt = self.line_format
 
         for t in traces:
-            # FIXME: this is turning into a bad line-based protocol ...
+            # the line-based protocol of old clients, see encode_trace for the binary one
             response = t.response
             if response:
                 response = response.replace('\n', '\\n')
@@ -41,4 +293,44 @@ class RedisTraceReporter:
             )
             rds.publish(key, value)
 
-        rds.execute()
+        self._received(rds.execute())
+
+
+def announce_wire_version(rds, subscriber_id: str, ttl: float, version: int = WIRE_VERSION):
+    """
+    Announces the version of binary messages a subscriber reads, for `ttl` seconds.
+    """
+    rds.set('%s/%s' % (RedisTraceReporter.protocol_key, subscriber_id), version, px=int(ttl * 1000))
+
+
+def withdraw_wire_version(rds, subscriber_id: str):
+    rds.delete('%s/%s' % (RedisTraceReporter.protocol_key, subscriber_id))
+
+
+def announced_wire_version(rds, channel: str = None) -> int:
+    """
+    Returns the lowest version of binary messages announced by the live subscribers, which all of them can read, or 0
+    (CSV lines) if no subscriber announced a version. If a channel is given, this is also 0 unless the number of live
+    announcements matches the number of subscribers of the channel, as subscribers that do not announce a version
+    only read CSV lines.
+    """
+    keys = list(rds.scan_iter(match=RedisTraceReporter.protocol_key + '/*'))
+    if not keys:
+        return 0
+
+    versions = list()
+    for value in rds.mget(keys):
+        if value is None:
+            # expired since the scan
+            continue
+        try:
+            versions.append(int(value))
+        except ValueError:
+            versions.append(0)
+
+    if channel is not None:
+        subscribers = sum(n for _, n in rds.pubsub_numsub(channel))
+        if subscribers != len(versions):
+            return 0
+
+    return min(versions, default=0)
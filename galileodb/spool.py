@@ -0,0 +1,306 @@
+"""
+A durable local spool for batches of records that could not be written to the experiment database. Each stream
+(telemetry, traces, events) is a directory of append-only segment files, which hold length-prefixed pickled batches.
+A process appends to a segment of its own (``<time>-<pid>.open``), which is sealed (renamed to ``.seg``) when it
+reaches the segment size, or when the spool is sealed or closed. The appending process holds an exclusive flock on its
+open segment, so an open segment that is not locked was abandoned by a process that crashed (even if a new process
+got the same pid, as is common in containers). Sealed and abandoned segments can be replayed into the database,
+either by a SpoolReplayer in the background, or with ``galileodb-ctl spool replay`` after a crash. A replayer claims a
+segment by locking it and renaming it to ``<time>-<pid>.<replayer>.replaying``, so that several replayers can share a
+spool directory without writing a segment twice.
+"""
+import fcntl
+import logging
+import os
+import pickle
+import struct
+import threading
+import time
+from typing import List, Dict, Callable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+_header = struct.Struct('>I')
+
+
+def database_writers(db) -> Dict[str, Callable[[List], None]]:
+    """
+    Returns the functions that write the records of each spool stream into the given ExperimentDatabase.
+    """
+    return {
+        'telemetry': db.save_telemetry,
+        'traces': db.save_traces,
+        'events': db.save_events,
+    }
+
+
+def _try_lock(fd) -> bool:
+    try:
+        fcntl.flock(fd.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+
+def _abandoned(path: str) -> bool:
+    # flock locks belong to the open file, so this also detects the locks held by this process
+    try:
+        with open(path, 'rb') as fd:
+            return _try_lock(fd)
+    except FileNotFoundError:
+        return False
+
+
+class Spool:
+
+    def __init__(self, directory: str, segment_size: int = 16 * 1024 * 1024, fsync=False) -> None:
+        """
+        :param directory: the spool directory
+        :param segment_size: the size in bytes after which a segment is sealed and a new one is started
+        :param fsync: whether to fsync each appended batch (otherwise batches survive a process crash, but not
+                      necessarily a power loss)
+        """
+        super().__init__()
+        self.directory = directory
+        self.segment_size = segment_size
+        self.fsync = fsync
+
+        self._files = dict()
+        self._pid = os.getpid()
+        self._lock = threading.RLock()
+
+    def _stream_dir(self, stream: str) -> str:
+        return os.path.join(self.directory, stream)
+
+    def _file(self, stream: str):
+        if self._pid != os.getpid():
+            # handles inherited from the parent process belong to the parent's segments
+            self._files = dict()
+            self._pid = os.getpid()
+
+        fd = self._files.get(stream)
+        if fd is None:
+            stream_dir = self._stream_dir(stream)
+            os.makedirs(stream_dir, exist_ok=True)
+            path = os.path.join(stream_dir, '%020d-%d.open' % (time.time_ns(), os.getpid()))
+            fd = open(path, 'ab', buffering=0)
+            fcntl.flock(fd.fileno(), fcntl.LOCK_EX)
+            self._files[stream] = fd
+        return fd
+
+    def append(self, stream: str, records: List):
+        """
+        Appends a batch of records to the stream.
+        """
+        data = pickle.dumps(list(records), protocol=pickle.HIGHEST_PROTOCOL)
+
+        with self._lock:
+            fd = self._file(stream)
+            # a single write per frame, so concurrent appends never interleave
+            fd.write(_header.pack(len(data)) + data)
+            if self.fsync:
+                os.fsync(fd.fileno())
+
+            if fd.tell() >= self.segment_size:
+                self._seal(stream)
+
+        logger.debug('spooled %d %s records', len(records), stream)
+
+    def _seal(self, stream: str):
+        fd = self._files.pop(stream, None)
+        if fd is None:
+            return
+        # renamed while still locked, so the segment is never mistaken for an abandoned one
+        os.rename(fd.name, fd.name[:-len('.open')] + '.seg')
+        fd.close()
+
+    def seal(self, stream: str = None):
+        """
+        Seals the segments this process is appending to, so that they can be replayed.
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            for name in ([stream] if stream else list(self._files.keys())):
+                self._seal(name)
+
+    def close(self):
+        self.seal()
+
+    def streams(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory) if os.path.isdir(self._stream_dir(name)))
+
+    def segments(self, stream: str) -> List[str]:
+        """
+        Returns the paths of the replayable segments of the stream in the order they were written: sealed segments,
+        and open or replaying segments that no process holds a lock on anymore.
+        """
+        stream_dir = self._stream_dir(stream)
+        if not os.path.isdir(stream_dir):
+            return []
+
+        segments = list()
+        for name in sorted(os.listdir(stream_dir)):
+            if name.endswith('.seg'):
+                segments.append(os.path.join(stream_dir, name))
+            elif name.endswith(('.open', '.replaying')) and _abandoned(os.path.join(stream_dir, name)):
+                segments.append(os.path.join(stream_dir, name))
+
+        return segments
+
+    def pending(self, stream: str = None) -> bool:
+        with self._lock:
+            if self._pid == os.getpid() and (stream in self._files if stream else self._files):
+                return True
+
+        streams = [stream] if stream else self.streams()
+        return any(self.segments(s) for s in streams)
+
+    @staticmethod
+    def read_segment(path: str) -> Iterator[List]:
+        """
+        Reads the batches of a segment. A batch that was cut off by a crash is skipped.
+        """
+        with open(path, 'rb') as fd:
+            while True:
+                header = fd.read(_header.size)
+                if not header:
+                    return
+
+                if len(header) == _header.size:
+                    length, = _header.unpack(header)
+                    data = fd.read(length)
+                    if len(data) == length:
+                        yield pickle.loads(data)
+                        continue
+
+                logger.warning('skipping incomplete batch at the end of %s', path)
+                return
+
+    @staticmethod
+    def _claim(path: str):
+        """
+        Claims a segment for replaying. The lock is taken before the segment is renamed, so only one replayer can
+        rename it, and the lock is held until the replayer is done with it.
+
+        :return: the locked file and the path it was renamed to, or None if another replayer claimed it
+        """
+        try:
+            fd = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+
+        try:
+            # the segment might have been renamed (or removed) by another replayer between listing and opening it
+            if _try_lock(fd) and os.stat(path).st_ino == os.fstat(fd.fileno()).st_ino:
+                stem = os.path.basename(path).split('.')[0]
+                claimed = os.path.join(os.path.dirname(path),
+                                       '%s.%d-%d.replaying' % (stem, os.getpid(), threading.get_ident()))
+                os.rename(path, claimed)
+                return fd, claimed
+        except FileNotFoundError:
+            pass
+
+        fd.close()
+        return None
+
+    @staticmethod
+    def _rewrite(path: str, batches: List[List]):
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as fd:
+            for batch in batches:
+                data = pickle.dumps(batch, protocol=pickle.HIGHEST_PROTOCOL)
+                fd.write(_header.pack(len(data)) + data)
+        os.replace(tmp, path)
+
+    def replay(self, stream: str, write: Callable[[List], None]) -> int:
+        """
+        Passes the spooled batches of the stream to `write`, and removes each segment once all its batches have been
+        written. If a write fails, the segment is rewritten with the remaining batches and the exception is raised.
+
+        :return: the number of replayed records
+        """
+        self.seal(stream)
+
+        replayed = 0
+        for path in self.segments(stream):
+            claim = self._claim(path)
+            if claim is None:
+                logger.debug('spool segment %s was claimed by another replayer', path)
+                continue
+
+            fd, claimed = claim
+            try:
+                batches = list(self.read_segment(claimed))
+                for i, batch in enumerate(batches):
+                    try:
+                        write(batch)
+                    except Exception:
+                        # release the segment with the remaining batches
+                        sealed = os.path.join(os.path.dirname(path), os.path.basename(path).split('.')[0] + '.seg')
+                        if i > 0:
+                            self._rewrite(sealed, batches[i:])
+                            os.remove(claimed)
+                        else:
+                            os.rename(claimed, sealed)
+                        raise
+                    replayed += len(batch)
+
+                os.remove(claimed)
+            finally:
+                fd.close()
+
+            logger.info('replayed spool segment %s', path)
+
+        return replayed
+
+
+class SpoolReplayer(threading.Thread):
+    """
+    Periodically replays the spool into the database. While the database keeps failing, the time between attempts
+    grows exponentially up to `max_backoff` seconds.
+    """
+
+    def __init__(self, spool: Spool, writers: Dict[str, Callable[[List], None]], interval: float = 5,
+                 max_backoff: float = 300) -> None:
+        super().__init__(name='spool-replayer', daemon=True)
+        self.spool = spool
+        self.writers = writers
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self._stopped = threading.Event()
+
+    def stop(self, timeout=None):
+        self._stopped.set()
+        self.join(timeout)
+
+    def replay(self) -> Optional[int]:
+        """
+        Replays all streams once.
+
+        :return: the number of replayed records, or None if a write failed
+        """
+        replayed = 0
+        try:
+            for stream, write in self.writers.items():
+                replayed += self.spool.replay(stream, write)
+        except Exception as e:
+            logger.warning('error replaying spool: %s', e)
+            return None
+
+        if replayed:
+            logger.info('replayed %d spooled records', replayed)
+        return replayed
+
+    def run(self):
+        delay = self.interval
+        while not self._stopped.wait(delay):
+            if not self.spool.pending():
+                continue
+
+            if self.replay() is None:
+                delay = min(delay * 2, self.max_backoff)
+            else:
+                delay = self.interval
@@ -1,40 +1,93 @@
 import abc
+import contextlib
 import json
 import logging
 import os
 import threading
-from typing import Tuple, List, Dict, Optional
+from typing import Tuple, List, Dict, Optional, Iterator, Callable
 
-from galileodb.db import ExperimentDatabase
-from galileodb.model import Experiment, Telemetry, RequestTrace, NodeInfo, ExperimentEvent
+from galileodb.db import ExperimentDatabase, experiments_changed
+from galileodb.model import Experiment, Telemetry, RequestTrace, NodeInfo, ExperimentEvent, ResampledTelemetry, \
+    TELEMETRY_AGGREGATES
 
 logger = logging.getLogger(__name__)
 
 
 class SqlAdapter(abc.ABC):
     placeholder = '?'
+    fetch_size = 1000
 
-    _thread_local = threading.local()
+    pool_size = 8
+    pool_timeout = 30
+    ping_interval = 30
 
     def __init__(self, *args, **kwargs) -> None:
         super().__init__()
-        self._thread_local.connection = None
+        self._thread_local = threading.local()
         self.connect_args = args
         self.connect_kwargs = kwargs
         self._lock = threading.RLock()
+        self._pool = None
+
+        self.group_commit_delay: Optional[float] = None
+        self.group_commit_size = 1000
+        self._group_committer = None
+        self._group_committer_pid = None
+
+    @property
+    def pool(self) -> 'ConnectionPool':
+        pool = self._pool
+        if pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = self._create_pool()
+                pool = self._pool
+        return pool
+
+    def _create_pool(self) -> 'ConnectionPool':
+        from galileodb.sql.pool import ConnectionPool
+        return ConnectionPool(self._new_connection, self.pool_size, self.pool_timeout, self._ping, self.ping_interval)
+
+    def _new_connection(self):
+        logger.info('%s connecting to database', threading.current_thread().name)
+        return self._connect(*self.connect_args, **self.connect_kwargs)
+
+    def _ping(self, connection) -> bool:
+        cur = connection.cursor()
+        try:
+            cur.execute('SELECT 1')
+            cur.fetchall()
+            return True
+        finally:
+            cur.close()
+
+    def _local(self, name: str):
+        # thread locals are inherited by the forking thread of a multiprocessing child, but its connections are not
+        # usable there
+        value = getattr(self._thread_local, name, None)
+        if value is None:
+            return None
+        pid, value = value
+        if pid != os.getpid():
+            setattr(self._thread_local, name, None)
+            return None
+        return value
 
     @property
     def connection(self):
-        with self._lock:
-            if 'connection' not in self._thread_local.__dict__ or self._thread_local.connection is None:
-                logger.info('%s connecting to database', threading.current_thread().name)
-                self._thread_local.connection = self._connect(*self.connect_args, **self.connect_kwargs)
-            return self._thread_local.connection
+        """
+        Returns the connection of the current transaction, or otherwise a connection that is dedicated to the current
+        thread until close is called. Prefer the execute and fetch methods, which use pooled connections.
+        """
+        connection = self._local('transaction') or self._local('connection')
+        if connection is None:
+            connection = self._new_connection()
+            self._thread_local.connection = (os.getpid(), connection)
+        return connection
 
     def reconnect(self):
-        with self._lock:
-            self.close()
-            self.open()
+        self._close_connection()
+        self.open()
 
     @property
     def db(self):
@@ -43,66 +96,240 @@ class SqlAdapter(abc.ABC):
     def cursor(self):
         return self.db.cursor()
 
-    def execute(self, *args, **kwargs):
-        cur = self.cursor()
+    @contextlib.contextmanager
+    def checkout(self):
+        """
+        Returns a context manager that provides a connection: the one of the current transaction, or one from the
+        pool, which is returned when the block exits.
+        """
+        connection = self._local('transaction')
+        if connection is not None:
+            yield connection
+            return
+
+        with self.pool.connection() as connection:
+            yield connection
+
+    @contextlib.contextmanager
+    def _cursor(self, commit=False):
+        connection = self._local('transaction')
+        if connection is not None:
+            cur = connection.cursor()
+            try:
+                yield cur
+            finally:
+                cur.close()
+            return
+
+        pool = self.pool
+        connection = pool.checkout()
+        discard = False
+        try:
+            cur = connection.cursor()
+            try:
+                yield cur
+                if commit:
+                    connection.commit()
+            except BaseException:
+                # do not hand a connection with a half-done transaction to the next caller
+                try:
+                    connection.rollback()
+                except Exception:
+                    discard = True
+                raise
+            finally:
+                cur.close()
+        finally:
+            pool.checkin(connection, discard)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Returns a context manager that executes all statements the current thread issues within the block in a single
+        transaction, which is committed when the block exits, or rolled back if it raises. Transactions can be nested,
+        in which case only the outermost block commits. The transaction holds on to one pooled connection. Side effects
+        outside the database can be tied to the commit with after_commit.
+        """
+        if self._local('transaction') is not None:
+            yield self
+            return
+
+        pool = self.pool
+        connection = pool.checkout()
+        discard = True
+        callbacks = list()
         try:
+            self._begin(connection)
+            self._thread_local.transaction = (os.getpid(), connection)
+            self._thread_local.after_commit = callbacks
+            try:
+                yield self
+            except BaseException:
+                connection.rollback()
+                raise
+            else:
+                connection.commit()
+            discard = False
+        finally:
+            self._thread_local.transaction = None
+            self._thread_local.after_commit = None
+            pool.checkin(connection, discard)
+
+        self._run_callbacks(callbacks)
+
+    def in_transaction(self) -> bool:
+        return self._local('transaction') is not None
+
+    def after_commit(self, callback: Callable[[], None]):
+        """
+        Calls the callback once the transaction of the current thread has been committed (it is not called if the
+        transaction is rolled back), or right away outside of a transaction. This is meant for side effects outside
+        the database that must not happen unless the transaction's changes do.
+        """
+        if not self.in_transaction():
+            callback()
+            return
+        self._thread_local.after_commit.append(callback)
+
+    @staticmethod
+    def _run_callbacks(callbacks: List[Callable[[], None]]):
+        error = None
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                if error is not None:
+                    logger.exception('error in after commit callback')
+                    continue
+                error = e
+        if error is not None:
+            raise error
+
+    def _begin(self, connection):
+        """
+        Starts a transaction on the given connection. Drivers that do not begin transactions implicitly (i.e., that
+        run in autocommit mode) have to override this.
+        """
+        pass
+
+    def enable_group_commit(self, delay: float = 0.002, max_size: int = 1000):
+        """
+        Enables group commit: statements passed to execute and executemany outside an explicit transaction are
+        executed by a dedicated committer thread, which commits all statements that arrive within `delay` seconds
+        in one transaction. The caller still blocks until its statement has been committed.
+
+        :param delay: the time in seconds the committer waits for further statements before committing (with 0,
+                      a group consists of the statements that queued up while the previous group was committed)
+        :param max_size: the maximum number of statements committed at once
+        """
+        with self._lock:
+            self._stop_group_commit()
+            self.group_commit_delay = delay
+            self.group_commit_size = max_size
+
+    def disable_group_commit(self):
+        with self._lock:
+            self._stop_group_commit()
+            self.group_commit_delay = None
+
+    def _group_commit(self):
+        if self.group_commit_delay is None or self.in_transaction():
+            return None
+
+        with self._lock:
+            if self._group_committer is None or self._group_committer_pid != os.getpid():
+                from galileodb.sql.groupcommit import GroupCommitter
+
+                # a committer inherited from a parent process has no thread in this process
+                self._group_committer = GroupCommitter(self, self.group_commit_delay, self.group_commit_size)
+                self._group_committer_pid = os.getpid()
+                self._group_committer.start()
+
+            return self._group_committer
+
+    def _stop_group_commit(self):
+        if self._group_committer is not None and self._group_committer_pid == os.getpid():
+            self._group_committer.close()
+        self._group_committer = None
+
+    def execute(self, *args, **kwargs):
+        committer = self._group_commit()
+        if committer:
+            return committer.submit('execute', args, kwargs)
+
+        with self._cursor(commit=True) as cur:
             logger.debug('executing SQL %s %s', args, kwargs)
             cur.execute(*args, **kwargs)
-            self.db.commit()
-        finally:
-            cur.close()
+            return cur.rowcount
 
     def executemany(self, *args, **kwargs):
-        cur = self.cursor()
-        try:
+        committer = self._group_commit()
+        if committer:
+            committer.submit('executemany', args, kwargs)
+            return
+
+        with self._cursor(commit=True) as cur:
             cur.executemany(*args, **kwargs)
-            self.db.commit()
-        finally:
-            cur.close()
 
     def executescript(self, *args, **kwargs):
-        cur = self.cursor()
-        try:
+        with self._cursor(commit=True) as cur:
             cur.executescript(*args, **kwargs)
-            self.db.commit()
-        finally:
-            cur.close()
 
     def fetchone(self, *args, **kwargs):
-        cur = self.cursor()
-        try:
+        with self._cursor() as cur:
             cur.execute(*args, **kwargs)
             return cur.fetchone()
-        finally:
-            cur.close()
 
     def fetchmany(self, *args, **kwargs):
-        cur = self.cursor()
-        try:
+        with self._cursor() as cur:
             cur.execute(*args, **kwargs)
             return cur.fetchmany()
-        finally:
-            cur.close()
 
     def fetchall(self, *args, **kwargs):
-        cur = self.cursor()
-        try:
+        with self._cursor() as cur:
             cur.execute(*args, **kwargs)
             return cur.fetchall()
-        finally:
-            cur.close()
+
+    def fetchiter(self, *args, size: int = None, **kwargs) -> Iterator[List]:
+        """
+        Executes the query and yields the result in chunks of rows, so that the full result set never needs to be
+        held in memory. The generator holds on to a pooled connection and its open cursor until it is exhausted or
+        closed, which on SQLite (without WAL) also holds a read lock that makes writes of other connections fail with
+        "database is locked". See select_batches for reading rows of a table without that.
+
+        :param size: the maximum number of rows per chunk (defaults to ``fetch_size``)
+        :return: a generator of row lists
+        """
+        size = size or self.fetch_size
+        with self._cursor() as cur:
+            cur.execute(*args, **kwargs)
+            while True:
+                rows = cur.fetchmany(size)
+                if not rows:
+                    break
+                yield rows
 
     def open(self):
-        with self._lock:
-            assert self.connection is not None
+        with self.checkout() as connection:
+            assert connection is not None
 
     def close(self):
+        """
+        Closes the connections of the adapter (connections that are checked out are closed when they are returned).
+        The adapter can be opened again afterwards.
+        """
         with self._lock:
-            if 'connection' in self._thread_local.__dict__ and self._thread_local.connection is not None:
-                try:
-                    self._thread_local.connection.close()
-                finally:
-                    self._thread_local.connection = None
+            self._stop_group_commit()
+            self._close_connection()
+            if self._pool is not None:
+                self._pool.close()
+                self._pool = None
+
+    def _close_connection(self):
+        connection = self._local('connection')
+        self._thread_local.connection = None
+        if connection is not None:
+            connection.close()
 
     def insert_one(self, table: str, data: Dict[str, object]):
         columns = self.sql_field_list(data.keys())
@@ -116,12 +343,18 @@ class SqlAdapter(abc.ABC):
 
         self.execute(sql, values)
 
-    def insert_many(self, table: str, keys, data: List):
+    def insert_many(self, table: str, keys, data: List, ignore_duplicates=False):
+        """
+        Inserts many rows with one statement.
+
+        :param ignore_duplicates: skip rows that violate a unique index instead of failing
+        """
         columns = self.sql_field_list(keys)
         placeholders = ','.join([self.placeholder] * len(keys))
+        insert = self.sql_ignore_duplicates('INSERT') if ignore_duplicates else 'INSERT'
 
         # TODO: sanitize table and column inputs
-        sql = f'INSERT INTO `{table}` ({columns}) VALUES ({placeholders})'
+        sql = f'{insert} INTO `{table}` ({columns}) VALUES ({placeholders})'
 
         logger.debug('running insert many sql on %d items: %s', len(data), sql)
 
@@ -144,6 +377,55 @@ class SqlAdapter(abc.ABC):
         logger.debug('running update sql: %s', sql)
         self.execute(sql, values)
 
+    def delete_batch(self, table: str, where: str, params, limit: int) -> int:
+        """
+        Deletes at most `limit` rows matching the WHERE condition in a single statement.
+
+        :return: the number of deleted rows
+        """
+        sql = f'DELETE FROM `{table}` WHERE {where} LIMIT {int(limit)}'
+        return self.execute(sql, params)
+
+    def select_batches(self, table: str, fields, where: str = '1 = 1', params=(), size: int = None) -> Iterator[List]:
+        """
+        Selects the fields of the rows matching the WHERE condition and yields them in chunks of rows, like fetchiter.
+        Drivers whose open cursors block writers read each chunk with a query of its own, in which case rows written
+        while iterating may or may not be included.
+
+        :param size: the maximum number of rows per chunk (defaults to ``fetch_size``)
+        :return: a generator of row lists
+        """
+        sql = f'SELECT {self.sql_field_list(fields)} FROM `{table}` WHERE {where}'
+        return self.fetchiter(sql, params, size=size)
+
+    def reclaim_space(self, tables):
+        """
+        Returns the space freed by deleted rows of the given tables to the file system.
+        """
+        raise NotImplementedError
+
+    def delete_duplicates(self, table: str, columns, where: str = '1 = 1') -> int:
+        """
+        Deletes the rows matching the WHERE condition that have the same values in the given columns as an earlier row.
+
+        :return: the number of deleted rows
+        :raises NotImplementedError: if the database cannot tell identical rows apart
+        """
+        raise NotImplementedError
+
+    def index_exists(self, table: str, name: str) -> bool:
+        raise NotImplementedError
+
+    def create_index(self, name: str, table: str, columns, unique=False):
+        if self.index_exists(table, name):
+            return
+
+        kind = 'UNIQUE INDEX' if unique else 'INDEX'
+        sql = f'CREATE {kind} `{name}` ON `{table}` ({self.sql_field_list(columns)})'
+
+        logger.debug('running create index sql: %s', sql)
+        self.execute(sql)
+
     def sql_field_list(self, fields, table_prefix: str = None, uppercase=True) -> str:
         return ', '.join([self.sql_field_name(field, table_prefix, uppercase) for field in fields])
 
@@ -154,6 +436,17 @@ class SqlAdapter(abc.ABC):
         else:
             return f'`{f}`'
 
+    def sql_ignore_duplicates(self, statement: str) -> str:
+        """
+        Returns the given statement keyword ('INSERT' or 'UPDATE') modified so that rows violating a unique index are
+        skipped.
+        """
+        raise NotImplementedError
+
+    def sql_floor(self, expr: str) -> str:
+        # truncates towards zero, which is the floor for the (positive) timestamps it is used on
+        return f'CAST({expr} AS INTEGER)'
+
     def _connect(self, *args, **kwargs):
         raise NotImplementedError
 
@@ -162,27 +455,49 @@ class ExperimentSQLDatabase(ExperimentDatabase):
 
     SCHEMA_FILE = os.path.join(os.path.dirname(__file__), 'schema.sql')
 
-    def __init__(self, db: SqlAdapter) -> None:
+    PURGE_TABLES = ('telemetry', 'traces', 'events', 'nodeinfo')
+
+    touch_window = 600
+    purge_batch_size = 10000
+
+    def __init__(self, db: SqlAdapter, idempotent_traces=False) -> None:
+        """
+        :param db: the SqlAdapter
+        :param idempotent_traces: enforce a unique (EXP_ID, REQUEST_ID) index on traces and skip traces that have
+                                  already been saved, so that batches can be re-submitted without creating duplicates
+                                  (traces without experiment id are not deduplicated)
+        """
         super().__init__()
         self.db = db
+        self.idempotent_traces = idempotent_traces
 
     def read_schema_file(self):
         with open(self.SCHEMA_FILE, 'r') as fd:
             return fd.read()
 
     def open(self):
+        from galileodb.sql.migrations import migrate, IDEMPOTENT_TRACES_MIGRATIONS
+
         self.db.open()
         self.db.executescript(self.read_schema_file())
+        migrate(self.db)
+
+        if self.idempotent_traces:
+            migrate(self.db, migrations=IDEMPOTENT_TRACES_MIGRATIONS)
 
     def close(self):
         self.db.close()
 
+    def transaction(self):
+        return self.db.transaction()
+
     def save_experiment(self, experiment: Experiment):
         data = dict(experiment.__dict__)
         data['exp_id'] = data['id']
         del data['id']
         logger.debug('saving experiment with data %s', data)
         self.db.insert_one('experiments', data)
+        experiments_changed()
 
     def save_metadata(self, exp_id: str, data: Dict):
         logger.debug(f"saving metadata for exp: {exp_id}")
@@ -211,6 +526,7 @@ class ExperimentSQLDatabase(ExperimentDatabase):
         del data['id']
 
         self.db.update_by_id('experiments', ('exp_id', experiment.id), data)
+        experiments_changed()
 
     def delete_experiment(self, exp_id: str):
         experiment = self.get_experiment(exp_id)
@@ -231,6 +547,42 @@ class ExperimentSQLDatabase(ExperimentDatabase):
             except Exception as e:
                 logger.exception('Exception while executing %s', sql, e)
 
+        experiments_changed()
+
+    def purge_experiment(self, exp_id: str, batch_size: int = None, progress: Callable[[str, int], None] = None,
+                         reclaim=True):
+        """
+        Deletes the experiment and its data from all tables. Rows are deleted in batches of `batch_size`, each in its
+        own short transaction, so that concurrent writers are not locked out for long. The experiment itself is
+        deleted last, so an interrupted purge is resumed by purging again.
+
+        :param exp_id: the experiment to purge
+        :param batch_size: the maximum number of rows deleted per statement
+        :param progress: called with the table name and the number of rows deleted so far after each batch
+        :param reclaim: whether to reclaim the freed space (VACUUM / OPTIMIZE TABLE) afterwards. This is skipped
+                        within a transaction, as neither can be part of one
+        """
+        batch_size = batch_size or self.purge_batch_size
+        where = '`EXP_ID` = ' + self.db.placeholder
+
+        for table in self.PURGE_TABLES:
+            deleted = 0
+            while True:
+                n = self.db.delete_batch(table, where, (exp_id,), batch_size)
+                deleted += n
+                logger.debug('purged %d rows of experiment %s from %s', deleted, exp_id, table)
+                if progress:
+                    progress(table, deleted)
+                if n < batch_size:
+                    break
+
+        for table in ('metadata', 'experiments'):
+            self.db.execute(f'DELETE FROM `{table}` WHERE {where}', (exp_id,))
+        experiments_changed()
+
+        if reclaim and not self.db.in_transaction():
+            self.db.reclaim_space(self.PURGE_TABLES)
+
     def get_experiment(self, exp_id: str) -> Experiment:
         sql = f'SELECT * FROM `experiments` WHERE EXP_ID = {self.db.placeholder}'
 
@@ -243,58 +595,203 @@ class ExperimentSQLDatabase(ExperimentDatabase):
             return None
 
     def save_traces(self, traces: List[RequestTrace]):
-        self.db.insert_many('traces', RequestTrace._fields, traces)
+        self.db.insert_many('traces', RequestTrace._fields, traces, ignore_duplicates=self.idempotent_traces)
 
     def touch_traces(self, experiment: Experiment):
-        sql = 'UPDATE `traces` SET `EXP_ID` = ? WHERE CREATED >= ? AND CREATED <= ?'
+        """
+        Backfills the experiment id of traces that were created during the experiment but have not been tagged at
+        ingest time. To keep transactions short, the traces are updated in windows of `touch_window` seconds.
+        """
+        if experiment.start is None or experiment.end is None:
+            logger.warning('cannot touch traces of experiment %s without start and end', experiment.id)
+            return
+
+        sql = 'SELECT 1 FROM `traces` WHERE `EXP_ID` IS NULL AND `CREATED` >= ? AND `CREATED` <= ? LIMIT 1'
         sql = sql.replace('?', self.db.placeholder)
-        self.db.execute(sql, (experiment.id, experiment.start, experiment.end))
+        if self.db.fetchone(sql, (experiment.start, experiment.end)) is None:
+            return
 
-    def get_traces(self, exp_id=None) -> List[RequestTrace]:
-        fields = self.db.sql_field_list(RequestTrace._fields)
+        # with idempotent traces, untagged copies of traces that were already tagged at ingest time stay untagged
+        update = self.db.sql_ignore_duplicates('UPDATE') if self.idempotent_traces else 'UPDATE'
+        sql = update + ' `traces` SET `EXP_ID` = ? WHERE `EXP_ID` IS NULL AND `CREATED` >= ? AND `CREATED` {op} ?'
+        sql = sql.replace('?', self.db.placeholder)
 
-        if exp_id is None:
-            sql = f'SELECT {fields} from `traces`'
-            entries = self.db.fetchall(sql)
-        else:
-            sql = f'SELECT {fields} from `traces` WHERE EXP_ID = {self.db.placeholder}'
-            entries = self.db.fetchall(sql, (exp_id,))
+        lower = experiment.start
+        while True:
+            upper = lower + self.touch_window
+            if upper > experiment.end:
+                self.db.execute(sql.format(op='<='), (experiment.id, lower, experiment.end))
+                break
+            self.db.execute(sql.format(op='<'), (experiment.id, lower, upper))
+            lower = upper
+
+    def _conditions(self, time_field: str = None, start: float = None, end: float = None, **filters):
+        """
+        Builds a WHERE condition and its parameters. Filters that are None are ignored, and the time range on
+        `time_field` is half-open [start, end).
+        """
+        clauses, params = list(), list()
+
+        for field, value in filters.items():
+            if value is not None:
+                clauses.append(f'{self.db.sql_field_name(field)} = {self.db.placeholder}')
+                params.append(value)
+
+        if start is not None:
+            clauses.append(f'{self.db.sql_field_name(time_field)} >= {self.db.placeholder}')
+            params.append(start)
+
+        if end is not None:
+            clauses.append(f'{self.db.sql_field_name(time_field)} < {self.db.placeholder}')
+            params.append(end)
+
+        if not clauses:
+            return '1 = 1', ()
+
+        return ' AND '.join(clauses), tuple(params)
+
+    def _where(self, time_field: str = None, start: float = None, end: float = None, **filters):
+        """
+        Builds a WHERE clause (see _conditions), or an empty string if there are no conditions.
+        """
+        condition, params = self._conditions(time_field, start, end, **filters)
+        if not params:
+            return '', ()
+
+        return ' WHERE ' + condition, params
+
+    def _select(self, table: str, fields, time_field: str = None, start: float = None, end: float = None,
+                **filters):
+        where, params = self._where(time_field, start, end, **filters)
+        return f'SELECT {self.db.sql_field_list(fields)} FROM `{table}`{where}', params
+
+    def _select_traces(self, fields, exp_id, service, client, status, start, end):
+        return self._select('traces', fields, 'created', start, end,
+                            exp_id=exp_id, service=service, client=client, status=status)
+
+    def _select_telemetry(self, fields, exp_id, node, metric, subsystem, start, end):
+        return self._select('telemetry', fields, 'timestamp', start, end,
+                            exp_id=exp_id, node=node, metric=metric, subsystem=subsystem)
+
+    def _select_events(self, fields, exp_id, name, start, end):
+        return self._select('events', fields, 'timestamp', start, end, exp_id=exp_id, name=name)
+
+    def _batches(self, table: str, fields, chunk_size: int = None, time_field: str = None, start: float = None,
+                 end: float = None, **filters):
+        where, params = self._conditions(time_field, start, end, **filters)
+        return self.db.select_batches(table, fields, where, params, chunk_size)
+
+    def _trace_batches(self, fields, chunk_size, exp_id, service, client, status, start, end):
+        return self._batches('traces', fields, chunk_size, 'created', start, end,
+                             exp_id=exp_id, service=service, client=client, status=status)
+
+    def _telemetry_batches(self, fields, chunk_size, exp_id, node, metric, subsystem, start, end):
+        return self._batches('telemetry', fields, chunk_size, 'timestamp', start, end,
+                             exp_id=exp_id, node=node, metric=metric, subsystem=subsystem)
+
+    def _event_batches(self, fields, chunk_size, exp_id, name, start, end):
+        return self._batches('events', fields, chunk_size, 'timestamp', start, end, exp_id=exp_id, name=name)
+
+    @staticmethod
+    def _iter(batches, record_type):
+        for rows in batches:
+            yield from map(record_type._make, rows)
+
+    @staticmethod
+    def _columns(batches, columns):
+        from galileodb.columnar import ColumnBuilder
+
+        builder = ColumnBuilder(columns)
+        for rows in batches:
+            builder.append(rows)
+
+        return builder.build()
+
+    def get_traces(self, exp_id=None, service=None, client=None, status=None, start=None,
+                   end=None) -> List[RequestTrace]:
+        sql, params = self._select_traces(RequestTrace._fields, exp_id, service, client, status, start, end)
+        entries = self.db.fetchall(sql, params)
 
         return list(map(lambda x: RequestTrace(*(tuple(x))), entries))
 
+    def iter_traces(self, exp_id=None, chunk_size: int = None, service=None, client=None, status=None, start=None,
+                    end=None) -> Iterator[RequestTrace]:
+        batches = self._trace_batches(RequestTrace._fields, chunk_size, exp_id, service, client, status, start, end)
+        return self._iter(batches, RequestTrace)
+
+    def get_traces_columns(self, exp_id=None, chunk_size: int = None, service=None, client=None, status=None,
+                           start=None, end=None):
+        from galileodb.columnar import TRACE_COLUMNS
+
+        fields = [name for name, _ in TRACE_COLUMNS]
+        batches = self._trace_batches(fields, chunk_size, exp_id, service, client, status, start, end)
+        return self._columns(batches, TRACE_COLUMNS)
+
     def save_telemetry(self, telemetry: List[Telemetry]):
         self.db.insert_many('telemetry', Telemetry._fields, telemetry)
 
-    def get_telemetry(self, exp_id=None) -> List[Telemetry]:
-        fields = self.db.sql_field_list(Telemetry._fields)
-
-        if exp_id is None:
-            sql = f'SELECT {fields} FROM `telemetry`'
-            entries = self.db.fetchall(sql)
-        else:
-            sql = f'SELECT {fields} FROM `telemetry` WHERE EXP_ID = {self.db.placeholder}'
-            entries = self.db.fetchall(sql, (exp_id,))
+    def get_telemetry(self, exp_id=None, node=None, metric=None, subsystem=None, start=None,
+                      end=None) -> List[Telemetry]:
+        sql, params = self._select_telemetry(Telemetry._fields, exp_id, node, metric, subsystem, start, end)
+        entries = self.db.fetchall(sql, params)
 
         return list(map(lambda x: Telemetry(*(tuple(x))), entries))
 
+    def iter_telemetry(self, exp_id=None, chunk_size: int = None, node=None, metric=None, subsystem=None,
+                       start=None, end=None) -> Iterator[Telemetry]:
+        batches = self._telemetry_batches(Telemetry._fields, chunk_size, exp_id, node, metric, subsystem, start, end)
+        return self._iter(batches, Telemetry)
+
+    def get_telemetry_columns(self, exp_id=None, chunk_size: int = None, node=None, metric=None, subsystem=None,
+                              start=None, end=None):
+        from galileodb.columnar import TELEMETRY_COLUMNS
+
+        fields = [name for name, _ in TELEMETRY_COLUMNS]
+        batches = self._telemetry_batches(fields, chunk_size, exp_id, node, metric, subsystem, start, end)
+        return self._columns(batches, TELEMETRY_COLUMNS)
+
+    def get_telemetry_resampled(self, exp_id: str, interval: float, agg=('mean', 'min', 'max', 'count'),
+                                node=None, metric=None, subsystem=None, start=None,
+                                end=None) -> List[ResampledTelemetry]:
+        functions = {'mean': 'AVG', 'min': 'MIN', 'max': 'MAX', 'count': 'COUNT', 'sum': 'SUM'}
+        unknown = set(agg) - set(TELEMETRY_AGGREGATES)
+        if unknown:
+            raise ValueError('unknown aggregates %s' % unknown)
+
+        keys = self.db.sql_field_list(['metric', 'node', 'exp_id', 'subsystem'])
+        bucket = self.db.sql_floor(f'`TIMESTAMP` / {self.db.placeholder}')
+        aggregates = ', '.join(f'{functions[a]}(`VALUE`)' for a in agg)
+        where, params = self._where('timestamp', start, end, exp_id=exp_id, node=node, metric=metric,
+                                    subsystem=subsystem)
+
+        sql = f'SELECT {bucket} AS `BUCKET`, {keys}, {aggregates} FROM `telemetry`{where} ' \
+              f'GROUP BY `BUCKET`, {keys} ORDER BY `BUCKET`, `NODE`, `METRIC`'
+
+        result = list()
+        for rows in self.db.fetchiter(sql, (interval,) + params):
+            for row in rows:
+                values = dict(zip(agg, row[5:]))
+                result.append(ResampledTelemetry(row[0] * interval, *row[1:5], **values))
+
+        return result
+
     def save_event(self, event: ExperimentEvent):
         self.db.insert_one('events', event._asdict())
 
     def save_events(self, events: List[ExperimentEvent]):
         self.db.insert_many('events', ExperimentEvent._fields, events)
 
-    def get_events(self, exp_id=None) -> List[ExperimentEvent]:
-        fields = self.db.sql_field_list(ExperimentEvent._fields)
-
-        if exp_id is None:
-            sql = f'SELECT {fields} FROM `events`'
-            entries = self.db.fetchall(sql)
-        else:
-            sql = f'SELECT {fields} FROM `events` WHERE EXP_ID = {self.db.placeholder}'
-            entries = self.db.fetchall(sql, (exp_id,))
+    def get_events(self, exp_id=None, name=None, start=None, end=None) -> List[ExperimentEvent]:
+        sql, params = self._select_events(ExperimentEvent._fields, exp_id, name, start, end)
+        entries = self.db.fetchall(sql, params)
 
         return list(map(lambda x: ExperimentEvent(*(tuple(x))), entries))
 
+    def iter_events(self, exp_id=None, chunk_size: int = None, name=None, start=None,
+                    end=None) -> Iterator[ExperimentEvent]:
+        batches = self._event_batches(ExperimentEvent._fields, chunk_size, exp_id, name, start, end)
+        return self._iter(batches, ExperimentEvent)
+
     def save_nodeinfos(self, infos: List[NodeInfo]):
         keys = ('exp_id', 'node', 'info_key', 'info_value')
 
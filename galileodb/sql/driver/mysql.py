@@ -16,6 +16,13 @@ class MysqlAdapter(SqlAdapter):
         con.autocommit = True
         return con
 
+    def _begin(self, connection):
+        # connections run in autocommit mode, so transactions have to be started explicitly
+        connection.start_transaction()
+
+    def _ping(self, connection) -> bool:
+        return connection.is_connected()
+
     def cursor(self):
         try:
             return self.db.cursor()
@@ -24,17 +31,55 @@ class MysqlAdapter(SqlAdapter):
             self.reconnect()
             return self.db.cursor()
 
+    def fetchiter(self, *args, size: int = None, **kwargs):
+        # unbuffered cursors stream rows from the server, but block their connection until the result is consumed.
+        # streaming therefore happens on a dedicated connection, so that the caller can issue other queries while
+        # iterating.
+        size = size or self.fetch_size
+        con = self._connect(*self.connect_args, **self.connect_kwargs)
+        try:
+            cur = con.cursor(buffered=False)
+            cur.execute(*args, **kwargs)
+            while True:
+                rows = cur.fetchmany(size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            # closing the connection discards any unread rows of an abandoned stream
+            con.close()
+
+    def index_exists(self, table: str, name: str) -> bool:
+        sql = 'SELECT 1 FROM information_schema.statistics ' \
+              'WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s LIMIT 1'
+        return self.fetchone(sql, (table, name)) is not None
+
+    def reclaim_space(self, tables):
+        tables = ', '.join(f'`{table}`' for table in tables)
+        # OPTIMIZE TABLE returns a status result set per table
+        for row in self.fetchall(f'OPTIMIZE TABLE {tables}'):
+            logger.debug('optimize table: %s', row)
+
+    def sql_ignore_duplicates(self, statement: str) -> str:
+        return f'{statement} IGNORE'
+
+    def sql_floor(self, expr: str) -> str:
+        return f'FLOOR({expr})'
+
     def executescript(self, *args, **kwargs):
         script = args[0]
         # FIXME: pretty hacky
         schema = ' '.join(script.splitlines())
         statements = [stmt.strip() for stmt in schema.split(';')]
 
-        cur = self.db.cursor()
-        try:
-            for stmt in statements:
-                if stmt:
-                    cur.execute(stmt)
-            self.db.commit()
-        except:
-            self.db.rollback()
+        with self.checkout() as con:
+            cur = con.cursor()
+            try:
+                for stmt in statements:
+                    if stmt:
+                        cur.execute(stmt)
+                con.commit()
+            except:
+                con.rollback()
+            finally:
+                cur.close()
@@ -1,10 +1,115 @@
 import sqlite3
+from typing import Dict
 
 from galileodb.sql.adapter import SqlAdapter
 
+PROFILES: Dict[str, Dict[str, object]] = {
+    'default': {},
+    # WAL lets readers proceed while a write is in progress, and with synchronous=NORMAL, commits no longer fsync
+    # (a power loss may lose the last transactions, but never corrupts the database)
+    'performance': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -64000,
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+    },
+}
+
 
 class SqliteAdapter(SqlAdapter):
     placeholder = '?'
 
+    def __init__(self, *args, pragmas: Dict[str, object] = None, profile: str = 'default', **kwargs) -> None:
+        """
+        Creates a new SqliteAdapter. The args and kwargs are passed to sqlite3.connect.
+
+        :param pragmas: PRAGMA statements (name -> value) that are executed on each new connection, in addition to
+                        (or overriding) those of the profile
+        :param profile: 'default', or 'performance' to use the PRAGMAs in PROFILES['performance']. To also execute
+                        all writes on a single dedicated writer thread, enable group commit (with a delay of 0).
+        """
+        super().__init__(*args, **kwargs)
+        if profile not in PROFILES:
+            raise ValueError('unknown sqlite profile %s' % profile)
+
+        self.profile = profile
+        self.pragmas = dict(PROFILES[profile])
+        self.pragmas.update(pragmas or {})
+
+    @property
+    def in_memory(self) -> bool:
+        database = self.connect_args[0] if self.connect_args else self.connect_kwargs.get('database')
+        # both are private to the connection that opens them
+        return database in (':memory:', '')
+
+    def _create_pool(self):
+        if self.in_memory:
+            from galileodb.sql.pool import PinnedConnectionPool
+            return PinnedConnectionPool(self._new_connection, self.pool_timeout)
+        return super()._create_pool()
+
+    @property
+    def connection(self):
+        if self.in_memory and not self.in_transaction():
+            # a dedicated connection would open an empty database
+            with self.pool.connection() as connection:
+                return connection
+        return super().connection
+
     def _connect(self, *args, **kwargs):
-        return sqlite3.connect(*args, **kwargs)
+        # pooled connections are handed to whichever thread checks them out (but never used by two at a time)
+        kwargs.setdefault('check_same_thread', False)
+        con = sqlite3.connect(*args, **kwargs)
+        for name, value in self.pragmas.items():
+            con.execute(f'PRAGMA {name} = {value}')
+        return con
+
+    def _begin(self, connection):
+        # the sqlite3 module only begins transactions implicitly before DML, whereas DDL (e.g., CREATE INDEX) would
+        # otherwise be committed right away
+        if not connection.in_transaction:
+            connection.execute('BEGIN')
+
+    def select_batches(self, table: str, fields, where: str = '1 = 1', params=(), size: int = None):
+        # an open cursor holds a read lock until its result is consumed, which would make writes of other connections
+        # fail for as long as the caller takes to work through the chunks. each chunk is therefore read by a query of
+        # its own, which continues after the rowid of the last row of the previous chunk.
+        size = size or self.fetch_size
+        select = f'SELECT rowid, {self.sql_field_list(fields)} FROM `{table}` WHERE ({where})'
+        order = f' ORDER BY rowid LIMIT {int(size)}'
+        first = select + order
+        following = select + f' AND rowid > {self.placeholder}' + order
+
+        params = tuple(params)
+        rows = self.fetchall(first, params)
+        while rows:
+            yield [row[1:] for row in rows]
+            if len(rows) < size:
+                break
+            rows = self.fetchall(following, params + (rows[-1][0],))
+
+    def delete_batch(self, table: str, where: str, params, limit: int) -> int:
+        # DELETE ... LIMIT is only available if sqlite was compiled with SQLITE_ENABLE_UPDATE_DELETE_LIMIT
+        sql = f'DELETE FROM `{table}` WHERE rowid IN (SELECT rowid FROM `{table}` WHERE {where} LIMIT {int(limit)})'
+        return self.execute(sql, params)
+
+    def reclaim_space(self, tables):
+        # VACUUM rebuilds the entire database file. it cannot run within a transaction, so it is executed on a pooled
+        # connection rather than by the group committer
+        with self._cursor() as cur:
+            cur.execute('VACUUM')
+
+    def delete_duplicates(self, table: str, columns, where: str = '1 = 1') -> int:
+        # keeps the row with the lowest rowid of each group
+        fields = self.sql_field_list(columns)
+        sql = f'DELETE FROM `{table}` WHERE {where} AND rowid NOT IN ' \
+              f'(SELECT MIN(rowid) FROM `{table}` WHERE {where} GROUP BY {fields})'
+        return self.execute(sql)
+
+    def sql_ignore_duplicates(self, statement: str) -> str:
+        return f'{statement} OR IGNORE'
+
+    def index_exists(self, table: str, name: str) -> bool:
+        sql = "SELECT 1 FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND name = ?"
+        return self.fetchone(sql, (table, name)) is not None
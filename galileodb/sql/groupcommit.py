@@ -0,0 +1,164 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class GroupCommitter:
+    """
+    Executes the write statements of many threads on one dedicated thread, and commits all statements that
+    arrive within `delay` seconds of each other in a single transaction. Callers block until the transaction that
+    contains their statement has been committed, so durability is the same as with a commit per statement, but the
+    cost of a commit (an fsync on SQLite, a round-trip on MySQL) is shared by the group.
+
+    If a group cannot be committed at all (e.g., because the connection is lost), the statements of the group and all
+    statements queued after it fail with the error, and the next group is committed on a new connection.
+    """
+
+    liveness_interval = 1
+
+    def __init__(self, adapter, delay: float = 0.002, max_batch: int = 1000) -> None:
+        super().__init__()
+        self.adapter = adapter
+        self.delay = delay
+        self.max_batch = max_batch
+
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self.run, name='group-committer', daemon=True)
+        self._closed = False
+
+    def start(self):
+        self._thread.start()
+
+    def submit(self, method: str, args, kwargs, wait=True):
+        """
+        Submits a cursor method call (e.g., 'execute' or 'executemany') to be executed in the next group.
+
+        :param method: the name of the cursor method
+        :param args: the method arguments
+        :param kwargs: the method keyword arguments
+        :param wait: whether to block until the statement has been committed
+        :return: the rowcount of the statement if wait is true, otherwise a Future
+        """
+        if self._closed:
+            raise ValueError('group committer is closed')
+
+        future = Future()
+        self._queue.put((method, args, kwargs, future))
+
+        if wait:
+            return self._wait(future)
+        return future
+
+    def _wait(self, future: Future):
+        # the committer fails all futures it has taken from the queue, but if its thread died anyway, nobody would
+        # ever complete the future
+        while True:
+            try:
+                return future.result(timeout=self.liveness_interval)
+            except TimeoutError:
+                if not self._thread.is_alive() and not future.done():
+                    raise RuntimeError('group committer thread is not running')
+
+    def close(self, timeout=None):
+        """
+        Commits all pending statements and stops the committer thread.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def run(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _STOP:
+                    break
+
+                batch, stop = self._collect(item)
+
+                try:
+                    # the pool discards the connection if the group fails, so the next group starts over with a new
+                    # one, and it pings connections that have been idle for a while
+                    with self.adapter.pool.connection() as connection:
+                        self._commit(connection, batch)
+                except Exception as e:
+                    logger.error('group commit of %d statements failed: %s', len(batch), e)
+                    self._fail(batch, e)
+                    stop = self._fail_queued(e) or stop
+
+                if stop:
+                    break
+        finally:
+            self._closed = True
+            self._fail_queued(RuntimeError('group committer is closed'))
+
+    def _fail_queued(self, e: Exception) -> bool:
+        stop = False
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return stop
+            if item is _STOP:
+                stop = True
+                continue
+            self._fail([item], e)
+
+    @staticmethod
+    def _fail(batch, e: Exception):
+        for _, _, _, future in batch:
+            if not future.done():
+                future.set_exception(e)
+
+    def _collect(self, first):
+        # the group consists of all statements that queued up while the previous group was committed, plus those
+        # that arrive within the delay
+        batch = [first]
+        deadline = time.monotonic() + self.delay
+
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+
+        return batch, False
+
+    def _commit(self, connection, batch):
+        results = list()
+        cur = connection.cursor()
+        try:
+            self.adapter._begin(connection)
+            for method, args, kwargs, _ in batch:
+                getattr(cur, method)(*args, **kwargs)
+                results.append(cur.rowcount)
+            connection.commit()
+        except Exception as e:
+            connection.rollback()
+            if len(batch) == 1:
+                batch[0][3].set_exception(e)
+                return
+
+            # a single failing statement should not fail the writes of all other threads in the group
+            logger.debug('group commit of %d statements failed, committing them one by one: %s', len(batch), e)
+            for item in batch:
+                self._commit(connection, [item])
+            return
+        finally:
+            cur.close()
+
+        logger.debug('committed group of %d statements', len(batch))
+        for (_, _, _, future), result in zip(batch, results):
+            future.set_result(result)
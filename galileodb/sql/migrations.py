@@ -0,0 +1,139 @@
+"""
+Versioned migrations of the SQL experiment database schema. The schema.sql file only creates missing tables, whereas
+everything that has to be added to existing databases (such as indexes) is expressed as a migration. The highest
+applied migration is recorded in the `schema_version` table, and pending migrations are applied in order when an
+ExperimentSQLDatabase is opened.
+
+Migrations of optional features (such as IDEMPOTENT_TRACES_MIGRATIONS) are only applied when the feature is enabled.
+Their versions start at OPTIONAL_VERSIONS, and they do not count towards the schema version.
+
+Migration steps must be idempotent, so that a migration that was interrupted half-way can simply be re-run.
+"""
+import logging
+import time
+from typing import NamedTuple, List, Callable, Sequence, Set
+
+logger = logging.getLogger(__name__)
+
+OPTIONAL_VERSIONS = 1000
+
+
+class MigrationError(Exception):
+    pass
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    steps: List[Callable]
+
+
+def create_index(name: str, table: str, columns: Sequence[str], unique=False) -> Callable:
+    def step(db):
+        db.create_index(name, table, columns, unique=unique)
+
+    return step
+
+
+def delete_duplicate_traces(db):
+    # traces without experiment id are not deduplicated, NULLs never violate a unique index
+    where = '`EXP_ID` IS NOT NULL'
+    try:
+        deleted = db.delete_duplicates('traces', ['EXP_ID', 'REQUEST_ID'], where)
+    except NotImplementedError:
+        sql = f'SELECT COUNT(*) FROM (SELECT 1 FROM `traces` WHERE {where} GROUP BY `EXP_ID`, `REQUEST_ID` ' \
+              f'HAVING COUNT(*) > 1) duplicates'
+        duplicates = db.fetchone(sql)[0]
+        if duplicates:
+            raise MigrationError('%d (EXP_ID, REQUEST_ID) pairs occur in more than one trace, delete the duplicates '
+                                 'before enabling idempotent traces' % duplicates)
+        return
+
+    if deleted:
+        logger.warning('deleted %d duplicate traces', deleted)
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, 'add indexes for experiment scoped queries', [
+        create_index('telemetry_exp_ts', 'telemetry', ['EXP_ID', 'TIMESTAMP']),
+        create_index('telemetry_exp_node_metric', 'telemetry', ['EXP_ID', 'NODE', 'METRIC']),
+        create_index('traces_exp_created', 'traces', ['EXP_ID', 'CREATED']),
+        create_index('traces_created', 'traces', ['CREATED']),
+        create_index('events_exp_ts', 'events', ['EXP_ID', 'TIMESTAMP']),
+        create_index('nodeinfo_exp_node', 'nodeinfo', ['EXP_ID', 'NODE']),
+        create_index('experiments_status', 'experiments', ['STATUS']),
+    ]),
+]
+
+IDEMPOTENT_TRACES_MIGRATIONS: List[Migration] = [
+    Migration(OPTIONAL_VERSIONS + 1, 'add a unique index on the experiment and request ids of traces', [
+        delete_duplicate_traces,
+        create_index('traces_exp_request', 'traces', ['EXP_ID', 'REQUEST_ID'], unique=True),
+    ]),
+]
+
+
+def get_schema_version(db) -> int:
+    sql = 'SELECT MAX(`VERSION`) FROM `schema_version` WHERE `VERSION` < ' + db.placeholder
+    entry = db.fetchone(sql, (OPTIONAL_VERSIONS,))
+
+    if entry is None or entry[0] is None:
+        return 0
+
+    return int(entry[0])
+
+
+def get_applied_versions(db) -> Set[int]:
+    return {int(entry[0]) for entry in db.fetchall('SELECT `VERSION` FROM `schema_version`')}
+
+
+def migrate(db, target: int = None, migrations: List[Migration] = None) -> int:
+    """
+    Applies all pending migrations to the database, each in its own transaction. Requires the `schema_version` table
+    to exist. Several processes may open the same database at the same time: a migration that fails because another
+    process applied it concurrently counts as applied.
+
+    :param db: the SqlAdapter
+    :param target: the version to migrate to (defaults to the latest version)
+    :param migrations: the migrations (defaults to MIGRATIONS)
+    :return: the highest version of the given migrations that is applied after migrating
+    """
+    migrations = MIGRATIONS if migrations is None else migrations
+    applied = get_applied_versions(db)
+    version = max([m.version for m in migrations if m.version in applied], default=0)
+
+    for migration in sorted(migrations, key=lambda m: m.version):
+        if migration.version in applied:
+            continue
+        if target is not None and migration.version > target:
+            break
+
+        apply(db, migration)
+        version = migration.version
+
+    return version
+
+
+def apply(db, migration: Migration, attempts: int = 2):
+    """
+    Applies the migration and records its version. If it fails and its version was not recorded in the meantime, the
+    migration is re-run (its steps are idempotent) up to `attempts` times in total.
+    """
+    sql = db.sql_ignore_duplicates('INSERT') + ' INTO `schema_version` (`VERSION`, `APPLIED`) VALUES (?, ?)'
+    sql = sql.replace('?', db.placeholder)
+
+    for attempt in range(1, attempts + 1):
+        try:
+            with db.transaction():
+                logger.info('migrating schema to version %d: %s', migration.version, migration.description)
+                for step in migration.steps:
+                    step(db)
+                db.execute(sql, (migration.version, time.time()))
+            return
+        except Exception as e:
+            if migration.version in get_applied_versions(db):
+                logger.info('schema version %d was applied concurrently (%s)', migration.version, e)
+                return
+            if attempt == attempts:
+                raise
+            logger.warning('migrating schema to version %d failed, retrying: %s', migration.version, e)
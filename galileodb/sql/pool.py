@@ -0,0 +1,214 @@
+import collections
+import contextlib
+import logging
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPool:
+    """
+    A bounded pool of database connections. Connections are created on demand up to `max_size`, after which checkout
+    blocks until a connection is checked back in. Connections that have been idle for more than `ping_interval`
+    seconds are checked for liveness before they are handed out, and replaced if they are dead.
+
+    The pool is fork-aware: when it is used in a process other than the one that created it (e.g., a
+    multiprocessing child), it discards the inherited connections without closing them (closing would also tear down
+    the parent's session) and starts over with fresh ones.
+    """
+
+    def __init__(self, connect: Callable, max_size: int = 8, timeout: float = 30,
+                 ping: Callable[[object], bool] = None, ping_interval: float = 30) -> None:
+        """
+        :param connect: called without arguments to create a new connection
+        :param max_size: the maximum number of connections (checked out or idle)
+        :param timeout: the maximum time in seconds checkout waits for a connection
+        :param ping: called with a connection to check whether it is alive
+        :param ping_interval: the idle time in seconds after which a connection is pinged before it is handed out
+        """
+        super().__init__()
+        self.connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.ping = ping
+        self.ping_interval = ping_interval
+
+        self._closed = False
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = collections.deque()
+        self._slots = threading.BoundedSemaphore(self.max_size)
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            logger.debug('connection pool was inherited from process %d, resetting', self._pid)
+            self._reset()
+
+    def checkout(self, timeout: float = None):
+        """
+        Returns a connection from the pool, or creates a new one if there is no idle connection.
+
+        :param timeout: overrides the pool's timeout
+        :raises TimeoutError: if no connection became available within the timeout
+        """
+        if self._closed:
+            raise ValueError('connection pool is closed')
+
+        self._check_pid()
+        slots = self._slots
+
+        if not slots.acquire(timeout=self.timeout if timeout is None else timeout):
+            raise TimeoutError('no connection available after %s seconds' % self.timeout)
+
+        try:
+            return self._idle_connection() or self.connect()
+        except BaseException:
+            slots.release()
+            raise
+
+    def _idle_connection(self) -> Optional[object]:
+        while True:
+            try:
+                connection, since = self._idle.pop()
+            except IndexError:
+                return None
+
+            if self.ping is None or time.monotonic() - since < self.ping_interval:
+                return connection
+
+            if self._alive(connection):
+                return connection
+
+            logger.info('discarding dead connection')
+            self._close(connection)
+
+    def _alive(self, connection) -> bool:
+        try:
+            return self.ping(connection)
+        except Exception:
+            return False
+
+    def checkin(self, connection, discard=False):
+        """
+        Returns a connection to the pool.
+
+        :param connection: a connection previously returned by checkout
+        :param discard: close the connection instead of keeping it (e.g., because it is in an unknown state)
+        """
+        if self._pid != os.getpid():
+            # the connection belongs to a pool inherited from the parent process, its slot no longer exists
+            return
+
+        try:
+            if discard or self._closed:
+                self._close(connection)
+            else:
+                self._idle.append((connection, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    @contextlib.contextmanager
+    def connection(self):
+        """
+        Returns a context manager that checks out a connection and checks it back in when the block exits. If the
+        block raises, the connection is discarded.
+        """
+        connection = self.checkout()
+        try:
+            yield connection
+        except BaseException:
+            self.checkin(connection, discard=True)
+            raise
+        else:
+            self.checkin(connection)
+
+    def close(self):
+        """
+        Closes all idle connections. Connections that are checked out are closed when they are checked in.
+        """
+        self._closed = True
+        if self._pid != os.getpid():
+            return
+
+        while True:
+            try:
+                connection, _ = self._idle.pop()
+            except IndexError:
+                break
+            self._close(connection)
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except Exception as e:
+            logger.debug('error while closing connection: %s', e)
+
+
+class PinnedConnectionPool(ConnectionPool):
+    """
+    A pool that hands out a single connection, for databases that only exist within one connection (e.g., SQLite
+    ':memory:' databases). The thread that has checked out the connection can check it out again (e.g., to run a
+    query while it iterates over the result of another), other threads wait until it has been checked in as often as
+    it was checked out. The connection is never discarded, as this would discard the database.
+    """
+
+    def __init__(self, connect: Callable, timeout: float = 30) -> None:
+        super().__init__(connect, max_size=1, timeout=timeout)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._connection = None
+        self._owner = None
+        self._count = 0
+        self._released = threading.Condition()
+
+    def checkout(self, timeout: float = None):
+        if self._closed:
+            raise ValueError('connection pool is closed')
+
+        self._check_pid()
+        me = threading.get_ident()
+
+        with self._released:
+            if not self._released.wait_for(lambda: self._owner in (None, me),
+                                           self.timeout if timeout is None else timeout):
+                raise TimeoutError('no connection available after %s seconds' % self.timeout)
+
+            if self._connection is None:
+                self._connection = self.connect()
+
+            self._owner = me
+            self._count += 1
+            return self._connection
+
+    def checkin(self, connection, discard=False):
+        if self._pid != os.getpid():
+            return
+
+        with self._released:
+            self._count -= 1
+            if self._count > 0:
+                return
+            self._owner = None
+            self._released.notify_all()
+
+        if self._closed:
+            self.close()
+
+    def close(self):
+        self._closed = True
+        if self._pid != os.getpid():
+            return
+
+        with self._released:
+            if self._connection is None or self._count > 0:
+                return
+            connection, self._connection = self._connection, None
+
+        self._close(connection)
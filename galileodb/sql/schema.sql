@@ -56,4 +56,11 @@ CREATE TABLE IF NOT EXISTS metadata
     EXP_ID  VARCHAR(100) NOT NULL,
     DATA JSON NOT NULL,
     CONSTRAINT experiments_pk PRIMARY KEY (EXP_ID)
+);
+
+CREATE TABLE IF NOT EXISTS schema_version
+(
+    VERSION INT    NOT NULL,
+    APPLIED DOUBLE NOT NULL,
+    CONSTRAINT schema_version_pk PRIMARY KEY (VERSION)
 )
@@ -0,0 +1,243 @@
+import hashlib
+import itertools
+import logging
+import os
+import re
+import threading
+import urllib.parse
+from typing import List, Dict, Iterator, Optional, Tuple
+
+from galileodb.db import ExperimentDatabase
+from galileodb.model import Experiment, Telemetry, RequestTrace, NodeInfo, ExperimentEvent, ResampledTelemetry
+from galileodb.sql.adapter import ExperimentSQLDatabase
+from galileodb.sql.driver.sqlite import SqliteAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class ShardedSqliteExperimentDatabase(ExperimentDatabase):
+    """
+    Implements the ExperimentDatabase with one SQLite file per experiment. A catalog database holds the experiments
+    and their metadata (as well as traces that have not been assigned to an experiment yet), whereas the telemetry,
+    traces, events and node infos of each experiment are stored in a shard file of its own. Shards are opened on
+    demand, so writers of concurrent experiments do not contend on the same database lock, and deleting an
+    experiment is a file unlink. Shards of experiments that are no longer running are read through read-only,
+    memory-mapped connections.
+    """
+
+    catalog: ExperimentSQLDatabase
+
+    move_batch_size = 10000
+
+    def __init__(self, catalog_path: str, shard_dir: str, mmap_size: int = 256 * 1024 * 1024,
+                 profile: str = 'default', idempotent_traces=False) -> None:
+        super().__init__()
+        self.catalog = ExperimentSQLDatabase(SqliteAdapter(catalog_path, profile=profile), idempotent_traces)
+        self.shard_dir = shard_dir
+        self.mmap_size = mmap_size
+        self.profile = profile
+        self.idempotent_traces = idempotent_traces
+
+        self._shards: Dict[Tuple[str, bool], ExperimentSQLDatabase] = dict()
+        self._lock = threading.Lock()
+
+    def shard_path(self, exp_id: str) -> str:
+        name = re.sub(r'[^A-Za-z0-9_.-]', '_', exp_id)
+        if name != exp_id:
+            # avoid collisions of experiment ids that only differ in replaced characters
+            name += '-' + hashlib.sha1(exp_id.encode()).hexdigest()[:8]
+        return os.path.join(self.shard_dir, name + '.sqlite')
+
+    def _shard(self, path: str, readonly=False) -> Optional[ExperimentSQLDatabase]:
+        key = (path, readonly)
+
+        with self._lock:
+            shard = self._shards.get(key)
+            if shard is not None:
+                return shard
+
+            if readonly:
+                if not os.path.exists(path):
+                    return None
+                uri = 'file:%s?mode=ro' % urllib.parse.quote(os.path.abspath(path))
+                shard = ExperimentSQLDatabase(SqliteAdapter(uri, uri=True, pragmas={'mmap_size': self.mmap_size}))
+                shard.db.open()
+            else:
+                logger.debug('opening shard %s', path)
+                shard = ExperimentSQLDatabase(SqliteAdapter(path, profile=self.profile), self.idempotent_traces)
+                shard.open()
+
+            self._shards[key] = shard
+            return shard
+
+    def _writer(self, exp_id: Optional[str]) -> ExperimentSQLDatabase:
+        if exp_id is None:
+            return self.catalog
+        return self._shard(self.shard_path(exp_id))
+
+    def _reader(self, exp_id: str) -> Optional[ExperimentSQLDatabase]:
+        path = self.shard_path(exp_id)
+        if not os.path.exists(path):
+            return None
+
+        experiment = self.catalog.get_experiment(exp_id)
+        readonly = experiment is not None and experiment.status != 'RUNNING'
+        return self._shard(path, readonly)
+
+    def _readers(self, exp_id: Optional[str]) -> List[ExperimentSQLDatabase]:
+        if exp_id is not None:
+            shard = self._reader(exp_id)
+            return [shard] if shard else []
+
+        shards = [self.catalog]
+        for file_name in sorted(os.listdir(self.shard_dir)):
+            if file_name.endswith('.sqlite'):
+                path = os.path.join(self.shard_dir, file_name)
+                shards.append(self._shards.get((path, False)) or self._shard(path, readonly=True))
+
+        return shards
+
+    def _close_shards(self, path: str = None):
+        with self._lock:
+            for key in list(self._shards.keys()):
+                if path is None or key[0] == path:
+                    self._shards.pop(key).close()
+
+    @staticmethod
+    def _group_by_experiment(records) -> Dict[Optional[str], List]:
+        groups = dict()
+        for record in records:
+            groups.setdefault(record.exp_id, list()).append(record)
+        return groups
+
+    def open(self):
+        if not os.path.exists(self.shard_dir):
+            os.makedirs(self.shard_dir)
+        self.catalog.open()
+
+    def close(self):
+        self._close_shards()
+        self.catalog.close()
+
+    def transaction(self):
+        # only writes to the catalog are covered, shards are separate database files
+        return self.catalog.transaction()
+
+    def save_experiment(self, experiment: Experiment):
+        self.catalog.save_experiment(experiment)
+
+    def update_experiment(self, experiment: Experiment):
+        self.catalog.update_experiment(experiment)
+
+    def delete_experiment(self, exp_id: str):
+        self.catalog.delete_experiment(exp_id)
+        self._delete_shard(exp_id)
+
+    def purge_experiment(self, exp_id: str, batch_size: int = None, progress=None):
+        self.catalog.purge_experiment(exp_id, batch_size, progress, reclaim=False)
+        self._delete_shard(exp_id)
+
+    def _delete_shard(self, exp_id: str):
+        path = self.shard_path(exp_id)
+        self._close_shards(path)
+
+        for suffix in ['', '-journal', '-wal', '-shm']:
+            if os.path.exists(path + suffix):
+                logger.info('removing shard file %s', path + suffix)
+                os.remove(path + suffix)
+
+    def get_experiment(self, exp_id: str) -> Experiment:
+        return self.catalog.get_experiment(exp_id)
+
+    def save_metadata(self, exp_id: str, data: Dict):
+        self.catalog.save_metadata(exp_id, data)
+
+    def get_metadata(self, exp_id: str) -> Dict:
+        return self.catalog.get_metadata(exp_id)
+
+    def save_traces(self, traces: List[RequestTrace]):
+        for exp_id, group in self._group_by_experiment(traces).items():
+            self._writer(exp_id).save_traces(group)
+
+    def touch_traces(self, experiment: Experiment):
+        # traces that were not assigned at ingest time are stored in the catalog and moved into the shard. they are
+        # moved in chunks of `move_batch_size`, each of which is deleted from the catalog by rowid once the shard has
+        # it, so the traces are never held in memory all at once, and an interrupted move loses no traces (at most the
+        # last chunk is copied twice, unless traces are idempotent).
+        self.catalog.touch_traces(experiment)
+
+        db = self.catalog.db
+        fields = db.sql_field_list(RequestTrace._fields)
+        select = f'SELECT rowid, {fields} FROM `traces` WHERE `EXP_ID` = {db.placeholder} ' \
+                 f'AND rowid > {db.placeholder} ORDER BY rowid LIMIT {int(self.move_batch_size)}'
+        delete = f'DELETE FROM `traces` WHERE `EXP_ID` = {db.placeholder} AND rowid <= {db.placeholder}'
+
+        shard = None
+        last = 0
+        while True:
+            rows = db.fetchall(select, (experiment.id, last))
+            if not rows:
+                break
+
+            shard = shard or self._writer(experiment.id)
+            shard.save_traces([RequestTrace._make(row[1:]) for row in rows])
+            last = rows[-1][0]
+            db.execute(delete, (experiment.id, last))
+
+    def get_traces(self, exp_id: str = None, service: str = None, client: str = None, status: int = None,
+                   start: float = None, end: float = None) -> List[RequestTrace]:
+        return list(self.iter_traces(exp_id, service=service, client=client, status=status, start=start, end=end))
+
+    def iter_traces(self, exp_id: str = None, chunk_size: int = None, service: str = None, client: str = None,
+                    status: int = None, start: float = None, end: float = None) -> Iterator[RequestTrace]:
+        return itertools.chain.from_iterable(
+            shard.iter_traces(exp_id, chunk_size, service, client, status, start, end)
+            for shard in self._readers(exp_id))
+
+    def save_telemetry(self, telemetry: List[Telemetry]):
+        for exp_id, group in self._group_by_experiment(telemetry).items():
+            self._writer(exp_id).save_telemetry(group)
+
+    def get_telemetry(self, exp_id=None, node: str = None, metric: str = None, subsystem: str = None,
+                      start: float = None, end: float = None) -> List[Telemetry]:
+        return list(self.iter_telemetry(exp_id, node=node, metric=metric, subsystem=subsystem, start=start, end=end))
+
+    def iter_telemetry(self, exp_id: str = None, chunk_size: int = None, node: str = None, metric: str = None,
+                       subsystem: str = None, start: float = None, end: float = None) -> Iterator[Telemetry]:
+        return itertools.chain.from_iterable(
+            shard.iter_telemetry(exp_id, chunk_size, node, metric, subsystem, start, end)
+            for shard in self._readers(exp_id))
+
+    def get_telemetry_resampled(self, exp_id: str, interval: float, agg=('mean', 'min', 'max', 'count'),
+                                node: str = None, metric: str = None, subsystem: str = None, start: float = None,
+                                end: float = None) -> List[ResampledTelemetry]:
+        shard = self._reader(exp_id)
+        if shard is None:
+            return []
+        return shard.get_telemetry_resampled(exp_id, interval, agg, node, metric, subsystem, start, end)
+
+    def save_event(self, event: ExperimentEvent):
+        self._writer(event.exp_id).save_event(event)
+
+    def save_events(self, events: List[ExperimentEvent]):
+        for exp_id, group in self._group_by_experiment(events).items():
+            self._writer(exp_id).save_events(group)
+
+    def get_events(self, exp_id=None, name: str = None, start: float = None,
+                   end: float = None) -> List[ExperimentEvent]:
+        return list(self.iter_events(exp_id, name=name, start=start, end=end))
+
+    def iter_events(self, exp_id: str = None, chunk_size: int = None, name: str = None, start: float = None,
+                    end: float = None) -> Iterator[ExperimentEvent]:
+        return itertools.chain.from_iterable(
+            shard.iter_events(exp_id, chunk_size, name, start, end) for shard in self._readers(exp_id))
+
+    def save_nodeinfos(self, infos: List[NodeInfo]):
+        for exp_id, group in self._group_by_experiment(infos).items():
+            self._writer(exp_id).save_nodeinfos(group)
+
+    def find_all(self) -> List[Experiment]:
+        return self.catalog.find_all()
+
+    def get_running_experiment(self) -> Experiment:
+        return self.catalog.get_running_experiment()
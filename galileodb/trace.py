@@ -1,16 +1,22 @@
 import csv
+import gzip
+import io
 import logging
 import os
+import time
 from abc import ABC
 from multiprocessing import Process
 from multiprocessing.queues import Queue
 from queue import Empty
-from typing import List
+from typing import List, MutableMapping
 
-from galileodb.db import ExperimentDatabase
+from galileodb.db import ExperimentDatabase, on_experiments_changed
+from galileodb.flush import FlushPolicy
 from galileodb.model import RequestTrace
+from galileodb.reporter.streams import RedisStreamTraceReporter
 from galileodb.reporter.traces import RedisTraceReporter
-from galileodb.sql.adapter import ExperimentSQLDatabase
+from galileodb.spool import Spool
+from galileodb.tracequeue import unpack_traces
 
 logger = logging.getLogger(__name__)
 
@@ -24,24 +30,53 @@ class TraceWriter(ABC):
     def write(self, traces: List[RequestTrace]):
         raise NotImplementedError
 
+    def close(self):
+        """
+        Releases the resources of the writer (e.g., open files). Called by the TraceLogger when it stops.
+        """
+        pass
 
-class TraceLogger(Process):
-    flush_interval = 20
 
-    def __init__(self, trace_queue: Queue, writer: TraceWriter = None, start=True) -> None:
+class TraceLogger(Process):
+    """
+    Reads traces from a queue and writes them in batches with the given TraceWriter. The messages on the queue are
+    either single traces, lists of traces or packed chunks of traces (see galileodb.tracequeue.TraceBatcher), or one
+    of the control messages POISON, START, PAUSE and FLUSH.
+    """
+
+    def __init__(self, trace_queue: Queue, writer: TraceWriter = None, start=True,
+                 flush_policy: FlushPolicy = None, spool: Spool = None) -> None:
         super().__init__()
-        self.flush_interval = int(os.getenv('galileo_expdb_trace_logger_flush', '20'))
+        if flush_policy is None:
+            flush_policy = FlushPolicy.from_env(int(os.getenv('galileo_expdb_trace_logger_flush', '20')))
+        self.flush_policy = flush_policy
+        self.spool = spool
         self.traces = trace_queue
         self.closed = False
         self.buffer = list()
         self.writer = writer
         self.running = start
 
+    @property
+    def flush_interval(self) -> int:
+        return self.flush_policy.max_size
+
+    @flush_interval.setter
+    def flush_interval(self, value: int):
+        self.flush_policy.max_size = self.flush_policy.initial_size = value
+
     def run(self):
         try:
             return self.listen()
         finally:
             self.flush()
+            if self.writer:
+                try:
+                    self.writer.close()
+                except Exception as e:
+                    logger.error('error closing trace writer: %s', e)
+            if self.spool:
+                self.spool.close()
 
     def flush(self):
         if not self.buffer:
@@ -50,6 +85,7 @@ class TraceLogger(Process):
 
         logger.debug('flushing trace buffer')
 
+        then = time.monotonic()
         if self.writer:
             try:
                 self.writer.write(self.buffer)
@@ -58,10 +94,15 @@ class TraceLogger(Process):
                     logger.exception('error writing traces')
                 else:
                     logger.error('error writing traces: %s', e)
+
+                if self.spool:
+                    logger.info('spooling %d traces', len(self.buffer))
+                    self.spool.append('traces', self.buffer)
         else:
             logger.debug('no writer to flush to')
 
         self.buffer.clear()
+        self.flush_policy.flushed(time.monotonic() - then)
 
     def close(self):
         self.closed = True
@@ -74,37 +115,55 @@ class TraceLogger(Process):
                 logger.debug('setting read timeout to 2 seconds')
                 timeout = 2
 
+            # while running, wake up when the buffer is due because of its age
+            wait = timeout if self.closed else self.flush_policy.time_until_due()
+
             try:
-                trace = self.traces.get(timeout=timeout)
-
-                if trace == POISON:
-                    logger.debug('poison received, setting closed to true')
-                    self.closed = True
-                    break
-                elif trace == FLUSH:
-                    logger.debug('flush command received, flushing buffer')
-                    self.flush()
-                    continue
-                elif trace == START:
-                    logger.debug('start received')
-                    self.running = True
-                    continue
-                elif trace == PAUSE:
-                    logger.debug('pause received, flushing remaining traces')
-                    self.running = False
-                    self.flush()
+                message = self.traces.get(timeout=wait)
+
+                if isinstance(message, str):
+                    if message == POISON:
+                        logger.debug('poison received, setting closed to true')
+                        self.closed = True
+                        break
+                    elif message == FLUSH:
+                        logger.debug('flush command received, flushing buffer')
+                        self.flush()
+                    elif message == START:
+                        logger.debug('start received')
+                        self.running = True
+                    elif message == PAUSE:
+                        logger.debug('pause received, flushing remaining traces')
+                        self.running = False
+                        self.flush()
                     continue
 
                 if self.running:
-                    self.buffer.append(trace)
-
-                if len(self.buffer) >= self.flush_interval:
-                    logger.debug('flush interval reached, flushing buffer')
+                    if isinstance(message, bytes):
+                        try:
+                            message = unpack_traces(message)
+                        except Exception as e:
+                            # e.g., a chunk of a newer producer, which should not stop the logger
+                            logger.error('error unpacking trace chunk of %d bytes: %s', len(message), e)
+                            continue
+
+                    if isinstance(message, list):
+                        self.buffer.extend(message)
+                        self.flush_policy.add_all(message)
+                    else:
+                        self.buffer.append(message)
+                        self.flush_policy.add(message)
+
+                if self.flush_policy.should_flush():
+                    logger.debug('flush policy triggered, flushing buffer')
                     self.flush()
 
             except KeyboardInterrupt:
                 break
             except Empty:
+                if not self.closed:
+                    self.flush()
+                    continue
                 logger.debug('queue is empty, exiting')
                 return
 
@@ -119,52 +178,261 @@ class RedisTopicTraceWriter(TraceWriter):
         self.reporter.report_multiple(traces)
 
 
+class RedisStreamTraceWriter(TraceWriter):
+    """
+    Appends traces to a Redis stream, from which they are read by RedisStreamTraceRecorders.
+    """
+
+    def __init__(self, rds, maxlen: int = None) -> None:
+        super().__init__()
+        self.reporter = RedisStreamTraceReporter(rds, maxlen=maxlen)
+
+    def write(self, traces: List[RequestTrace]):
+        self.reporter.report_multiple(traces)
+
+
 class DatabaseTraceWriter(TraceWriter):
+    """
+    Writes traces into an ExperimentDatabase. Traces that do not carry an experiment id are assigned to the
+    experiment at ingest time: either to the given `exp_id`, or to the currently running experiment, which is looked
+    up in the database and cached for `refresh_interval` seconds, or until an experiment is saved, updated or deleted
+    in this process. Traces created outside the start and end of the running experiment remain untagged, and are
+    picked up by ExperimentDatabase.touch_traces when the experiment is finalized.
+    """
     experiment_db: ExperimentDatabase
 
-    def __init__(self, experiment_db: ExperimentDatabase) -> None:
+    def __init__(self, experiment_db: ExperimentDatabase, exp_id: str = None, refresh_interval: float = None) -> None:
         self.experiment_db = experiment_db
-        self.connected = False
+        self.exp_id = exp_id
+
+        if refresh_interval is None:
+            refresh_interval = float(os.getenv('galileo_expdb_trace_writer_refresh', '5'))
+        self.refresh_interval = refresh_interval
+
+        self._experiment = None
+        self._experiment_expires = 0
+        # experiments that are started or finished in this process are picked up immediately
+        on_experiments_changed(self.invalidate)
 
     def write(self, traces: List[RequestTrace]):
-        self._assert_connection()
-        self.experiment_db.save_traces(traces)
-
-    def _assert_connection(self):
-        # this is a terrible hack due to multiprocessing issues:
-        # close() will delete the threadlocal (which is not actually accessible from the process) and create a new
-        # connection. The SqlAdapter adapter design may be broken. or python multiprocessing...
-        if self.connected:
-            return
+        self.experiment_db.save_traces(self._tag(traces))
 
-        if isinstance(self.experiment_db, ExperimentSQLDatabase):
-            self.experiment_db.db.reconnect()
-            self.connected = True
+    def invalidate(self):
+        """
+        Discards the cached running experiment, so that it is looked up again on the next write.
+        """
+        self._experiment_expires = 0
 
+    def _tag(self, traces: List[RequestTrace]) -> List[RequestTrace]:
+        if self.exp_id:
+            return [t._replace(exp_id=self.exp_id) if t.exp_id is None else t for t in traces]
 
-class FileTraceWriter(TraceWriter):
+        exp = self._running_experiment()
+        if exp is None:
+            return traces
+
+        tagged = list()
+        for t in traces:
+            if t.exp_id is None and exp.start is not None and t.created >= exp.start and (
+                    exp.end is None or t.created <= exp.end):
+                t = t._replace(exp_id=exp.id)
+            tagged.append(t)
+
+        return tagged
+
+    def _running_experiment(self):
+        now = time.time()
+        if now < self._experiment_expires:
+            return self._experiment
+
+        try:
+            self._experiment = self.experiment_db.get_running_experiment()
+        except NotImplementedError:
+            self._experiment = None
+        except Exception as e:
+            logger.warning('could not look up running experiment: %s', e)
+            self._experiment = None
 
-    def __init__(self, host_name, target_dir='/tmp/mc2/exp') -> None:
+        self._experiment_expires = now + self.refresh_interval
+        return self._experiment
+
+
+class FileTraceWriter(TraceWriter):
+    """
+    Writes traces as CSV into the file `traces-<host_name>.csv` in `target_dir`. The file is kept open between writes,
+    and each write is flushed to the operating system. Once the file reached `max_bytes` (on disk), or was opened
+    `max_age` seconds ago, it is rotated: it is closed and renamed to `traces-<host_name>-<time>.csv`, and a new file
+    is started. The files can be compressed as a stream ('gzip', or 'zstd' which requires the zstandard package),
+    resulting in `.csv.gz` and `.csv.zst` files. The fsync policy decides whether written traces are also synced to
+    disk: never ('none'), after each write ('flush'), or at most every `fsync_interval` seconds ('interval'). Unset
+    parameters are read from the environment (galileo_expdb_trace_file_*).
+
+    The file is opened by the first write, and belongs to the process that made it: a writer created in one process
+    and passed to a TraceLogger process writes from there, and the other process never flushes or closes the file.
+    """
+    compressions = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+    fsync_policies = ('none', 'flush', 'interval')
+
+    def __init__(self, host_name, target_dir='/tmp/mc2/exp', max_bytes: int = None, max_age: float = None,
+                 compression: str = None, fsync: str = None, fsync_interval: float = None,
+                 env: MutableMapping = os.environ) -> None:
+        """
+        :param host_name: the host name, part of the file name
+        :param target_dir: the directory of the trace files
+        :param max_bytes: the size in bytes after which the file is rotated (no rotation if not set)
+        :param max_age: the seconds after which the file is rotated (no rotation if not set)
+        :param compression: gzip, zstd, or None for uncompressed files
+        :param fsync: the fsync policy (none, flush, interval)
+        :param fsync_interval: the minimum seconds between two fsyncs of the interval policy
+        :param env: the environment to read unset parameters from
+        """
+        if max_bytes is None and env.get('galileo_expdb_trace_file_max_bytes'):
+            max_bytes = int(env['galileo_expdb_trace_file_max_bytes'])
+        if max_age is None and env.get('galileo_expdb_trace_file_max_age'):
+            max_age = float(env['galileo_expdb_trace_file_max_age'])
+        if compression is None:
+            compression = env.get('galileo_expdb_trace_file_compression') or None
+        if compression == 'none':
+            compression = None
+        if fsync is None:
+            fsync = env.get('galileo_expdb_trace_file_fsync', 'none')
+        if fsync_interval is None:
+            fsync_interval = float(env.get('galileo_expdb_trace_file_fsync_interval', '1'))
+
+        if compression not in self.compressions:
+            raise ValueError('unknown compression %s, expected gzip or zstd' % compression)
+        if fsync not in self.fsync_policies:
+            raise ValueError('unknown fsync policy %s, expected one of %s' % (fsync, ', '.join(self.fsync_policies)))
+
+        self.host_name = host_name
         self.target_dir = target_dir
-        self.file_name = 'traces-%s.csv' % host_name
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compression = compression
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+
+        self.file_name = 'traces-%s.csv%s' % (host_name, self.compressions[compression])
         self.file_path = os.path.join(self.target_dir, self.file_name)
+
+        self._raw = None  # the file
+        self._stream = None  # the compressor writing into the file, if compressed
+        self._text = None
+        self._writer = None
+        self._pid = None  # the process that opened the file
+        self._inherited = None
+        self._opened = 0
+        self._rows = 0
+        self._synced = 0
+
         self.mkdirp(self.target_dir)
-        self.init_file()
 
     def init_file(self):
         logger.debug('initializing trace file logger to log into %s', self.file_path)
-        if os.path.exists(self.file_path):
-            return
+        exists = os.path.exists(self.file_path)
+
+        self._raw = open(self.file_path, 'ab')
+        self._pid = os.getpid()
+        if self.compression == 'gzip':
+            # appending starts a new gzip member (or zstd frame), concatenated members are read as one stream
+            self._stream = gzip.GzipFile(filename='', mode='wb', fileobj=self._raw, compresslevel=6)
+        elif self.compression == 'zstd':
+            import zstandard
+            self._stream = zstandard.ZstdCompressor().stream_writer(self._raw, closefd=False)
+        else:
+            self._stream = None
 
-        logger.debug('initializing %s with header', self.file_path)
-        with open(self.file_path, 'w') as fd:
-            csv.writer(fd).writerow(RequestTrace._fields)
+        self._text = io.TextIOWrapper(self._stream or self._raw, encoding='utf-8')
+        self._writer = csv.writer(self._text)
+        self._opened = time.monotonic()
+        self._rows = 0
+
+        if not exists:
+            logger.debug('initializing %s with header', self.file_path)
+            self._writer.writerow(RequestTrace._fields)
+            self._flush()
 
     def write(self, buffer: List[RequestTrace]):
-        with open(self.file_path, 'a') as fd:
-            writer = csv.writer(fd)
-            for row in buffer:
-                writer.writerow(row)
+        if self._pid != os.getpid():
+            # not opened yet, or opened by the process this one was forked from
+            self._release_inherited()
+            self.init_file()
+        elif self._should_rotate():
+            self.rotate()
+
+        self._writer.writerows(buffer)
+        self._rows += len(buffer)
+        self._flush()
+
+        if self.fsync == 'flush' or (self.fsync == 'interval' and
+                                     time.monotonic() - self._synced >= self.fsync_interval):
+            self._sync()
+
+    def _should_rotate(self) -> bool:
+        if not self._rows:
+            return False
+        if self.max_bytes is not None and self._raw.tell() >= self.max_bytes:
+            return True
+        if self.max_age is not None and time.monotonic() - self._opened >= self.max_age:
+            return True
+        return False
+
+    def _flush(self):
+        self._text.flush()
+        if self._stream is not None:
+            self._stream.flush()
+        self._raw.flush()
+
+    def _sync(self):
+        os.fsync(self._raw.fileno())
+        self._synced = time.monotonic()
+
+    def rotate(self):
+        """
+        Closes the current file, renames it to traces-<host_name>-<time>.csv, and starts a new file.
+        """
+        self.close()
+
+        suffix = '.csv' + self.compressions[self.compression]
+        prefix = os.path.join(self.target_dir, 'traces-%s-%s' % (self.host_name, time.strftime('%Y%m%d%H%M%S')))
+        target = prefix + suffix
+        i = 0
+        while os.path.exists(target):
+            i += 1
+            target = '%s-%d%s' % (prefix, i, suffix)
+
+        logger.debug('rotating %s to %s', self.file_path, target)
+        os.rename(self.file_path, target)
+        self.init_file()
+
+    def _release_inherited(self):
+        if self._raw is None:
+            return
+        # the buffers (and compressor state) belong to the other process. finalizing them here would write them into
+        # the file a second time, so they are kept referenced until this process exits.
+        self._inherited = (self._raw, self._stream, self._text)
+        self._raw = self._stream = self._text = self._writer = None
+
+    def close(self):
+        if self._raw is None or self._pid != os.getpid():
+            return
+
+        if self._stream is not None:
+            # finishes the gzip member or zstd frame, the compressor leaves the file open
+            self._text.close()
+        else:
+            self._text.flush()
+            self._text.detach()
+
+        self._raw.flush()
+        if self.fsync != 'none':
+            self._sync()
+        self._raw.close()
+
+        # the next write opens the file again
+        self._raw = self._stream = self._text = self._writer = None
+        self._pid = None
+        self._rows = 0
 
     @staticmethod
     def mkdirp(path):
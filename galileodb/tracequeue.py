@@ -0,0 +1,204 @@
+"""
+Batched transports between the processes that create traces and the TraceLogger. Putting every trace on a
+multiprocessing queue separately pickles, sends and unpickles each trace on its own, which limits a client host to a
+few thousand traces per second. A TraceBatcher instead puts lists of traces, or packed chunks (bytes), on the queue,
+both of which the TraceLogger accepts besides single traces. The RingBufferQueue is a drop-in replacement for the
+multiprocessing queue that passes messages through shared memory instead of a pipe.
+"""
+import logging
+import os
+import pickle
+import struct
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from queue import Empty, Full
+from typing import List, Iterable
+
+from galileodb.flush import FlushPolicy, FlushBuffer
+from galileodb.model import RequestTrace
+
+logger = logging.getLogger(__name__)
+
+CHUNK_VERSION = 1
+
+
+def pack_traces(traces: Iterable[RequestTrace]) -> bytes:
+    """
+    Packs traces into a chunk: a version byte followed by the pickled list of plain tuples. Pickling plain tuples is
+    about twice as fast as pickling the NamedTuples, which are pickled with a reference to their class each.
+    """
+    return bytes([CHUNK_VERSION]) + pickle.dumps([tuple(t) for t in traces], protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def unpack_traces(chunk: bytes) -> List[RequestTrace]:
+    if not chunk or chunk[0] != CHUNK_VERSION:
+        raise ValueError('unknown trace chunk version %s' % (chunk[0] if chunk else None))
+    return list(map(RequestTrace._make, pickle.loads(memoryview(chunk)[1:])))
+
+
+class TraceBatcher:
+    """
+    Collects the traces of a producer and puts them on a TraceLogger queue in batches: as soon as `batch_size` traces
+    are buffered, or once the oldest buffered trace is `max_age` seconds old. Call flush() before sending control
+    messages (FLUSH, PAUSE, ...) to keep them in order with the traces, and close() when done.
+    """
+
+    def __init__(self, queue, batch_size: int = 256, max_age: float = 0.1, packed=False) -> None:
+        """
+        :param queue: the queue of the TraceLogger (a multiprocessing Queue or a RingBufferQueue)
+        :param batch_size: the number of traces per message
+        :param max_age: the maximum time in seconds a trace is held back
+        :param packed: put packed chunks (bytes) instead of lists of traces
+        """
+        super().__init__()
+        self.queue = queue
+        self.packed = packed
+        self.buffer = FlushBuffer(self._put, FlushPolicy(max_size=batch_size, max_age=max_age))
+        self.buffer.start_timer()
+
+    def _put(self, traces: List[RequestTrace]):
+        self.queue.put(pack_traces(traces) if self.packed else traces)
+
+    def put(self, trace: RequestTrace):
+        self.buffer.append(trace)
+
+    def put_many(self, traces: Iterable[RequestTrace]):
+        for trace in traces:
+            self.buffer.append(trace)
+
+    def flush(self):
+        self.buffer.flush()
+
+    def close(self):
+        self.buffer.stop_timer()
+        self.buffer.flush()
+
+
+_positions = struct.Struct('=QQ')
+_frame = struct.Struct('=IB')
+
+_BYTES = 0
+_PICKLE = 1
+
+
+class RingBufferQueue:
+    """
+    A multi-producer queue backed by a ring buffer in shared memory, which implements the put/get subset of the
+    multiprocessing Queue that the TraceLogger uses. Messages are copied into the buffer by the producer and out of
+    it by the consumer, there is no feeder thread and no pipe. Bytes (e.g., packed trace chunks) are passed as is,
+    all other messages are pickled.
+
+    The queue is shared with child processes by passing it to them (like a multiprocessing Queue). The process that
+    created the queue should unlink() it when done.
+    """
+
+    def __init__(self, size: int = 16 * 1024 * 1024, ctx=None) -> None:
+        """
+        :param size: the capacity of the ring buffer in bytes (bounds the size of a single message)
+        :param ctx: the multiprocessing context
+        """
+        super().__init__()
+        ctx = ctx or get_context()
+        self.size = size
+        self._shm = SharedMemory(create=True, size=size + _positions.size)
+        _positions.pack_into(self._shm.buf, 0, 0, 0)
+        self._cond = ctx.Condition(ctx.Lock())
+        self._owner = os.getpid()
+
+    def __getstate__(self):
+        return self.size, self._shm.name, self._cond, self._owner
+
+    def __setstate__(self, state):
+        self.size, name, self._cond, self._owner = state
+        self._shm = SharedMemory(name=name)
+        try:
+            # only the creating process may unlink the shared memory, which the resource tracker would otherwise do
+            # once this process exits
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(self._shm._name, 'shared_memory')
+        except Exception:
+            pass
+
+    def _positions(self):
+        return _positions.unpack_from(self._shm.buf, 0)
+
+    def _write(self, position: int, data: bytes):
+        buf = self._shm.buf
+        offset = _positions.size + position % self.size
+        first = min(len(data), _positions.size + self.size - offset)
+        buf[offset:offset + first] = data[:first]
+        if first < len(data):
+            buf[_positions.size:_positions.size + len(data) - first] = data[first:]
+
+    def _read(self, position: int, n: int) -> bytes:
+        buf = self._shm.buf
+        offset = _positions.size + position % self.size
+        first = min(n, _positions.size + self.size - offset)
+        data = bytes(buf[offset:offset + first])
+        if first < n:
+            data += bytes(buf[_positions.size:_positions.size + n - first])
+        return data
+
+    def put(self, obj, block=True, timeout: float = None):
+        if isinstance(obj, bytes):
+            kind, payload = _BYTES, obj
+        else:
+            kind, payload = _PICKLE, pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+
+        n = _frame.size + len(payload)
+        if n > self.size:
+            raise ValueError('message of %d bytes does not fit into ring buffer of %d bytes' % (n, self.size))
+
+        with self._cond:
+            def has_room():
+                head, tail = self._positions()
+                return self.size - (tail - head) >= n
+
+            if not self._cond.wait_for(has_room, timeout if block else 0):
+                raise Full
+
+            head, tail = self._positions()
+            self._write(tail, _frame.pack(len(payload), kind) + payload)
+            _positions.pack_into(self._shm.buf, 0, head, tail + n)
+            self._cond.notify_all()
+
+    def get(self, block=True, timeout: float = None):
+        with self._cond:
+            def has_message():
+                head, tail = self._positions()
+                return tail > head
+
+            if not self._cond.wait_for(has_message, timeout if block else 0):
+                raise Empty
+
+            head, tail = self._positions()
+            length, kind = _frame.unpack(self._read(head, _frame.size))
+            payload = self._read(head + _frame.size, length)
+            _positions.pack_into(self._shm.buf, 0, head + _frame.size + length, tail)
+            self._cond.notify_all()
+
+        return payload if kind == _BYTES else pickle.loads(payload)
+
+    def put_nowait(self, obj):
+        self.put(obj, block=False)
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def empty(self) -> bool:
+        head, tail = self._positions()
+        return head == tail
+
+    def close(self):
+        """
+        Detaches this process from the shared memory.
+        """
+        self._shm.close()
+
+    def unlink(self):
+        """
+        Detaches from and destroys the shared memory (only in the process that created the queue).
+        """
+        self._shm.close()
+        if os.getpid() == self._owner:
+            self._shm.unlink()
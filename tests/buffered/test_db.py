@@ -0,0 +1,335 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from galileodb.buffered.db import BufferedExperimentDatabase, WriteBehindQueue, SpillFile
+from galileodb.model import Telemetry, RequestTrace, ExperimentEvent, Experiment
+from galileodb.sql.adapter import ExperimentSQLDatabase
+from galileodb.sql.driver.sqlite import SqliteAdapter
+
+
+class TestWriteBehindQueue(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.batches = list()
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def write(self, batch):
+        self.gate.wait()
+        self.batches.append(batch)
+
+    def test_flush_writes_everything_put_before(self):
+        q = WriteBehindQueue('test', self.write, batch_size=100, max_age=60)
+        q.start()
+        try:
+            q.put([1, 2])
+            q.put([3])
+            self.assertTrue(q.flush(2))
+            self.assertEqual([1, 2, 3], [i for batch in self.batches for i in batch])
+        finally:
+            q.close()
+
+    def test_batch_is_written_after_max_age(self):
+        q = WriteBehindQueue('test', self.write, batch_size=100, max_age=0.01)
+        q.start()
+        try:
+            q.put([1])
+            q._thread.join(0.2)
+            self.assertEqual([[1]], self.batches)
+        finally:
+            q.close()
+
+    def test_batches_are_coalesced(self):
+        q = WriteBehindQueue('test', self.write, batch_size=3, max_age=60)
+        q.start()
+        try:
+            for i in range(7):
+                q.put([i])
+            q.flush(2)
+            self.assertEqual([[0, 1, 2], [3, 4, 5], [6]], self.batches)
+        finally:
+            q.close()
+
+    def test_drop_oldest_policy(self):
+        self.gate.clear()
+        q = WriteBehindQueue('test', self.write, max_size=3, batch_size=100, max_age=60, policy='drop-oldest')
+        q.start()
+        try:
+            q.put([1, 2, 3])
+            q.put([4, 5])
+            self.assertEqual(2, q.dropped)
+            self.gate.set()
+            q.flush(2)
+            self.assertEqual([3, 4, 5], [i for batch in self.batches for i in batch])
+        finally:
+            q.close()
+
+    def test_spill_policy(self):
+        tmp_dir = tempfile.mkdtemp(prefix='galileo_test_')
+        try:
+            self.gate.clear()
+            spill = SpillFile(os.path.join(tmp_dir, 'test.spill'))
+            q = WriteBehindQueue('test', self.write, max_size=2, batch_size=100, max_age=60, policy='spill',
+                                 spill=spill)
+            q.start()
+            q.put([1, 2])
+            q.put([3])
+            q.put([4])
+            self.assertTrue(spill)
+
+            self.gate.set()
+            q.close(2)
+
+            self.assertFalse(spill)
+            self.assertEqual([1, 2, 3, 4], [i for batch in self.batches for i in batch])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_spilled_items_are_read_back_in_chunks(self):
+        tmp_dir = tempfile.mkdtemp(prefix='galileo_test_')
+        try:
+            # left over by a previous process
+            spill = SpillFile(os.path.join(tmp_dir, 'test.spill'))
+            spill.append([1, 2, 3])
+            spill.append([4, 5])
+
+            sizes = list()
+            take = spill.take
+
+            def tracking_take(max_items=None):
+                items = take(max_items)
+                sizes.append(len(items))
+                return items
+
+            spill.take = tracking_take
+
+            q = WriteBehindQueue('test', self.write, max_size=2, batch_size=100, max_age=60, policy='spill',
+                                 spill=spill)
+            q.start()
+            try:
+                self.assertTrue(q.flush(2))
+                self.assertEqual([1, 2, 3, 4, 5], [i for batch in self.batches for i in batch])
+                self.assertTrue(all(n <= 2 for n in sizes), sizes)
+                self.assertFalse(spill)
+            finally:
+                q.close()
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_spill_does_not_hold_queue_lock_while_appending(self):
+        tmp_dir = tempfile.mkdtemp(prefix='galileo_test_')
+        try:
+            spill = SpillFile(os.path.join(tmp_dir, 'test.spill'))
+            appending = threading.Event()
+            resume = threading.Event()
+            append = spill.append
+
+            def slow_append(items):
+                appending.set()
+                resume.wait(2)
+                append(items)
+
+            spill.append = slow_append
+
+            q = WriteBehindQueue('test', self.write, max_size=1, batch_size=100, max_age=60, policy='spill',
+                                 spill=spill)
+            q.start()
+            try:
+                producer = threading.Thread(target=q.put, args=([1, 2],))
+                producer.start()
+                self.assertTrue(appending.wait(2))
+
+                self.assertTrue(q._cond.acquire(timeout=1), 'put holds the queue lock while appending')
+                q._cond.release()
+
+                resume.set()
+                producer.join(2)
+                self.assertTrue(q.flush(2))
+                self.assertEqual([1, 2], [i for batch in self.batches for i in batch])
+            finally:
+                resume.set()
+                q.close()
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_spill_policy_with_concurrent_producers(self):
+        tmp_dir = tempfile.mkdtemp(prefix='galileo_test_')
+        try:
+            spill = SpillFile(os.path.join(tmp_dir, 'test.spill'))
+            q = WriteBehindQueue('test', self.write, max_size=5, batch_size=3, max_age=0.01, policy='spill',
+                                 spill=spill)
+            q.start()
+            try:
+                def produce(n):
+                    for i in range(50):
+                        q.put([(n, i)])
+
+                producers = [threading.Thread(target=produce, args=(n,)) for n in range(4)]
+                for producer in producers:
+                    producer.start()
+                for producer in producers:
+                    producer.join(5)
+
+                self.assertTrue(q.flush(5))
+                items = [i for batch in self.batches for i in batch]
+                for n in range(4):
+                    self.assertEqual(list(range(50)), [i for m, i in items if m == n])
+                self.assertEqual(200, len(items))
+            finally:
+                q.close()
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_block_policy_waits_for_room(self):
+        self.gate.clear()
+        q = WriteBehindQueue('test', self.write, max_size=2, batch_size=100, max_age=60, policy='block')
+        q.start()
+        try:
+            q.put([1, 2])
+            producer = threading.Thread(target=q.put, args=([3],))
+            producer.start()
+            producer.join(0.1)
+            self.assertTrue(producer.is_alive())
+
+            self.gate.set()
+            q.flush(2)
+            producer.join(2)
+            q.flush(2)
+            self.assertEqual([1, 2, 3], [i for batch in self.batches for i in batch])
+        finally:
+            self.gate.set()
+            q.close()
+
+    def test_failed_batch_does_not_stop_worker(self):
+        def write(batch):
+            if batch == [1]:
+                raise IOError('oops')
+            self.batches.append(batch)
+
+        q = WriteBehindQueue('test', write, batch_size=1, max_age=60)
+        q.start()
+        try:
+            q.put([1])
+            q.put([2])
+            q.flush(2)
+            self.assertEqual(1, q.failed)
+            self.assertEqual([[2]], self.batches)
+        finally:
+            q.close()
+
+    def test_failing_worker_does_not_block_flush(self):
+        tmp_dir = tempfile.mkdtemp(prefix='galileo_test_')
+        try:
+            spill = SpillFile(os.path.join(tmp_dir, 'test.spill'))
+
+            def take(max_items=None):
+                raise OSError('oops')
+
+            spill.take = take
+            q = WriteBehindQueue('test', self.write, max_size=1, batch_size=100, max_age=60, policy='spill',
+                                 spill=spill)
+            q.start()
+            try:
+                q.put([1, 2])
+                self.assertTrue(q.flush(2))
+                self.assertEqual(2, q.failed)
+                self.assertRaises(ValueError, q.put, [3])
+            finally:
+                q.close()
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+class TestSpillFile(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp(prefix='galileo_test_')
+        self.spill = SpillFile(os.path.join(self.tmp_dir, 'test.spill'))
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def test_take_leaves_rest_on_disk(self):
+        self.spill.append([1, 2])
+        self.spill.append([3, 4, 5])
+        self.spill.append([6])
+
+        self.assertEqual(6, self.spill.count())
+        self.assertEqual([1, 2, 3], self.spill.take(3))
+        self.assertEqual(3, self.spill.count())
+
+        self.spill.append([7])
+        self.assertEqual([4, 5, 6], self.spill.take(3))
+        self.assertTrue(self.spill)
+        self.assertEqual([7], self.spill.take(3))
+        self.assertFalse(self.spill)
+        self.assertFalse(os.path.exists(self.spill.path))
+
+    def test_take_without_limit_takes_everything(self):
+        self.spill.append([1, 2])
+        self.spill.append([3])
+
+        self.assertEqual([1, 2, 3], self.spill.take())
+        self.assertFalse(self.spill)
+
+    def test_truncated_batch_is_skipped(self):
+        self.spill.append([1, 2])
+        self.spill.append([3, 4])
+        # cut off by a crash while appending
+        os.truncate(self.spill.path, os.path.getsize(self.spill.path) - 3)
+
+        self.assertEqual(2, self.spill.count())
+
+        self.spill.append([5])
+        self.assertEqual([1, 2, 5], self.spill.take())
+        self.assertFalse(self.spill)
+
+
+class TestBufferedExperimentDatabase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.db_file = tempfile.mktemp('.sqlite', 'galileo_test_')
+        self.db = BufferedExperimentDatabase(ExperimentSQLDatabase(SqliteAdapter(self.db_file)), max_age=60)
+        self.db.open()
+
+    def tearDown(self) -> None:
+        self.db.close()
+        os.remove(self.db_file)
+
+    def test_flush_makes_writes_visible(self):
+        self.db.save_telemetry([Telemetry(1., 'cpu', 'n1', 32., 'exp1')])
+        self.db.save_event(ExperimentEvent('exp1', 1., 'start'))
+        self.db.flush()
+
+        self.assertEqual([Telemetry(1., 'cpu', 'n1', 32., 'exp1')], self.db.get_telemetry('exp1'))
+        self.assertEqual(1, len(self.db.get_events('exp1')))
+
+    def test_touch_traces_flushes_queued_traces(self):
+        exp = Experiment('exp1', start=1, end=10, status='FINISHED')
+        self.db.save_experiment(exp)
+        self.db.save_traces([RequestTrace('r1', 'client', 'service', 2, 3, 4)])
+
+        self.db.touch_traces(exp)
+
+        self.assertEqual(1, len(self.db.get_traces('exp1')))
+
+    def test_close_drains_queues(self):
+        self.db.save_telemetry([Telemetry(1., 'cpu', 'n1', 32., 'exp1')])
+        self.db.close()
+
+        db = ExperimentSQLDatabase(SqliteAdapter(self.db_file))
+        db.open()
+        try:
+            self.assertEqual(1, len(db.get_telemetry('exp1')))
+        finally:
+            db.close()
+
+    def test_spill_policy_requires_directory(self):
+        self.assertRaises(ValueError, BufferedExperimentDatabase, self.db.db, policy='spill')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+
+from influxdb_client import Point, WritePrecision
+
+from galileodb.influx import lineprotocol
+from galileodb.model import Telemetry, RequestTrace, ExperimentEvent
+
+
+class TestLineProtocol(unittest.TestCase):
+
+    def test_telemetry_matches_point(self):
+        t = Telemetry(1623231542.123456, 'cpu load', 'node,1', 0.25, 'exp=1', 'sub\\')
+
+        expected = Point('telemetry') \
+            .time(lineprotocol.time_ns(t.timestamp), WritePrecision.NS) \
+            .field('value', float(t.value)) \
+            .tag('exp_id', t.exp_id) \
+            .tag('node', t.node) \
+            .tag('metric', t.metric) \
+            .tag('subsystem', t.subsystem) \
+            .to_line_protocol()
+
+        self.assertEqual(expected, lineprotocol.telemetry_line(t))
+
+    def test_trace_matches_point(self):
+        t = RequestTrace('req "1"', 'c 1', 's\n1', 1.5, 2., 3.25, 500, None, 'exp1', 'a\\b', '')
+
+        p = Point('traces') \
+            .time(lineprotocol.trace_time_ns(t), WritePrecision.NS) \
+            .field('request_id', t.request_id) \
+            .tag('client', t.client) \
+            .tag('service', t.service) \
+            .tag('server', t.server) \
+            .tag('exp_id', t.exp_id)
+        for key in ('created', 'sent', 'done'):
+            p.field(key, float(getattr(t, key)))
+        p.field('status', int(t.status))
+        p.field('response', t.response)
+        p.field('headers', t.headers)
+
+        self.assertEqual(p.to_line_protocol(), lineprotocol.trace_line(t))
+
+    def test_traces_sent_at_the_same_time_are_different_points(self):
+        t1 = RequestTrace('req1', 'c1', 's1', 1623231542.1, 1623231542.2, 1623231542.3, 200, 'srv1', 'exp1')
+        t2 = t1._replace(request_id='req2')
+
+        lines = lineprotocol.serialize([t1, t2], lineprotocol.trace_line).decode('utf-8').split('\n')
+        # a point is identified by its measurement and tags (before the first space) and its time (after the last)
+        keys = {(lp.split(' ')[0], lp.split(' ')[-1]) for lp in lines}
+
+        self.assertEqual(2, len(keys))
+        self.assertEqual(lineprotocol.trace_line(t1), lineprotocol.trace_line(t1._replace()))
+        self.assertLess(abs(lineprotocol.trace_time_ns(t1) - lineprotocol.time_ns(t1.sent)),
+                        lineprotocol.TRACE_TIME_WINDOW_NS)
+
+    def test_trace_times_of_simultaneous_requests_do_not_collide(self):
+        t = RequestTrace('', 'c1', 's1', 1623231542.1, 1623231542.2, 1623231542.3, 200, 'srv1', 'exp1')
+
+        for request_ids in [['req%d' % i for i in range(100)], ['%d' % i for i in range(100)],
+                            ['1623231542.2%05d' % i for i in range(100)]]:
+            times = {lineprotocol.trace_time_ns(t._replace(request_id=request_id)) for request_id in request_ids}
+            self.assertEqual(len(request_ids), len(times))
+
+    def test_event_matches_point(self):
+        e = ExperimentEvent('exp1', 10, 'phase', 3)
+
+        expected = Point('events') \
+            .time(lineprotocol.time_ns(e.timestamp), WritePrecision.NS) \
+            .tag('name', e.name) \
+            .field('value', e.value) \
+            .tag('exp_id', e.exp_id) \
+            .tag('ts', float(e.timestamp)) \
+            .to_line_protocol()
+
+        self.assertEqual(expected, lineprotocol.event_line(e, 'v1'))
+
+    def test_point_without_fields_is_skipped(self):
+        telemetry = [Telemetry(1, 'cpu', 'n1', float('nan'), 'exp1'), Telemetry(2, 'cpu', 'n1', 1., 'exp1')]
+
+        data = lineprotocol.serialize(telemetry, lineprotocol.telemetry_line)
+
+        self.assertEqual(b'telemetry,exp_id=exp1,metric=cpu,node=n1 value=1 2000000000', data)
+
+    def test_time_ns_is_integer_nanoseconds(self):
+        self.assertEqual(1623231542123456000, lineprotocol.time_ns(1623231542.123456))
+        self.assertEqual(1000000000, lineprotocol.time_ns('1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
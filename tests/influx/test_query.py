@@ -0,0 +1,85 @@
+import unittest
+from unittest.mock import MagicMock
+
+from galileodb.influx import lineprotocol
+from galileodb.influx.db import InfluxExperimentDatabase
+from galileodb.model import RequestTrace
+
+
+class TestInfluxQueryPushdown(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.exp_db = InfluxExperimentDatabase(MagicMock())
+        self.exp_db.query = MagicMock()
+        self.exp_db.query.query_stream.return_value = iter([])
+        self.exp_db.query.query_csv.return_value = iter([])
+
+    def last_query(self) -> str:
+        return self.exp_db.query.query_csv.call_args[0][0]
+
+    def test_get_telemetry_without_filters(self):
+        self.exp_db.get_telemetry('exp1')
+
+        query = self.last_query()
+        self.assertIn('from(bucket: "exp1")', query)
+        self.assertIn('range(start: 1970-01-01, stop: ', query)
+        self.assertEqual(1, query.count('filter('))
+
+    def test_get_telemetry_pushes_down_filters(self):
+        self.exp_db.get_telemetry('exp1', node='n"1', metric='cpu', start=1, end=2.5)
+
+        query = self.last_query()
+        self.assertIn('range(start: 1970-01-01T00:00:01.000000Z, stop: 1970-01-01T00:00:02.500000Z)', query)
+        self.assertIn('filter(fn: (r) => r["node"] == "n\\"1")', query)
+        self.assertIn('filter(fn: (r) => r["metric"] == "cpu")', query)
+        self.assertNotIn('r["subsystem"]', query)
+
+    def test_get_traces_filters_created_tag(self):
+        self.exp_db.get_traces('exp1', service='s1', status=200, start=1, end=2)
+
+        query = self.last_query()
+        # the point time of a trace may be up to a millisecond before it was sent
+        self.assertIn('range(start: 1970-01-01T00:00:00.999000Z, stop: ', query)
+        self.assertIn('filter(fn: (r) => string(v: r["status"]) == "200")', query)
+        self.assertLess(query.index('r["service"] == "s1"'), query.index('pivot('))
+        self.assertLess(query.index('pivot('), query.index('r["status"]'))
+        self.assertIn('filter(fn: (r) => float(v: r["created"]) >= 1.0000000)', query)
+        self.assertIn('filter(fn: (r) => float(v: r["created"]) < 2.0000000)', query)
+
+    def test_get_traces_columns_projects_columns(self):
+        self.exp_db.get_traces_columns('exp1')
+
+        query = self.last_query()
+        self.assertIn('keep(columns: ["request_id", "client", "service", "created", "sent", "done", "status", '
+                      '"server", "exp_id"])', query)
+        self.assertLess(query.index('pivot('), query.index('keep('))
+
+    def test_get_telemetry_resampled_aggregates_windows(self):
+        self.exp_db.get_telemetry_resampled('exp1', 0.5, agg=('mean', 'max'), node='n1')
+
+        queries = [call[0][0] for call in self.exp_db.query.query_stream.call_args_list]
+        self.assertEqual(2, len(queries))
+        self.assertIn('group(columns: ["exp_id", "node", "metric", "subsystem"])', queries[0])
+        self.assertIn('aggregateWindow(every: 500000000ns, fn: mean, timeSrc: "_start", createEmpty: false)',
+                      queries[0])
+        self.assertIn('fn: max,', queries[1])
+
+    def test_get_telemetry_resampled_rejects_unknown_aggregate(self):
+        self.assertRaises(ValueError, self.exp_db.get_telemetry_resampled, 'exp1', 1, ('median',))
+
+    def test_save_traces_uses_deterministic_time(self):
+        self.exp_db.writer = MagicMock()
+        trace = RequestTrace('req1', 'c1', 's1', 1.1, 1.25, 1.3, exp_id='exp1')
+
+        self.exp_db.save_traces([trace])
+        self.exp_db.save_traces([trace])
+
+        first, second = [call[1]['record'] for call in self.exp_db.writer.write.call_args_list]
+        self.assertEqual(first, second)
+        # the millisecond the trace was sent, plus the sub-millisecond offset of its request id
+        self.assertTrue(first.endswith(b' %d' % lineprotocol.trace_time_ns(trace)))
+        self.assertEqual(1250, lineprotocol.trace_time_ns(trace) // 1000000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import unittest
+from unittest.mock import MagicMock
+
+from galileodb.influx import lineprotocol
+from galileodb.influx.db import InfluxExperimentDatabase
+from galileodb.model import Telemetry, RequestTrace, ExperimentEvent
+
+
+class TestInfluxSchema(unittest.TestCase):
+
+    def test_v2_telemetry_has_no_timestamp_tag(self):
+        lp = lineprotocol.telemetry_line(Telemetry(1.5, 'cpu', 'n1', 2., 'exp1'), 'v2')
+        self.assertEqual('telemetry,exp_id=exp1,metric=cpu,node=n1 value=2 1500000000', lp)
+
+    def test_v1_telemetry_has_timestamp_tag(self):
+        lp = lineprotocol.telemetry_line(Telemetry(1.5, 'cpu', 'n1', 2., 'exp1'), 'v1')
+        self.assertEqual('telemetry,exp_id=exp1,metric=cpu,node=n1,ts=1.5 value=2 1500000000', lp)
+
+    def test_v2_trace_only_tags_dimensions(self):
+        trace = RequestTrace('req1', 'c1', 's1', 1.0, 1.25, 1.5, 200, 'srv1', 'exp1', response='ok')
+        lp = lineprotocol.trace_line(trace, 'v2')
+
+        tags, fields, _ = lp.split(' ')
+        self.assertEqual('traces,client=c1,exp_id=exp1,server=srv1,service=s1', tags)
+        self.assertEqual({'created=1', 'done=1.5', 'request_id="req1"', 'response="ok"', 'sent=1.25', 'status=200i'},
+                         set(fields.split(',')))
+
+    def test_v2_event_has_no_timestamp_tag(self):
+        lp = lineprotocol.event_line(ExperimentEvent('exp1', 2.5, 'start', 'x'), 'v2')
+        self.assertEqual('events,exp_id=exp1,name=start value="x" 2500000000', lp)
+
+    def test_rejects_unknown_schema(self):
+        self.assertRaises(ValueError, InfluxExperimentDatabase, MagicMock(), schema='v3')
+
+    def test_reads_telemetry_of_both_schemas(self):
+        exp_db = self._query_result([
+            ['', 'result', 'table', '_time', 'ts', 'metric', 'node', 'value', 'exp_id'],
+            ['', '_result', '0', '1970-01-01T00:00:01.5Z', '1.5', 'cpu', 'n1', '2', 'exp1'],
+            [''],
+            ['', 'result', 'table', '_time', 'metric', 'node', 'value', 'exp_id', 'subsystem'],
+            ['', '_result', '1', '1970-01-01T00:00:02.000000001Z', 'cpu', 'n1', '3', 'exp1', 'sub'],
+        ])
+
+        self.assertEqual([
+            Telemetry(1.5, 'cpu', 'n1', 2., 'exp1'),
+            Telemetry(2.000000001, 'cpu', 'n1', 3., 'exp1', 'sub'),
+        ], exp_db.get_telemetry('exp1'))
+
+    def test_reads_traces_of_both_schemas(self):
+        exp_db = self._query_result([
+            ['', 'result', 'table', 'request_id', 'client', 'service', 'created', 'sent', 'done', 'status', 'server',
+             'exp_id'],
+            ['', '_result', '0', 'req1', 'c1', 's1', '1.0', '1.25', '1.5', '200', 'srv1', 'exp1'],
+            ['', '_result', '1', 'req2', 'c1', 's1', '1', '1.25', '1.5', '500', '', 'exp1'],
+        ])
+
+        self.assertEqual([
+            RequestTrace('req1', 'c1', 's1', 1.0, 1.25, 1.5, 200, 'srv1', 'exp1'),
+            RequestTrace('req2', 'c1', 's1', 1.0, 1.25, 1.5, 500, None, 'exp1'),
+        ], exp_db.get_traces('exp1'))
+
+    def test_reads_telemetry_columns(self):
+        exp_db = self._query_result([
+            ['', 'result', 'table', '_time', 'metric', 'node', 'value', 'exp_id'],
+            ['', '_result', '0', '1970-01-01T00:00:01Z', 'cpu', 'n1', '2', 'exp1'],
+            ['', '_result', '0', '1970-01-01T00:00:02Z', 'cpu', 'n2', '3.5', 'exp1'],
+        ])
+
+        columns = exp_db.get_telemetry_columns('exp1')
+
+        self.assertEqual([1., 2.], list(columns['timestamp']))
+        self.assertEqual([2., 3.5], list(columns['value']))
+        self.assertEqual(['n1', 'n2'], list(columns.decode('node')))
+        self.assertEqual([None, None], list(columns.decode('subsystem')))
+
+    @staticmethod
+    def _query_result(rows):
+        exp_db = InfluxExperimentDatabase(MagicMock())
+        exp_db.query = MagicMock()
+        exp_db.query.query_csv.return_value = iter(rows)
+        return exp_db
+
+    def test_migrate_schema_replaces_bucket(self):
+        exp_db = InfluxExperimentDatabase(MagicMock(), schema='v1')
+        exp_db.open()
+        source, target = MagicMock(), MagicMock()
+        exp_db.bucket.find_bucket_by_name.side_effect = lambda name: source if name == 'exp1' else None
+        exp_db.bucket.create_bucket.return_value = target
+        exp_db.iter_telemetry = MagicMock(return_value=iter([Telemetry(i, 'cpu', 'n1', i, 'exp1') for i in range(3)]))
+        exp_db.iter_traces = MagicMock(return_value=iter([]))
+        exp_db.iter_events = MagicMock(return_value=iter([]))
+
+        exp_db.migrate_schema('exp1', batch_size=2)
+
+        writer = exp_db.client.write_api.return_value
+        batches = [call[1]['record'] for call in writer.write.call_args_list]
+        self.assertEqual([2, 1], [len(batch.splitlines()) for batch in batches])
+        self.assertNotIn(b'ts=', batches[0])
+        self.assertEqual('exp1.migrating', writer.write.call_args[1]['bucket'])
+        exp_db.bucket.delete_bucket.assert_called_once_with(source)
+        self.assertEqual('exp1', target.name)
+        exp_db.bucket.update_bucket.assert_called_once_with(target)
+
+    def test_migrate_schema_finishes_interrupted_rename(self):
+        exp_db = InfluxExperimentDatabase(MagicMock())
+        exp_db.open()
+        target = MagicMock()
+        exp_db.bucket.find_bucket_by_name.side_effect = lambda name: target if name == 'exp1.migrating' else None
+
+        exp_db.migrate_schema('exp1')
+
+        exp_db.client.write_api.return_value.write.assert_not_called()
+        exp_db.bucket.delete_bucket.assert_not_called()
+        self.assertEqual('exp1', target.name)
+        exp_db.bucket.update_bucket.assert_called_once_with(target)
+
+    def test_migrate_schema_without_bucket_raises(self):
+        exp_db = InfluxExperimentDatabase(MagicMock())
+        exp_db.open()
+        exp_db.bucket.find_bucket_by_name.return_value = None
+
+        self.assertRaises(ValueError, exp_db.migrate_schema, 'exp1')
+
+
+if __name__ == '__main__':
+    unittest.main()
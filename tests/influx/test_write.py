@@ -0,0 +1,103 @@
+import unittest
+from unittest.mock import MagicMock
+
+from influxdb_client import InfluxDBClient, WriteOptions
+from influxdb_client.client.write_api import WriteType
+
+from galileodb.factory import create_influxdb_write_options_from_env
+from galileodb.influx.db import InfluxExperimentDatabase
+from galileodb.model import Telemetry
+
+
+class TestInfluxWriteOptions(unittest.TestCase):
+
+    def test_defaults_to_synchronous_writes(self):
+        options = create_influxdb_write_options_from_env({})
+        self.assertEqual(WriteType.synchronous, options.write_type)
+
+    def test_reads_batching_options_from_env(self):
+        options = create_influxdb_write_options_from_env({
+            'galileo_expdb_influxdb_write_mode': 'batching',
+            'galileo_expdb_influxdb_batch_size': '5000',
+            'galileo_expdb_influxdb_flush_interval': '200',
+            'galileo_expdb_influxdb_jitter_interval': '50',
+            'galileo_expdb_influxdb_max_retries': '0',
+        })
+
+        self.assertEqual(WriteType.batching, options.write_type)
+        self.assertEqual(5000, options.batch_size)
+        self.assertEqual(200, options.flush_interval)
+        self.assertEqual(50, options.jitter_interval)
+        self.assertEqual(0, options.max_retries)
+
+    def test_rejects_unknown_write_mode(self):
+        env = {'galileo_expdb_influxdb_write_mode': 'eventually'}
+        self.assertRaises(ValueError, create_influxdb_write_options_from_env, env)
+
+
+class TestInfluxBatchingWrites(unittest.TestCase):
+
+    def test_close_drains_writer_before_closing_client(self):
+        client = MagicMock()
+        exp_db = InfluxExperimentDatabase(client, write_options=WriteOptions(write_type=WriteType.batching))
+        exp_db.open()
+
+        exp_db.close()
+
+        closed = [name for name, _, _ in client.mock_calls if name.endswith('close')]
+        self.assertEqual(['write_api().close', 'close'], closed)
+
+    def test_failed_batch_is_passed_to_error_callback(self):
+        failed = list()
+        # nothing listens on port 1, so every write fails
+        client = InfluxDBClient(url='http://localhost:1', token='token', org='galileo', timeout=1000)
+        options = WriteOptions(write_type=WriteType.batching, batch_size=2, flush_interval=100, max_retries=0)
+        exp_db = InfluxExperimentDatabase(client, write_options=options,
+                                          error_callback=lambda conf, data, e: failed.append((conf, data)))
+        exp_db.open()
+
+        exp_db.save_telemetry([Telemetry(1, 'cpu', 'n1', 1., 'exp1'), Telemetry(2, 'cpu', 'n1', 2., 'exp1')])
+        exp_db.close()
+
+        self.assertEqual(1, exp_db.failed_batches)
+        self.assertEqual(1, len(failed))
+        self.assertEqual('exp1', failed[0][0][0])
+        self.assertEqual(2, len(failed[0][1].splitlines()))
+
+    def test_batch_size_counts_points(self):
+        failed = list()
+        client = InfluxDBClient(url='http://localhost:1', token='token', org='galileo', timeout=1000)
+        options = WriteOptions(write_type=WriteType.batching, batch_size=2, flush_interval=100, max_retries=0)
+        exp_db = InfluxExperimentDatabase(client, write_options=options,
+                                          error_callback=lambda conf, data, e: failed.append(data))
+        exp_db.open()
+
+        exp_db.save_telemetry([Telemetry(i, 'cpu', 'n1', 1., 'exp1') for i in range(5)])
+        exp_db.close()
+
+        self.assertEqual(3, exp_db.failed_batches)
+        self.assertEqual([1, 2, 2], sorted(len(data.splitlines()) for data in failed))
+
+
+class TestInfluxAsynchronousWrites(unittest.TestCase):
+
+    def test_failed_write_is_passed_to_error_callback(self):
+        failed = list()
+        client = InfluxDBClient(url='http://localhost:1', token='token', org='galileo', timeout=1000,
+                                retries=0)
+        options = WriteOptions(write_type=WriteType.asynchronous)
+        exp_db = InfluxExperimentDatabase(client, write_options=options,
+                                          error_callback=lambda conf, data, e: failed.append((conf, data)))
+        exp_db.open()
+
+        exp_db.save_telemetry([Telemetry(1, 'cpu', 'n1', 1., 'exp1'), Telemetry(2, 'cpu', 'n1', 2., 'exp1')])
+        exp_db.close()
+
+        self.assertEqual(1, exp_db.failed_batches)
+        self.assertEqual(1, len(failed))
+        self.assertEqual('exp1', failed[0][0][0])
+        self.assertEqual(2, len(failed[0][1].splitlines()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from galileodb.mixed.db import MixedExperimentDatabase, MixedBackendError
+from galileodb.model import Experiment
+from tests.testutils import SqliteResource
+
+
+def slow(result=None, error: Exception = None, delay=0.2):
+    def call(*args, **kwargs):
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        return result
+
+    return MagicMock(side_effect=call)
+
+
+class TestMixedExperimentDatabase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.influxdb = MagicMock()
+        self.sqldb = MagicMock()
+        self.sqldb.db.in_transaction.return_value = False
+        self.sqldb.db.after_commit.side_effect = lambda callback: callback()
+        self.db = MixedExperimentDatabase(self.influxdb, self.sqldb)
+
+    def tearDown(self) -> None:
+        self.db.close()
+
+    def test_open_calls_backends_concurrently(self):
+        self.influxdb.open = slow()
+        self.sqldb.open = slow()
+
+        then = time.monotonic()
+        self.db.open()
+
+        self.assertLess(time.monotonic() - then, 0.35)
+        self.influxdb.open.assert_called_once()
+        self.sqldb.open.assert_called_once()
+
+    def test_gather_returns_results_in_order(self):
+        results = self.db.gather(slow('exp', delay=0.1), slow('traces', delay=0))
+        self.assertEqual(['exp', 'traces'], results)
+
+    def test_gather_raises_single_error(self):
+        self.assertRaises(KeyError, self.db.gather, slow(error=KeyError('a'), delay=0), slow(delay=0))
+
+    def test_gather_aggregates_errors(self):
+        with self.assertRaises(MixedBackendError) as context:
+            self.db.gather(slow(error=KeyError('a'), delay=0), slow(error=ValueError('b'), delay=0))
+
+        self.assertEqual([KeyError, ValueError], [type(e) for e in context.exception.errors])
+
+    def test_gather_waits_for_all_calls_before_raising(self):
+        other = slow(delay=0.1)
+
+        self.assertRaises(KeyError, self.db.gather, slow(error=KeyError('a'), delay=0), other)
+        other.assert_called_once()
+
+    def test_delete_experiment_deletes_from_both_backends(self):
+        self.db.delete_experiment('exp1')
+
+        self.sqldb.delete_experiment.assert_called_once_with('exp1')
+        self.influxdb.delete_experiment.assert_called_once_with('exp1')
+
+    def test_delete_experiment_keeps_bucket_if_sql_fails(self):
+        self.sqldb.delete_experiment = slow(error=ValueError('not found'), delay=0)
+
+        self.assertRaises(ValueError, self.db.delete_experiment, 'exp1')
+        self.influxdb.delete_experiment.assert_not_called()
+
+    def test_save_experiment_removes_bucket_if_sql_fails(self):
+        buckets = self.influxdb.client.buckets_api.return_value
+        self.sqldb.save_experiment = slow(error=ValueError('duplicate'), delay=0)
+
+        self.assertRaises(ValueError, self.db.save_experiment, Experiment('exp1'))
+        buckets.create_bucket.assert_called_once_with(bucket_name='exp1', org_id=self.influxdb.org_id)
+        buckets.delete_bucket.assert_called_once_with(buckets.create_bucket.return_value)
+
+
+class TestMixedExperimentDatabaseTransaction(unittest.TestCase):
+    sql_resource = SqliteResource()
+
+    def setUp(self) -> None:
+        self.sql_resource.setUp()
+        self.influxdb = MagicMock()
+        self.db = MixedExperimentDatabase(self.influxdb, self.sql_resource.db)
+
+    def tearDown(self) -> None:
+        self.db.close()
+        self.sql_resource.tearDown()
+
+    def test_save_experiment_is_rolled_back_with_transaction(self):
+        self.influxdb.client.buckets_api.return_value.create_bucket = slow(delay=0.1)
+
+        with self.assertRaises(KeyError):
+            with self.db.transaction():
+                self.db.save_experiment(Experiment('exp1', 'exp1-name', 'exp1-creator', 1.1, status='RUNNING'))
+                raise KeyError('metadata')
+
+        self.assertIsNone(self.db.get_experiment('exp1'))
+        self.influxdb.client.buckets_api.return_value.create_bucket.assert_called_once()
+
+    def test_delete_experiment_is_rolled_back_with_transaction(self):
+        self.db.save_experiment(Experiment('exp1', 'exp1-name', 'exp1-creator', 1.1, status='RUNNING'))
+        self.influxdb.delete_experiment = slow(delay=0.1)
+
+        with self.assertRaises(KeyError):
+            with self.db.transaction():
+                self.db.delete_experiment('exp1')
+                raise KeyError('metadata')
+
+        self.assertEqual('exp1', self.db.get_experiment('exp1').id)
+        self.influxdb.delete_experiment.assert_not_called()
+
+    def test_delete_experiment_deletes_bucket_after_commit(self):
+        self.db.save_experiment(Experiment('exp1', 'exp1-name', 'exp1-creator', 1.1, status='RUNNING'))
+
+        with self.db.transaction():
+            self.db.delete_experiment('exp1')
+            self.influxdb.delete_experiment.assert_not_called()
+
+        self.assertIsNone(self.db.get_experiment('exp1'))
+        self.influxdb.delete_experiment.assert_called_once_with('exp1')
+
+    def test_purge_experiment_is_rolled_back_with_transaction(self):
+        self.db.save_experiment(Experiment('exp1', 'exp1-name', 'exp1-creator', 1.1, status='RUNNING'))
+
+        with self.assertRaises(KeyError):
+            with self.db.transaction():
+                self.db.purge_experiment('exp1')
+                raise KeyError('metadata')
+
+        self.assertEqual('exp1', self.db.get_experiment('exp1').id)
+        self.influxdb.purge_experiment.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
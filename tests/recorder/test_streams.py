@@ -0,0 +1,180 @@
+import shutil
+import tempfile
+import threading
+import unittest
+from typing import List
+from unittest.mock import patch
+
+from galileodb.model import RequestTrace, Event, ExperimentEvent
+from galileodb.recorder.streams import RedisStreamConsumer, RedisStreamTraceRecorder, RedisStreamEventRecorder, \
+    experiment_group
+from galileodb.reporter.streams import RedisStreamTraceReporter, RedisStreamEventReporter, TRACES_STREAM
+from galileodb.spool import Spool
+from galileodb.trace import TraceWriter
+from tests.testutils import RedisResource, assert_poll
+
+
+class ListTraceWriter(TraceWriter):
+
+    def __init__(self, failures=0) -> None:
+        super().__init__()
+        self.failures = failures
+        self.traces = list()
+        self.lock = threading.Lock()
+
+    def write(self, traces: List[RequestTrace]):
+        with self.lock:
+            if self.failures > 0:
+                self.failures -= 1
+                raise IOError('database unavailable')
+            self.traces.extend(traces)
+
+
+def fixture(n: int) -> List[RequestTrace]:
+    return [RequestTrace('r%d' % i, 'c1', 's1', i, i + 0.1, i + 0.2, 200) for i in range(n)]
+
+
+class RedisStreamRecorderTest(unittest.TestCase):
+    redis = RedisResource()
+
+    def setUp(self) -> None:
+        self.redis.setUp()
+
+    def tearDown(self) -> None:
+        self.redis.tearDown()
+
+    def pending(self, group: str) -> int:
+        return self.redis.rds.xpending(TRACES_STREAM, group)['pending']
+
+    def test_trace_recorder_writes_and_acknowledges_traces(self):
+        writer = ListTraceWriter()
+        consumer = RedisStreamConsumer(self.redis.rds, TRACES_STREAM, 'group', block=100)
+        recorder = RedisStreamTraceRecorder(self.redis.rds, 'exp1', writer, consumer=consumer)
+        recorder.start()
+        try:
+            assert_poll(lambda: self.redis.rds.exists(TRACES_STREAM), 'recorder did not create the group')
+            RedisStreamTraceReporter(self.redis.rds).report_multiple(fixture(10))
+
+            assert_poll(lambda: len(writer.traces) == 10, 'traces were not written')
+            self.assertEqual([t._replace(exp_id='exp1') for t in fixture(10)], writer.traces)
+            self.assertEqual(0, self.pending('group'))
+        finally:
+            recorder.stop(timeout=2)
+
+    def test_trace_recorder_retries_failed_writes(self):
+        writer = ListTraceWriter(failures=2)
+        consumer = RedisStreamConsumer(self.redis.rds, TRACES_STREAM, 'group', block=100)
+        recorder = RedisStreamTraceRecorder(self.redis.rds, 'exp1', writer, consumer=consumer)
+        recorder.retry_delay = 0.05
+        recorder.start()
+        try:
+            assert_poll(lambda: self.redis.rds.exists(TRACES_STREAM), 'recorder did not create the group')
+            RedisStreamTraceReporter(self.redis.rds).report_multiple(fixture(10))
+
+            assert_poll(lambda: len(writer.traces) == 10, 'traces were not written after the writer recovered')
+            self.assertEqual(0, writer.failures)
+            self.assertEqual(0, self.pending('group'))
+        finally:
+            recorder.stop(timeout=2)
+
+    def test_trace_recorder_spools_failed_writes(self):
+        spool_dir = tempfile.mkdtemp()
+        spool = Spool(spool_dir)
+        try:
+            writer = ListTraceWriter(failures=1)
+            consumer = RedisStreamConsumer(self.redis.rds, TRACES_STREAM, 'group', block=100, start_id='0')
+            RedisStreamTraceReporter(self.redis.rds).report_multiple(fixture(10))
+            consumer.create_group()
+
+            recorder = RedisStreamTraceRecorder(self.redis.rds, 'exp1', writer, consumer=consumer, spool=spool)
+            recorder.start()
+            assert_poll(lambda: self.redis.rds.xinfo_groups(TRACES_STREAM)[0]['last-delivered-id'] != '0-0' and
+                        self.pending('group') == 0, 'traces were not acknowledged')
+            recorder.stop(timeout=2)
+
+            self.assertEqual([], writer.traces)
+            spooled = list()
+            spool.replay('traces', spooled.extend)
+            self.assertEqual(10, len(spooled))
+        finally:
+            spool.close()
+            shutil.rmtree(spool_dir)
+
+    def test_consumers_of_a_group_share_entries(self):
+        RedisStreamTraceReporter(self.redis.rds).report_multiple(fixture(10))
+
+        c1 = RedisStreamConsumer(self.redis.rds, TRACES_STREAM, 'group', 'c1', batch_size=4, start_id='0')
+        c2 = RedisStreamConsumer(self.redis.rds, TRACES_STREAM, 'group', 'c2', batch_size=4, start_id='0')
+        c1.create_group()
+        c2.create_group()
+
+        ids = [entry_id for entry_id, _ in c1.read() + c2.read() + c1.read() + c2.read()]
+        self.assertEqual(10, len(ids))
+        self.assertEqual(10, len(set(ids)))
+
+    def test_consumer_rereads_and_claims_unacknowledged_entries(self):
+        RedisStreamTraceReporter(self.redis.rds).report_multiple(fixture(3))
+
+        crashed = RedisStreamConsumer(self.redis.rds, TRACES_STREAM, 'group', 'c1', start_id='0', block=10)
+        crashed.create_group()
+        self.assertEqual(3, len(crashed.read()))
+
+        # a restarted consumer gets its unacknowledged entries again
+        restarted = RedisStreamConsumer(self.redis.rds, TRACES_STREAM, 'group', 'c1', block=10)
+        self.assertEqual(3, len(restarted.read()))
+
+        # another consumer claims them once they are idle for claim_idle milliseconds
+        other = RedisStreamConsumer(self.redis.rds, TRACES_STREAM, 'group', 'c2', block=10, claim_idle=0)
+        entries = other.read()
+        self.assertEqual(3, len(entries))
+
+        other.ack([entry_id for entry_id, _ in entries])
+        self.assertEqual(0, self.pending('group'))
+
+    def test_trace_recorder_claims_entries_of_crashed_recorder(self):
+        RedisStreamTraceReporter(self.redis.rds).report_multiple(fixture(5))
+
+        crashed = RedisStreamConsumer(self.redis.rds, TRACES_STREAM, experiment_group('exp1'), 'crashed',
+                                      start_id='0')
+        crashed.create_group()
+        self.assertEqual(5, len(crashed.read()))
+
+        writer = ListTraceWriter()
+        with patch.dict('os.environ', {'galileo_expdb_stream_claim_idle': '50'}):
+            recorder = RedisStreamTraceRecorder(self.redis.rds, 'exp1', writer)
+        recorder.consumer.block = 20
+        recorder.start()
+        try:
+            assert_poll(lambda: len(writer.traces) == 5, 'entries of the crashed recorder were not claimed')
+            self.assertEqual(0, self.pending(experiment_group('exp1')))
+        finally:
+            recorder.stop(timeout=2)
+
+    def test_event_recorder_saves_events(self):
+        events = list()
+
+        class Db:
+            def save_events(self, e):
+                events.extend(e)
+
+        recorder = RedisStreamEventRecorder(self.redis.rds, Db(), 'exp1')
+        recorder.consumer.block = 100
+        recorder.start()
+        try:
+            assert_poll(lambda: self.redis.rds.exists('galileo/events/stream'), 'recorder did not create the group')
+            reporter = RedisStreamEventReporter(self.redis.rds)
+            reporter.report(Event(1.5, 'start'))
+            reporter.report(Event(2.5, 'phase', 'warmup'))
+
+            assert_poll(lambda: len(events) == 2, 'events were not saved')
+            self.assertEqual([
+                ExperimentEvent('exp1', '1.5', 'start'),
+                ExperimentEvent('exp1', '2.5', 'phase', 'warmup'),
+            ], events)
+            self.assertEqual(experiment_group('exp1'), recorder.consumer.group)
+        finally:
+            recorder.stop(timeout=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,15 @@
+import threading
+import time
 import unittest
 from queue import Queue
 from typing import List
 
 from galileodb.model import RequestTrace
 from galileodb.recorder.traces import TraceRecorder, TracesSubscriber, RedisTraceRecorder
-from galileodb.reporter.traces import RedisTraceReporter
+from galileodb.reporter.traces import RedisTraceReporter, encode_trace, encode_traces, announced_wire_version, \
+    WIRE_VERSION
 from galileodb.trace import TraceWriter
-from tests.testutils import RedisResource
+from tests.testutils import RedisResource, assert_poll
 
 
 class TraceRecorderTest(unittest.TestCase):
@@ -27,6 +30,8 @@ class TraceRecorderTest(unittest.TestCase):
 
         recorder = TestTraceRecorder(self.redis.rds)
         recorder.start()
+        assert_poll(lambda: self.redis.rds.pubsub_numsub(RedisTraceReporter.channel)[0][1] > 0,
+                    'recorder did not subscribe')
 
         headers = '{"server": ["Server", "BaseHTTP/0.6 Python/3.9.5"], "date": ["Date", "Tue, 14 Sep 2021 08:54:40 GMT"], "content-type": ["Content-type", "text/html"]}'
         reporter = RedisTraceReporter(self.redis.rds)
@@ -44,6 +49,82 @@ class TraceRecorderTest(unittest.TestCase):
 
         recorder.stop(timeout=2)
 
+    def test_recorder_announces_batch_protocol(self):
+        queue = Queue()
+
+        class TestTraceRecorder(TraceRecorder):
+            def _record_batch(self, traces):
+                queue.put(traces)
+
+        recorder = TestTraceRecorder(self.redis.rds)
+        recorder.start()
+        try:
+            assert_poll(lambda: announced_wire_version(self.redis.rds) == WIRE_VERSION,
+                        'recorder did not announce its protocol')
+
+            reporter = RedisTraceReporter(self.redis.rds)
+            self.assertEqual('batch', reporter.negotiated_protocol())
+
+            expected = [
+                RequestTrace('r1', 'c1', 's1', 1.1, 1.2, 1.3, 200, headers='a,b|c', response='x\\n\ny'),
+                RequestTrace('r2', 'c1', 's1', 2.1, 2.2, 2.3, 200, server='s1'),
+            ]
+            reporter.report_multiple(expected)
+            self.assertEqual(expected, queue.get(timeout=2))
+        finally:
+            recorder.stop(timeout=2)
+
+    def test_recorder_withdraws_announcement_when_stopped(self):
+        recorder = TraceRecorder(self.redis.rds)
+        recorder.start()
+        try:
+            assert_poll(lambda: announced_wire_version(self.redis.rds) == WIRE_VERSION,
+                        'recorder did not announce its protocol')
+        finally:
+            recorder.stop(timeout=2)
+
+        self.assertFalse(recorder.is_alive())
+        self.assertEqual(0, announced_wire_version(self.redis.rds))
+        self.assertEqual('csv', RedisTraceReporter(self.redis.rds).negotiated_protocol())
+
+    def test_recorder_reads_single_binary_traces(self):
+        queue = Queue()
+
+        class TestTraceRecorder(TraceRecorder):
+            def _record(self, t):
+                queue.put(t)
+
+        recorder = TestTraceRecorder(self.redis.rds)
+        recorder.start()
+        try:
+            assert_poll(lambda: announced_wire_version(self.redis.rds) == WIRE_VERSION,
+                        'recorder did not announce its protocol')
+
+            expected = RequestTrace('r1', 'c1', 's1', 1.1, 1.2, 1.3, 200, server='s1', response='hello')
+            RedisTraceReporter(self.redis.rds, protocol='binary').report_multiple([expected])
+            self.assertEqual(expected, queue.get(timeout=2))
+        finally:
+            recorder.stop(timeout=2)
+
+    def test_recorder_reads_csv_from_old_clients(self):
+        queue = Queue()
+
+        class TestTraceRecorder(TraceRecorder):
+            def _record(self, t):
+                queue.put(t)
+
+        recorder = TestTraceRecorder(self.redis.rds)
+        recorder.start()
+        try:
+            assert_poll(lambda: announced_wire_version(self.redis.rds) == WIRE_VERSION,
+                        'recorder did not announce its protocol')
+
+            expected = RequestTrace('r1', 'c1', 's1', 1.1, 1.2, 1.3, 200, server='s1', response='hello')
+            RedisTraceReporter(self.redis.rds, protocol='csv').report_multiple([expected])
+            self.assertEqual(expected, queue.get(timeout=2))
+        finally:
+            recorder.stop(timeout=2)
+
 
 class TraceSubscriberTest(unittest.TestCase):
     redis = RedisResource()
@@ -54,6 +135,22 @@ class TraceSubscriberTest(unittest.TestCase):
     def tearDown(self) -> None:
         self.redis.tearDown()
 
+    def test_announcement_is_refreshed_while_subscribed(self):
+        subscriber = TracesSubscriber(self.redis.rds, announce_ttl=0.3)
+        thread = threading.Thread(target=lambda: list(subscriber.run_batches()))
+        thread.start()
+        try:
+            assert_poll(lambda: announced_wire_version(self.redis.rds) == WIRE_VERSION, 'subscriber did not announce')
+            time.sleep(0.6)
+            self.assertEqual(WIRE_VERSION, announced_wire_version(self.redis.rds))
+            self.assertLessEqual(self.redis.rds.pttl('%s/%s' % (RedisTraceReporter.protocol_key,
+                                                                subscriber.subscriber_id)), 300)
+        finally:
+            subscriber.close()
+            thread.join(2)
+
+        self.assertEqual(0, announced_wire_version(self.redis.rds))
+
     def test_parse(self):
         parse = TracesSubscriber.parse
 
@@ -72,6 +169,27 @@ class TraceSubscriberTest(unittest.TestCase):
         self.assertEqual(expected, actual)
 
 
+    def test_decode(self):
+        decode = TracesSubscriber.decode
+        expected = RequestTrace('r1', 'c1', 's1', 1.1, 1.2, 1.3, 200, response='foo=bar\nfield1=value1,a,b,c')
+
+        self.assertEqual(expected, decode(encode_trace(expected)))
+        self.assertEqual(expected, decode(rb"r1,c1,s1,1.1000000,1.2000000,1.3000000,200,None,None,None,foo=bar\nfield1=value1,a,b,c"))
+        self.assertEqual(expected, decode(r"r1,c1,s1,1.1000000,1.2000000,1.3000000,200,None,None,None,foo=bar\nfield1=value1,a,b,c"))
+
+
+    def test_decode_batch(self):
+        decode_batch = TracesSubscriber.decode_batch
+        expected = [
+            RequestTrace('r1', 'c1', 's1', 1.1, 1.2, 1.3, 200, response='foo=bar\nfield1=value1,a,b,c'),
+            RequestTrace('r2', 'c1', 's1', 2.1, 2.2, 2.3, 200, server='s1'),
+        ]
+
+        self.assertEqual(expected, decode_batch(encode_traces(expected)))
+        self.assertEqual(expected[:1], decode_batch(encode_trace(expected[0])))
+        self.assertEqual(expected[:1], decode_batch(r"r1,c1,s1,1.1000000,1.2000000,1.3000000,200,None,None,None,foo=bar\nfield1=value1,a,b,c"))
+
+
 class RedisTraceRecorderTest(unittest.TestCase):
     redis = RedisResource()
 
@@ -0,0 +1,47 @@
+from unittest import TestCase
+
+from galileodb.model import RequestTrace, Event
+from galileodb.recorder.traces import _raw_client
+from galileodb.reporter.streams import RedisStreamTraceReporter, RedisStreamEventReporter, TRACES_STREAM, \
+    EVENTS_STREAM
+from galileodb.reporter.traces import decode_trace
+from tests.testutils import RedisResource
+
+
+class TestRedisStreamReporters(TestCase):
+    redis = RedisResource()
+
+    def setUp(self) -> None:
+        self.redis.setUp()
+
+    def tearDown(self) -> None:
+        self.redis.tearDown()
+
+    def test_report_traces(self):
+        fixture = [
+            RequestTrace('r1', 'c1', 's1', 1.1, 1.2, 1.3, 200, response='hello,\nthere'),
+            RequestTrace('r2', 'c1', 's1', 2.1, 2.2, 2.3, 200, server='server'),
+        ]
+
+        RedisStreamTraceReporter(self.redis.rds).report_multiple(fixture)
+
+        entries = _raw_client(self.redis.rds).xrange(TRACES_STREAM)
+        self.assertEqual(fixture, [decode_trace(fields[b't']) for _, fields in entries])
+
+    def test_report_traces_trims_stream(self):
+        reporter = RedisStreamTraceReporter(self.redis.rds, maxlen=10)
+
+        for i in range(50):
+            reporter.report_multiple([RequestTrace('r%d' % i, 'c1', 's1', 1.1, 1.2, 1.3)] * 10)
+
+        # trimming is approximate (in whole nodes of the stream), but bounded
+        self.assertLess(self.redis.rds.xlen(TRACES_STREAM), 500)
+
+    def test_report_events(self):
+        reporter = RedisStreamEventReporter(self.redis.rds)
+        reporter.report(Event(1.5, 'start'))
+        reporter.report(Event(2.5, 'phase', 'warmup'))
+
+        entries = self.redis.rds.xrange(EVENTS_STREAM)
+        self.assertEqual({'timestamp': '1.5', 'name': 'start'}, entries[0][1])
+        self.assertEqual({'timestamp': '2.5', 'name': 'phase', 'value': 'warmup'}, entries[1][1])
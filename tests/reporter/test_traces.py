@@ -3,8 +3,10 @@ from unittest import TestCase
 from timeout_decorator import timeout_decorator
 
 from galileodb.model import RequestTrace
-from galileodb.reporter.traces import RedisTraceReporter
-from tests.testutils import RedisResource, RedisSubscriber
+from galileodb.recorder.traces import _raw_client
+from galileodb.reporter.traces import RedisTraceReporter, decode_trace, encode_trace, decode_traces, encode_traces, \
+    announce_wire_version, withdraw_wire_version
+from tests.testutils import RedisResource, RedisSubscriber, assert_poll
 
 
 class TestRedisTraceReporter(TestCase):
@@ -12,10 +14,19 @@ class TestRedisTraceReporter(TestCase):
 
     def setUp(self) -> None:
         self.redis.setUp()
+        self.pubsubs = list()
 
     def tearDown(self) -> None:
+        for pubsub in self.pubsubs:
+            pubsub.close()
         self.redis.tearDown()
 
+    def subscribe(self):
+        pubsub = self.redis.rds.pubsub()
+        pubsub.subscribe(RedisTraceReporter.channel)
+        self.pubsubs.append(pubsub)
+        return pubsub
+
     @timeout_decorator.timeout(5)
     def test_report_multiple(self):
         reporter = RedisTraceReporter(self.redis.rds)
@@ -86,3 +97,154 @@ class TestRedisTraceReporter(TestCase):
             data)
 
         subscriber.shutdown()
+
+    @timeout_decorator.timeout(5)
+    def test_report_binary(self):
+        reporter = RedisTraceReporter(self.redis.rds, protocol='binary')
+        subscriber = RedisSubscriber(_raw_client(self.redis.rds), RedisTraceReporter.channel)
+        subscriber.start()
+
+        expected = RequestTrace('r1', 'c1', 's1', 1.1, 1.2, 1.3, 200, response='foo=bar\nfield1=value1,a,b,c',
+                                headers='{"date": "Tue, 14 Sep 2021"}')
+
+        reporter.report_multiple([expected])
+
+        try:
+            data = subscriber.queue.get(timeout=1)
+            self.assertIsInstance(data, bytes)
+            self.assertEqual(expected, decode_trace(data))
+        finally:
+            subscriber.shutdown()
+
+    def test_auto_protocol_negotiates_binary_with_announcing_subscribers(self):
+        reporter = RedisTraceReporter(self.redis.rds, protocol='auto', negotiate_interval=0)
+        self.subscribe()
+        self.assertEqual('csv', reporter.negotiated_protocol())
+
+        announce_wire_version(self.redis.rds, 'sub1', 60, 1)
+        self.assertEqual('binary', reporter.negotiated_protocol())
+
+    def test_auto_protocol_negotiates_batches_with_announcing_subscribers(self):
+        reporter = RedisTraceReporter(self.redis.rds, protocol='auto', negotiate_interval=0)
+        self.subscribe()
+        announce_wire_version(self.redis.rds, 'sub1', 60, 2)
+        self.assertEqual('batch', reporter.negotiated_protocol())
+
+    def test_auto_protocol_negotiates_lowest_version_of_live_subscribers(self):
+        reporter = RedisTraceReporter(self.redis.rds, protocol='auto', negotiate_interval=0)
+        new = self.subscribe()
+        old = self.subscribe()
+        announce_wire_version(self.redis.rds, 'new', 60, 2)
+        announce_wire_version(self.redis.rds, 'old', 60, 1)
+        self.assertEqual('binary', reporter.negotiated_protocol())
+
+        withdraw_wire_version(self.redis.rds, 'old')
+        old.unsubscribe()
+        assert_poll(lambda: reporter.negotiated_protocol() == 'batch', 'did not negotiate batches')
+
+        withdraw_wire_version(self.redis.rds, 'new')
+        new.unsubscribe()
+        self.assertEqual('csv', reporter.negotiated_protocol())
+
+    def test_auto_protocol_ignores_expired_announcements(self):
+        reporter = RedisTraceReporter(self.redis.rds, protocol='auto', negotiate_interval=0)
+        self.subscribe()
+        dead = self.subscribe()
+        announce_wire_version(self.redis.rds, 'new', 60, 2)
+        announce_wire_version(self.redis.rds, 'dead', 0.05, 1)
+        self.assertEqual('binary', reporter.negotiated_protocol())
+
+        dead.close()
+        assert_poll(lambda: reporter.negotiated_protocol() == 'batch', 'expired announcement was not ignored')
+
+    @timeout_decorator.timeout(5)
+    def test_report_batches(self):
+        reporter = RedisTraceReporter(self.redis.rds, protocol='batch', max_batch_bytes=250)
+        subscriber = RedisSubscriber(_raw_client(self.redis.rds), RedisTraceReporter.channel)
+        subscriber.start()
+
+        fixture = [RequestTrace('r%d' % i, 'c1', 's1', i, i + 0.1, i + 0.2, 200, response='x' * 10) for i in range(10)]
+
+        reporter.report_multiple(fixture)
+
+        try:
+            batches = [decode_traces(subscriber.queue.get(timeout=1)) for _ in range(4)]
+            self.assertEqual([3, 3, 3, 1], [len(batch) for batch in batches])
+            self.assertEqual(fixture, [t for batch in batches for t in batch])
+            self.assertTrue(subscriber.queue.empty())
+        finally:
+            subscriber.shutdown()
+
+    def test_auto_protocol_caches_negotiated_protocol(self):
+        reporter = RedisTraceReporter(self.redis.rds, protocol='auto', negotiate_interval=60)
+        self.subscribe()
+        self.assertEqual('csv', reporter.negotiated_protocol())
+
+        announce_wire_version(self.redis.rds, 'sub1', 60, 1)
+        self.assertEqual('csv', reporter.negotiated_protocol())
+
+    def test_auto_protocol_falls_back_to_csv_with_subscribers_that_do_not_announce(self):
+        reporter = RedisTraceReporter(self.redis.rds, protocol='auto', negotiate_interval=0)
+        self.subscribe()
+        self.subscribe()
+        announce_wire_version(self.redis.rds, 'new', 60, 2)
+
+        self.assertEqual('csv', reporter.negotiated_protocol())
+
+    def test_auto_protocol_negotiates_again_when_receivers_change(self):
+        reporter = RedisTraceReporter(self.redis.rds, protocol='auto', negotiate_interval=60)
+        self.subscribe()
+        announce_wire_version(self.redis.rds, 'new', 60, 2)
+        self.assertEqual('batch', reporter.negotiated_protocol())
+
+        trace = RequestTrace('r1', 'c1', 's1', 1.1, 1.2, 1.3, 200)
+        reporter.report_multiple([trace])
+        self.assertEqual('batch', reporter.negotiated_protocol())
+
+        # a subscriber that does not announce a version joins
+        self.subscribe()
+        reporter.report_multiple([trace])
+        self.assertEqual('csv', reporter.negotiated_protocol())
+
+    def test_unknown_protocol_raises_error(self):
+        self.assertRaises(ValueError, RedisTraceReporter, self.redis.rds, protocol='xml')
+
+
+class TestTraceWireProtocol(TestCase):
+
+    def test_encode_and_decode(self):
+        traces = [
+            RequestTrace('r1', 'c1', 's1', 1.1, 1.2, 1.3),
+            RequestTrace('r2', 'c1', 's1', 1.123456789, 2.2, 3.3, 500, 'server', 'exp1', '', 'None'),
+            RequestTrace('r3', 'c1', 's1', 1.1, 1.2, 1.3, 200, headers='a,b|c\\n', response='\x00\xff\n\r,\u00fc\U0001f600'),
+        ]
+
+        for trace in traces:
+            self.assertEqual(trace, decode_trace(encode_trace(trace)))
+
+    def test_encode_and_decode_batch(self):
+        traces = [
+            RequestTrace('r1', 'c1', 's1', 1.1, 1.2, 1.3),
+            RequestTrace('r2', 'c1', 's1', 1.123456789, 2.2, 3.3, 500, 'server', 'exp1', '', 'None'),
+            RequestTrace('r3', 'c1', 's1', 1.1, 1.2, 1.3, 200, headers='a,b|c\\n', response='\x00\xff\n\r,\u00fc\U0001f600'),
+        ]
+
+        self.assertEqual(traces, decode_traces(encode_traces(traces)))
+        self.assertEqual([], decode_traces(encode_traces([])))
+        self.assertEqual(traces[2:], decode_traces(encode_trace(traces[2])))
+
+    def test_decode_batch_rejects_truncated_message(self):
+        data = encode_traces([RequestTrace('r1', 'c1', 's1', 1.1, 1.2, 1.3, response='hello')] * 3)
+        self.assertRaises(ValueError, decode_traces, data[:-1])
+        self.assertRaises(ValueError, decode_traces, data[:30])
+        self.assertRaises(ValueError, decode_traces, b'r1,c1,s1')
+
+    def test_decode_rejects_unknown_version(self):
+        data = encode_trace(RequestTrace('r1', 'c1', 's1', 1.1, 1.2, 1.3))
+        self.assertRaises(ValueError, decode_trace, b'\x00\x02' + data[2:])
+        self.assertRaises(ValueError, decode_trace, b'r1,c1,s1')
+
+    def test_decode_rejects_truncated_message(self):
+        data = encode_trace(RequestTrace('r1', 'c1', 's1', 1.1, 1.2, 1.3, response='hello'))
+        self.assertRaises(ValueError, decode_trace, data[:-1])
+        self.assertRaises(Exception, decode_trace, data[:10])
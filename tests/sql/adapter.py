@@ -1,7 +1,11 @@
+import multiprocessing
+import threading
 import unittest
+from unittest.mock import patch
 
-from galileodb.model import Experiment, Telemetry
+from galileodb.model import Experiment, Telemetry, RequestTrace, ExperimentEvent, NodeInfo
 from galileodb.sql.adapter import ExperimentSQLDatabase, SqlAdapter
+from galileodb.sql.migrations import MIGRATIONS, OPTIONAL_VERSIONS, Migration, get_schema_version, migrate
 from tests.test_db import AbstractTestExperimentDatabase
 
 
@@ -34,6 +38,165 @@ class AbstractTestSqlDatabase(AbstractTestExperimentDatabase):
         val = cur.fetchone()
         self.assertEqual(3, val[0])
 
+    def test_fetchiter_yields_chunks(self):
+        entries = [('expid%d' % i, 'test_experiment', 'unittest2', 'running') for i in range(5)]
+        self.sql.insert_many('experiments', ['exp_id', 'name', 'creator', 'status'], entries)
+
+        chunks = list(self.sql.fetchiter('SELECT EXP_ID FROM experiments ORDER BY EXP_ID', size=2))
+
+        self.assertEqual([2, 2, 1], [len(chunk) for chunk in chunks])
+        self.assertEqual(['expid%d' % i for i in range(5)], [row[0] for chunk in chunks for row in chunk])
+
+    def test_select_batches_yields_chunks(self):
+        entries = [('expid%d' % i, 'test_experiment', 'unittest2', 'running') for i in range(5)]
+        self.sql.insert_many('experiments', ['exp_id', 'name', 'creator', 'status'], entries)
+
+        where = '`CREATOR` = ' + self.sql.placeholder
+        chunks = list(self.sql.select_batches('experiments', ['exp_id', 'status'], where, ('unittest2',), size=2))
+
+        self.assertEqual([2, 2, 1], [len(chunk) for chunk in chunks])
+        self.assertEqual(sorted('expid%d' % i for i in range(5)), sorted(row[0] for chunk in chunks for row in chunk))
+
+    def test_transaction_commits_at_end_of_block(self):
+        with self.db.transaction():
+            self.db.save_experiment(Experiment('expid13', 'name', 'creator', 1, 2, 1, 'FINISHED'))
+            self.db.save_metadata('expid13', {'foo': 'bar'})
+            self.assertTrue(self.sql.in_transaction())
+
+        self.assertFalse(self.sql.in_transaction())
+        self.assertEqual('expid13', self.db.get_experiment('expid13').id)
+        self.assertEqual('bar', self.db.get_metadata('expid13')['foo'])
+
+    def test_transaction_rolls_back_on_error(self):
+        with self.assertRaises(KeyError):
+            with self.db.transaction():
+                self.db.save_experiment(Experiment('expid14', 'name', 'creator', 1, 2, 1, 'FINISHED'))
+                with self.db.transaction():
+                    self.db.save_telemetry([Telemetry(1, 'cpu', 'n1', 32, 'expid14')])
+                raise KeyError('abort')
+
+        self.assertIsNone(self.db.get_experiment('expid14'))
+        self.assertEqual([], self.db.get_telemetry('expid14'))
+
+    def test_after_commit_runs_callbacks_once_outermost_transaction_commits(self):
+        called = list()
+
+        self.sql.after_commit(lambda: called.append('outside'))
+        self.assertEqual(['outside'], called)
+
+        with self.db.transaction():
+            with self.db.transaction():
+                self.sql.after_commit(lambda: called.append('nested'))
+            self.assertEqual(['outside'], called)
+
+        self.assertEqual(['outside', 'nested'], called)
+
+    def test_after_commit_does_not_run_callbacks_on_rollback(self):
+        called = list()
+
+        with self.assertRaises(KeyError):
+            with self.db.transaction():
+                self.sql.after_commit(lambda: called.append('rolled back'))
+                raise KeyError('abort')
+
+        with self.db.transaction():
+            pass
+
+        self.assertEqual([], called)
+
+    def test_group_commit_saves_writes_of_all_threads(self):
+        self.sql.enable_group_commit(0.005)
+
+        def write(thread):
+            for i in range(10):
+                self.db.save_telemetry([Telemetry(i, 'cpu', 'n%d' % thread, i, 'expid15')])
+
+        threads = [threading.Thread(target=write, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(40, len(self.db.get_telemetry('expid15')))
+
+    def test_group_commit_failing_statement_does_not_fail_group(self):
+        self.sql.enable_group_commit(0.05)
+        committer = self.sql._group_commit()
+
+        ok = committer.submit('execute', ('DELETE FROM `telemetry` WHERE `EXP_ID` = ' + self.sql.placeholder,
+                                          ('expid16',)), {}, wait=False)
+        failed = committer.submit('execute', ('INSERT INTO `no_such_table` VALUES (1)',), {}, wait=False)
+
+        self.assertEqual(0, ok.result(5))
+        self.assertIsNotNone(failed.exception(5))
+
+    def test_adapter_is_usable_from_forked_process(self):
+        self.db.get_experiment('expid17')  # make sure the parent holds connections
+
+        def write():
+            self.db.save_telemetry([Telemetry(1, 'cpu', 'n1', 32, 'expid17')])
+
+        process = multiprocessing.get_context('fork').Process(target=write)
+        process.start()
+        process.join(10)
+
+        self.assertEqual(0, process.exitcode)
+        self.assertEqual(1, len(self.db.get_telemetry('expid17')))
+
+    def test_concurrent_readers_share_pool(self):
+        self.db.save_telemetry([Telemetry(1, 'cpu', 'n1', 32, 'expid18')])
+        results = list()
+
+        def read():
+            for _ in range(20):
+                results.append(len(self.db.get_telemetry('expid18')))
+
+        threads = [threading.Thread(target=read) for _ in range(self.sql.pool_size * 2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual([1] * 20 * len(threads), results)
+
+    def test_open_migrates_to_latest_version(self):
+        self.assertEqual(MIGRATIONS[-1].version, get_schema_version(self.sql))
+        self.assertTrue(self.sql.index_exists('telemetry', 'telemetry_exp_ts'))
+        self.assertTrue(self.sql.index_exists('experiments', 'experiments_status'))
+
+    def test_open_twice_does_not_reapply_migrations(self):
+        self.db.open()
+
+        rows = self.sql.fetchall('SELECT VERSION FROM schema_version')
+        self.assertEqual(len(MIGRATIONS), len(rows))
+
+    def test_rerun_interrupted_migration_keeps_data(self):
+        self.db.save_telemetry([Telemetry(1, 'cpu', 'n1', 32, 'expid1')])
+        self.sql.execute('DELETE FROM schema_version')
+
+        self.assertEqual(0, get_schema_version(self.sql))
+
+        version = migrate(self.sql)
+
+        self.assertEqual(MIGRATIONS[-1].version, version)
+        self.assertEqual([Telemetry(1, 'cpu', 'n1', 32, 'expid1')], self.db.get_telemetry('expid1'))
+
+    def test_migration_applied_concurrently_counts_as_applied(self):
+        def create_index(db):
+            # not idempotent, fails if the migration was applied before
+            db.execute('CREATE INDEX `telemetry_node` ON `telemetry` (`NODE`)')
+
+        migration = Migration(OPTIONAL_VERSIONS + 100, 'test', [create_index])
+        migrate(self.sql, migrations=[migration])
+
+        # another process applied the migration after the versions were read
+        with patch('galileodb.sql.migrations.get_applied_versions', side_effect=[set(), {migration.version}]):
+            self.assertEqual(migration.version, migrate(self.sql, migrations=[migration]))
+
+        rows = self.sql.fetchall('SELECT VERSION FROM schema_version WHERE VERSION = ' + self.sql.placeholder,
+                                 (migration.version,))
+        self.assertEqual(1, len(rows))
+
     def test_update_and_get(self):
         self.db.save_experiment(Experiment('expid6', 'test_experiment', 'unittest', 10, 100, 1, 'finished'))
         self.db.save_experiment(Experiment('expid7', 'test_experiment', 'unittest', 100, None, 10, 'running'))
@@ -50,6 +213,49 @@ class AbstractTestSqlDatabase(AbstractTestExperimentDatabase):
         self.assertEqual(10., exp2.created)
         self.assertEqual('finished', exp2.status)
 
+    def test_touch_traces_only_backfills_untagged_traces(self):
+        self.db.touch_window = 1
+        traces = [
+            RequestTrace('req1', 'c1', 's1', 1.1, 1.2, 1.3),
+            RequestTrace('req2', 'c1', 's1', 2.1, 2.2, 2.3, exp_id='other'),
+            RequestTrace('req3', 'c1', 's1', 3.5, 3.6, 3.7),
+            RequestTrace('req4', 'c1', 's1', 4.1, 4.2, 4.3),
+        ]
+        self.db.save_traces(traces)
+
+        self.db.touch_traces(Experiment('exp1', start=1, end=3.5, status='FINISHED'))
+
+        actual = {t.request_id: t.exp_id for t in self.db.get_traces()}
+        self.assertEqual({'req1': 'exp1', 'req2': 'other', 'req3': 'exp1', 'req4': None}, actual)
+
+    def test_idempotent_traces_skips_resubmitted_traces(self):
+        db = ExperimentSQLDatabase(self.sql, idempotent_traces=True)
+        db.open()
+
+        traces = [
+            RequestTrace('req1', 'c1', 's1', 1.1, 1.2, 1.3, exp_id='exp1'),
+            RequestTrace('req2', 'c1', 's1', 2.1, 2.2, 2.3, exp_id='exp1'),
+        ]
+        db.save_traces(traces)
+        db.save_traces(traces + [RequestTrace('req3', 'c1', 's1', 3.1, 3.2, 3.3, exp_id='exp1')])
+
+        actual = sorted(t.request_id for t in db.get_traces('exp1'))
+        self.assertEqual(['req1', 'req2', 'req3'], actual)
+
+    def test_idempotent_touch_traces_skips_conflicting_traces(self):
+        db = ExperimentSQLDatabase(self.sql, idempotent_traces=True)
+        db.open()
+        db.save_traces([
+            RequestTrace('req1', 'c1', 's1', 1.1, 1.2, 1.3, exp_id='exp1'),
+            RequestTrace('req1', 'c1', 's1', 1.1, 1.2, 1.3),
+            RequestTrace('req2', 'c1', 's1', 2.1, 2.2, 2.3),
+        ])
+
+        db.touch_traces(Experiment('exp1', start=1, end=3, status='FINISHED'))
+
+        actual = sorted((t.request_id, t.exp_id or '') for t in db.get_traces())
+        self.assertEqual([('req1', ''), ('req1', 'exp1'), ('req2', 'exp1')], actual)
+
     def test_save_telemetry_writes_to_table(self):
         telemetry = [
             Telemetry(1, 'cpu', 'n1', 32, 'expid1'),
@@ -86,6 +292,40 @@ class AbstractTestSqlDatabase(AbstractTestExperimentDatabase):
         telemetry_rows = self.db.db.fetchall('SELECT * FROM telemetry WHERE EXP_ID = "%s"' % exp_id_control)
         self.assertEqual(1, len(telemetry_rows))
 
+    def test_purge_experiment_removes_all_data(self):
+        for exp_id in ['expid10', 'expid11']:
+            self.db.save_experiment(Experiment(exp_id, 'test_experiment', 'unittest', 10, 100, 1, 'finished'))
+            self.db.save_metadata(exp_id, {'service': 'app1'})
+            self.db.save_telemetry([Telemetry(i, 'cpu', 'n1', 32, exp_id) for i in range(5)])
+            self.db.save_traces([RequestTrace(f'{exp_id}-req1', 'c1', 's1', 1.1, 1.2, 1.3, exp_id=exp_id)])
+            self.db.save_events([ExperimentEvent(exp_id, 1, 'begin')])
+            self.db.save_nodeinfos([NodeInfo('n1', {'arch': 'amd64'}, exp_id)])
+
+        progress = list()
+        self.db.purge_experiment('expid10', batch_size=2, progress=lambda table, n: progress.append((table, n)))
+
+        self.assertIsNone(self.db.get_experiment('expid10'))
+        self.assertIsNone(self.db.get_metadata('expid10'))
+        self.assertEqual([], self.db.get_telemetry('expid10'))
+        self.assertEqual([], self.db.get_traces('expid10'))
+        self.assertEqual([], self.db.get_events('expid10'))
+        nodeinfo = self.sql.fetchall(f'SELECT * FROM nodeinfo WHERE EXP_ID = {self.sql.placeholder}', ('expid10',))
+        self.assertEqual(0, len(nodeinfo))
+        self.assertEqual([('telemetry', 2), ('telemetry', 4), ('telemetry', 5)],
+                         [p for p in progress if p[0] == 'telemetry'])
+
+        self.assertIsNotNone(self.db.get_experiment('expid11'))
+        self.assertEqual(5, len(self.db.get_telemetry('expid11')))
+        self.assertEqual(1, len(self.db.get_traces('expid11')))
+        self.assertEqual(1, len(self.db.get_events('expid11')))
+
+    def test_purge_resumes_without_experiment(self):
+        self.db.save_telemetry([Telemetry(1, 'cpu', 'n1', 32, 'expid12')])
+
+        self.db.purge_experiment('expid12')
+
+        self.assertEqual([], self.db.get_telemetry('expid12'))
+
     def test_save_metadata_saves_and_gets_metadata(self):
         exp_id = 'expid10'
         data = {'service': 'app1', 'params': {'var': 1}}
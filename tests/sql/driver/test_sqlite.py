@@ -1,8 +1,14 @@
 import os
 import tempfile
+import sqlite3
 import unittest
 
+from galileodb.model import Telemetry, RequestTrace
+from galileodb.sql.adapter import ExperimentSQLDatabase
 from galileodb.sql.driver.sqlite import SqliteAdapter
+from galileodb.sql.groupcommit import GroupCommitter
+from galileodb.sql.migrations import get_schema_version, get_applied_versions, migrate, Migration, \
+    OPTIONAL_VERSIONS, IDEMPOTENT_TRACES_MIGRATIONS
 from tests.sql.adapter import AbstractTestSqlDatabase
 
 
@@ -20,6 +26,180 @@ class TestSqliteDatabase(AbstractTestSqlDatabase, unittest.TestCase):
         super().tearDown()
         os.remove(self.db_file)
 
+    def test_open_migrates_database_created_without_indexes(self):
+        legacy_file = tempfile.mktemp('.sqlite', 'galileo_test_')
+        try:
+            with open(ExperimentSQLDatabase.SCHEMA_FILE) as fd:
+                schema = fd.read()
+
+            con = sqlite3.connect(legacy_file)
+            con.executescript(schema.split('CREATE TABLE IF NOT EXISTS schema_version')[0])
+            con.execute("INSERT INTO telemetry VALUES ('exp1', 1.0, 'cpu', NULL, 'n1', 32.0)")
+            con.commit()
+            con.close()
+
+            sql = SqliteAdapter(legacy_file)
+            db = ExperimentSQLDatabase(sql)
+            db.open()
+            try:
+                self.assertEqual(1, get_schema_version(sql))
+                self.assertTrue(sql.index_exists('telemetry', 'telemetry_exp_node_metric'))
+                self.assertEqual([Telemetry(1., 'cpu', 'n1', 32., 'exp1')], db.get_telemetry('exp1'))
+            finally:
+                db.close()
+        finally:
+            os.remove(legacy_file)
+
+    def test_open_with_idempotent_traces_deletes_existing_duplicates(self):
+        self.db.save_traces([
+            RequestTrace('req1', 'first', 's1', 1.1, 1.2, 1.3, exp_id='exp1'),
+            RequestTrace('req1', 'second', 's1', 1.1, 1.2, 1.3, exp_id='exp1'),
+            RequestTrace('req2', 'c1', 's1', 2.1, 2.2, 2.3, exp_id='exp1'),
+            RequestTrace('req3', 'c1', 's1', 3.1, 3.2, 3.3),
+            RequestTrace('req3', 'c1', 's1', 3.1, 3.2, 3.3),
+        ])
+
+        db = ExperimentSQLDatabase(self.sql, idempotent_traces=True)
+        db.open()
+
+        actual = sorted((t.request_id, t.client, t.exp_id or '') for t in db.get_traces())
+        self.assertEqual([('req1', 'first', 'exp1'), ('req2', 'c1', 'exp1'), ('req3', 'c1', ''), ('req3', 'c1', '')],
+                         actual)
+        self.assertTrue(self.sql.index_exists('traces', 'traces_exp_request'))
+
+        version = IDEMPOTENT_TRACES_MIGRATIONS[-1].version
+        self.assertEqual([(version,)], self.sql.fetchall('SELECT VERSION FROM schema_version WHERE VERSION = ?',
+                                                         (version,)))
+        # the optional migration does not change the schema version
+        self.assertEqual(1, get_schema_version(self.sql))
+
+    def test_iter_telemetry_does_not_block_writes(self):
+        self.db.save_telemetry([Telemetry(i, 'cpu', 'n1', i, 'exp1') for i in range(5)])
+
+        writer = SqliteAdapter(self.db_file, timeout=0.1)
+        try:
+            it = self.db.iter_telemetry('exp1', chunk_size=2)
+            self.assertEqual(0, next(it).timestamp)
+
+            # fails with "database is locked" if the iterator holds a read lock between chunks
+            ExperimentSQLDatabase(writer).save_telemetry([Telemetry(5, 'cpu', 'n1', 5, 'exp1')])
+
+            self.assertEqual([1, 2, 3, 4, 5], [t.timestamp for t in it])
+        finally:
+            writer.close()
+
+    def test_purge_experiment_with_group_commit(self):
+        self.sql.enable_group_commit(0)
+        self.db.save_telemetry([Telemetry(1., 'cpu', 'n1', 32., 'exp1')])
+
+        self.db.purge_experiment('exp1')
+
+        self.assertEqual([], self.db.get_telemetry('exp1'))
+
+    def test_failed_migration_is_rolled_back(self):
+        def fail(db):
+            raise KeyError('oops')
+
+        migration = Migration(OPTIONAL_VERSIONS + 100, 'test', [
+            lambda db: db.execute('CREATE INDEX `telemetry_node` ON `telemetry` (`NODE`)'),
+            fail,
+        ])
+
+        self.assertRaises(KeyError, migrate, self.sql, migrations=[migration])
+        self.assertFalse(self.sql.index_exists('telemetry', 'telemetry_node'))
+        self.assertNotIn(migration.version, get_applied_versions(self.sql))
+
+    def test_group_commit_fails_statements_if_database_cannot_be_opened(self):
+        sql = SqliteAdapter(os.path.join(tempfile.mkdtemp(), 'missing', 'db.sqlite'))
+        sql.enable_group_commit(0)
+        try:
+            self.assertRaises(sqlite3.OperationalError, sql.execute, 'DELETE FROM telemetry')
+            # the committer survives the error and tries again with a new connection
+            self.assertRaises(sqlite3.OperationalError, sql.execute, 'DELETE FROM telemetry')
+        finally:
+            sql.disable_group_commit()
+
+    def test_group_commit_reconnects_after_failed_group(self):
+        self.sql.enable_group_commit(0)
+        committer = self.sql._group_commit()
+
+        commit = committer._commit
+        connections = list()
+
+        def flaky_commit(connection, batch):
+            connections.append(connection)
+            if len(connections) == 1:
+                raise sqlite3.OperationalError('disk I/O error')
+            return commit(connection, batch)
+
+        committer._commit = flaky_commit
+        self.assertRaises(sqlite3.OperationalError, committer.submit, 'execute', ('DELETE FROM telemetry',), {})
+        self.assertEqual(0, committer.submit('execute', ('DELETE FROM telemetry',), {}))
+        self.assertIsNot(connections[0], connections[1])
+
+    def test_group_commit_submit_does_not_wait_for_dead_thread(self):
+        committer = GroupCommitter(self.sql)
+        committer.liveness_interval = 0.01
+
+        # the committer thread was never started, so the statement is never executed
+        self.assertRaises(RuntimeError, committer.submit, 'execute', ('DELETE FROM telemetry',), {})
+
+
+class TestSqliteMemoryDatabase(AbstractTestSqlDatabase, unittest.TestCase):
+
+    def _create_sql_adapter(self):
+        return SqliteAdapter(':memory:')
+
+    def test_adapter_is_usable_from_forked_process(self):
+        self.skipTest('a forked process writes to its own copy of an in-memory database')
+
+    def test_query_while_iterating_uses_same_database(self):
+        self.db.save_telemetry([Telemetry(1., 'cpu', 'n1', 32., 'exp1'), Telemetry(2., 'cpu', 'n1', 33., 'exp1')])
+
+        iterator = self.db.iter_telemetry('exp1', chunk_size=1)
+        self.assertEqual(Telemetry(1., 'cpu', 'n1', 32., 'exp1'), next(iterator))
+
+        self.assertEqual(2, len(self.db.get_telemetry('exp1')))
+        self.assertEqual([Telemetry(2., 'cpu', 'n1', 33., 'exp1')], list(iterator))
+
+    def test_group_commit_writes_to_same_database(self):
+        self.sql.enable_group_commit(0)
+        self.db.save_telemetry([Telemetry(1., 'cpu', 'n1', 32., 'exp1')])
+
+        self.assertEqual([Telemetry(1., 'cpu', 'n1', 32., 'exp1')], self.db.get_telemetry('exp1'))
+
+
+class TestSqlitePerformanceDatabase(AbstractTestSqlDatabase, unittest.TestCase):
+    db_file = None
+
+    def setUp(self) -> None:
+        self.db_file = tempfile.mktemp('.sqlite', 'galileo_test_')
+        super().setUp()
+
+    def _create_sql_adapter(self):
+        return SqliteAdapter(self.db_file, profile='performance')
+
+    def tearDown(self) -> None:
+        super().tearDown()
+        for suffix in ['', '-wal', '-shm']:
+            if os.path.exists(self.db_file + suffix):
+                os.remove(self.db_file + suffix)
+
+    def test_profile_enables_wal(self):
+        self.assertEqual('wal', self.sql.fetchone('PRAGMA journal_mode')[0])
+        self.assertEqual(1, self.sql.fetchone('PRAGMA synchronous')[0])
+
+    def test_profile_does_not_enable_group_commit(self):
+        self.assertIsNone(self.sql.group_commit_delay)
+        self.assertIsNone(self.sql._group_commit())
+
+    def test_writes_are_visible_to_readers(self):
+        self.db.save_telemetry([Telemetry(1., 'cpu', 'n1', 32., 'exp1')])
+        self.assertEqual([Telemetry(1., 'cpu', 'n1', 32., 'exp1')], self.db.get_telemetry('exp1'))
+
+    def test_unknown_profile_raises(self):
+        self.assertRaises(ValueError, SqliteAdapter, self.db_file, profile='fast')
+
 
 if __name__ == '__main__':
     unittest.main()
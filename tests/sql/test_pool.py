@@ -0,0 +1,160 @@
+import os
+import threading
+import unittest
+from unittest.mock import patch
+
+from galileodb.sql.pool import ConnectionPool, PinnedConnectionPool
+
+
+class FakeConnection:
+
+    def __init__(self) -> None:
+        self.alive = True
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.created = list()
+        self.pool = ConnectionPool(self._connect, max_size=2, timeout=0.1, ping=lambda c: c.alive, ping_interval=0)
+
+    def _connect(self):
+        connection = FakeConnection()
+        self.created.append(connection)
+        return connection
+
+    def test_checkin_reuses_connection(self):
+        first = self.pool.checkout()
+        self.pool.checkin(first)
+
+        self.assertIs(first, self.pool.checkout())
+        self.assertEqual(1, len(self.created))
+
+    def test_checkout_is_bounded(self):
+        self.pool.checkout()
+        self.pool.checkout()
+
+        self.assertRaises(TimeoutError, self.pool.checkout)
+
+    def test_checkout_waits_for_checkin(self):
+        first = self.pool.checkout()
+        self.pool.checkout()
+
+        timer = threading.Timer(0.02, self.pool.checkin, (first,))
+        timer.start()
+        try:
+            self.assertIs(first, self.pool.checkout(timeout=1))
+        finally:
+            timer.join()
+
+    def test_dead_connection_is_replaced(self):
+        first = self.pool.checkout()
+        self.pool.checkin(first)
+        first.alive = False
+
+        second = self.pool.checkout()
+
+        self.assertIsNot(first, second)
+        self.assertTrue(first.closed)
+
+    def test_connection_context_discards_on_error(self):
+        with self.assertRaises(KeyError):
+            with self.pool.connection() as connection:
+                raise KeyError()
+
+        self.assertTrue(connection.closed)
+        self.assertIsNot(connection, self.pool.checkout())
+
+    def test_pool_resets_in_forked_process(self):
+        first = self.pool.checkout()
+        self.pool.checkin(first)
+        self.pool.checkout()
+
+        with patch('os.getpid', return_value=os.getpid() + 1):
+            # neither the idle nor the checked out connections of the parent are used (or closed) by the child
+            a = self.pool.checkout()
+            b = self.pool.checkout()
+
+        self.assertNotIn(a, [first, b])
+        self.assertFalse(first.closed)
+
+    def test_close_closes_idle_connections(self):
+        first = self.pool.checkout()
+        second = self.pool.checkout()
+        self.pool.checkin(first)
+
+        self.pool.close()
+        self.assertTrue(first.closed)
+        self.assertFalse(second.closed)
+
+        self.pool.checkin(second)
+        self.assertTrue(second.closed)
+        self.assertRaises(ValueError, self.pool.checkout)
+
+
+class TestPinnedConnectionPool(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.created = list()
+        self.pool = PinnedConnectionPool(self._connect, timeout=0.1)
+
+    def _connect(self):
+        connection = FakeConnection()
+        self.created.append(connection)
+        return connection
+
+    def test_checkout_is_reentrant_within_thread(self):
+        first = self.pool.checkout()
+        second = self.pool.checkout()
+
+        self.assertIs(first, second)
+        self.assertEqual(1, len(self.created))
+
+    def test_other_threads_wait_for_checkin(self):
+        connection = self.pool.checkout()
+        self.pool.checkout()
+        results = list()
+
+        def checkout():
+            try:
+                results.append(self.pool.checkout(timeout=0.05))
+            except TimeoutError as e:
+                results.append(e)
+
+        thread = threading.Thread(target=checkout)
+        thread.start()
+        thread.join()
+        self.assertIsInstance(results[0], TimeoutError)
+
+        self.pool.checkin(connection)
+        self.pool.checkin(connection)
+        thread = threading.Thread(target=checkout)
+        thread.start()
+        thread.join()
+        self.assertIs(connection, results[1])
+
+    def test_discard_keeps_connection(self):
+        with self.assertRaises(KeyError):
+            with self.pool.connection() as connection:
+                raise KeyError()
+
+        self.assertFalse(connection.closed)
+        self.assertIs(connection, self.pool.checkout())
+
+    def test_close_closes_connection_after_checkin(self):
+        connection = self.pool.checkout()
+
+        self.pool.close()
+        self.assertFalse(connection.closed)
+
+        self.pool.checkin(connection)
+        self.assertTrue(connection.closed)
+        self.assertRaises(ValueError, self.pool.checkout)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from galileodb.model import Experiment, Telemetry, RequestTrace
+from galileodb.sql.shard import ShardedSqliteExperimentDatabase
+from tests.test_db import AbstractTestExperimentDatabase
+
+
+class TestShardedSqliteExperimentDatabase(AbstractTestExperimentDatabase, unittest.TestCase):
+    db: ShardedSqliteExperimentDatabase
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp(prefix='galileo_test_')
+        self.db = ShardedSqliteExperimentDatabase(os.path.join(self.tmp_dir, 'catalog.sqlite'),
+                                                  os.path.join(self.tmp_dir, 'shards'))
+        self.db.open()
+
+    def tearDown(self) -> None:
+        self.db.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_data_is_stored_in_experiment_shard(self):
+        self.db.save_telemetry([Telemetry(1, 'cpu', 'n1', 32, 'exp1'), Telemetry(1, 'cpu', 'n1', 32, 'exp/2')])
+
+        self.assertTrue(os.path.isfile(self.db.shard_path('exp1')))
+        self.assertTrue(os.path.isfile(self.db.shard_path('exp/2')))
+        self.assertEqual(0, len(self.db.catalog.get_telemetry()))
+
+    def test_delete_experiment_removes_shard(self):
+        self.db.save_experiment(Experiment('exp1', start=1, end=2, status='FINISHED'))
+        self.db.save_telemetry([Telemetry(1, 'cpu', 'n1', 32, 'exp1')])
+        self.assertEqual(1, len(self.db.get_telemetry('exp1')))
+
+        self.db.delete_experiment('exp1')
+
+        self.assertFalse(os.path.exists(self.db.shard_path('exp1')))
+        self.assertEqual([], self.db.get_telemetry('exp1'))
+
+    def test_finished_experiment_is_read_only(self):
+        self.db.save_experiment(Experiment('exp1', start=1, end=2, status='FINISHED'))
+        self.db.save_telemetry([Telemetry(1, 'cpu', 'n1', 32, 'exp1')])
+
+        shard = self.db._reader('exp1')
+
+        self.assertEqual(1, len(shard.get_telemetry('exp1')))
+        self.assertRaises(Exception, shard.save_telemetry, [Telemetry(2, 'cpu', 'n1', 32, 'exp1')])
+
+    def test_touch_traces_moves_untagged_traces_into_shard(self):
+        self.db.save_traces([RequestTrace('req1', 'c1', 's1', 1.1, 1.2, 1.3)])
+        self.db.touch_traces(Experiment('exp1', start=1, end=2, status='FINISHED'))
+
+        self.assertEqual(0, len(self.db.catalog.get_traces()))
+        self.assertEqual(['req1'], [t.request_id for t in self.db.get_traces('exp1')])
+
+    def test_touch_traces_moves_traces_in_chunks(self):
+        self.db.move_batch_size = 2
+        self.db.save_traces([RequestTrace('req%d' % i, 'c1', 's1', 1 + i / 10, 1.2, 1.3) for i in range(5)])
+        self.db.save_traces([RequestTrace('other', 'c1', 's1', 3.1, 3.2, 3.3)])
+
+        self.db.touch_traces(Experiment('exp1', start=1, end=2, status='FINISHED'))
+
+        self.assertEqual(['other'], [t.request_id for t in self.db.catalog.get_traces()])
+        self.assertEqual(['req%d' % i for i in range(5)], sorted(t.request_id for t in self.db.get_traces('exp1')))
+
+    def test_touch_traces_keeps_traces_in_catalog_if_shard_fails(self):
+        self.db.move_batch_size = 2
+        self.db.save_traces([RequestTrace('req%d' % i, 'c1', 's1', 1 + i / 10, 1.2, 1.3) for i in range(5)])
+        shard = self.db._writer('exp1')
+        save_traces = shard.save_traces
+        chunks = list()
+
+        def fail_second_chunk(traces):
+            chunks.append(traces)
+            if len(chunks) > 1:
+                raise sqlite3.OperationalError('disk I/O error')
+            save_traces(traces)
+
+        with patch.object(shard, 'save_traces', side_effect=fail_second_chunk):
+            self.assertRaises(sqlite3.OperationalError, self.db.touch_traces,
+                              Experiment('exp1', start=1, end=2, status='FINISHED'))
+
+        self.assertEqual(['req2', 'req3', 'req4'], sorted(t.request_id for t in self.db.catalog.get_traces()))
+        self.assertEqual(['req0', 'req1'], sorted(t.request_id for t in shard.get_traces('exp1')))
+
+
+if __name__ == '__main__':
+    unittest.main()
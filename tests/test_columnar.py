@@ -0,0 +1,47 @@
+import unittest
+
+import numpy as np
+
+from galileodb.columnar import ColumnBuilder, TELEMETRY_COLUMNS, TRACE_COLUMNS
+from galileodb.model import Telemetry, RequestTrace
+
+
+class TestColumnBuilder(unittest.TestCase):
+
+    def test_dictionary_encoding_across_chunks(self):
+        builder = ColumnBuilder(TELEMETRY_COLUMNS)
+        builder.append([Telemetry(1, 'cpu', 'n1', 32, 'exp1'), Telemetry(2, 'cpu', 'n2', 33, 'exp1')])
+        builder.append([Telemetry(3, 'rx', 'n1', 34, 'exp1', 'eth0')])
+
+        columns = builder.build()
+
+        self.assertEqual(np.float64, columns['timestamp'].dtype)
+        self.assertEqual([0, 1, 0], columns['node'].tolist())
+        self.assertEqual(['n1', 'n2'], columns.categories['node'])
+        self.assertEqual([0, 0, 1], columns['metric'].tolist())
+        self.assertEqual([-1, -1, 0], columns['subsystem'].tolist())
+        self.assertEqual([None, None, 'eth0'], columns.decode('subsystem').tolist())
+
+    def test_extend_with_null_status(self):
+        builder = ColumnBuilder(TRACE_COLUMNS)
+        builder.extend([
+            RequestTrace('r1', 'c1', 's1', 1.1, 1.2, 1.3, status=None),
+            RequestTrace('r2', 'c1', 's1', 2.1, 2.2, 2.3, status=500),
+        ], chunk_size=1)
+
+        columns = builder.build()
+
+        self.assertEqual(np.int64, columns['status'].dtype)
+        self.assertEqual([-1, 500], columns['status'].tolist())
+        self.assertEqual(['r1', 'r2'], columns['request_id'].tolist())
+
+    def test_build_empty(self):
+        columns = ColumnBuilder(TELEMETRY_COLUMNS).build()
+
+        self.assertEqual(0, len(columns))
+        self.assertEqual(np.float64, columns['value'].dtype)
+        self.assertEqual(np.int32, columns['node'].dtype)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,7 @@
 import abc
 
 from galileodb import ExperimentDatabase, Experiment, Telemetry
-from galileodb.model import ExperimentEvent, RequestTrace
+from galileodb.model import ExperimentEvent, RequestTrace, ResampledTelemetry
 
 
 class AbstractTestExperimentDatabase(abc.ABC):
@@ -105,6 +105,77 @@ class AbstractTestExperimentDatabase(abc.ABC):
         self.assertEqual(telemetry[2], actual[2])
         self.assertEqual(telemetry[3], actual[3])
 
+    def test_get_telemetry_with_filters(self):
+        telemetry = [
+            Telemetry(1, 'cpu', 'n1', 32, 'expid1'),
+            Telemetry(2, 'cpu', 'n2', 33, 'expid1'),
+            Telemetry(3, 'cpu', 'n1', 31, 'expid1'),
+            Telemetry(4, 'rx', 'n1', 32, 'expid1', 'eth0'),
+            Telemetry(5, 'cpu', 'n1', 30, 'expid2'),
+        ]
+
+        self.db.save_telemetry(telemetry)
+
+        self.assertEqual([telemetry[0], telemetry[2]], self.db.get_telemetry('expid1', node='n1', metric='cpu'))
+        self.assertEqual([telemetry[3]], self.db.get_telemetry('expid1', subsystem='eth0'))
+        self.assertEqual([telemetry[1], telemetry[2]], self.db.get_telemetry('expid1', start=2, end=4))
+        self.assertEqual([telemetry[2]], list(self.db.iter_telemetry('expid1', node='n1', start=2, end=4)))
+
+    def test_get_telemetry_resampled(self):
+        telemetry = [
+            Telemetry(10.0, 'cpu', 'n1', 10, 'expid1'),
+            Telemetry(10.5, 'cpu', 'n1', 20, 'expid1'),
+            Telemetry(11.5, 'cpu', 'n1', 30, 'expid1'),
+            Telemetry(10.2, 'cpu', 'n2', 40, 'expid1'),
+            Telemetry(10.4, 'cpu', 'n1', 99, 'expid2'),
+        ]
+
+        self.db.save_telemetry(telemetry)
+
+        actual = self.db.get_telemetry_resampled('expid1', 1)
+
+        expected = [
+            ResampledTelemetry(10., 'cpu', 'n1', 'expid1', mean=15., min=10., max=20., count=2),
+            ResampledTelemetry(10., 'cpu', 'n2', 'expid1', mean=40., min=40., max=40., count=1),
+            ResampledTelemetry(11., 'cpu', 'n1', 'expid1', mean=30., min=30., max=30., count=1),
+        ]
+        self.assertEqual(expected, actual)
+
+        actual = self.db.get_telemetry_resampled('expid1', 2, agg=('sum',), node='n1')
+        self.assertEqual([ResampledTelemetry(10., 'cpu', 'n1', 'expid1', sum=60.)], actual)
+
+    def test_save_and_iter_telemetry(self):
+        telemetry = [
+            Telemetry(1, 'cpu', 'n1', 32, 'expid1'),
+            Telemetry(2, 'cpu', 'n1', 33, 'expid1'),
+            Telemetry(3, 'cpu', 'n1', 31, 'expid2'),
+            Telemetry(4, 'rx', 'n1', 32, 'expid1', 'eth0'),
+        ]
+
+        self.db.save_telemetry(telemetry)
+
+        actual = list(self.db.iter_telemetry('expid1', chunk_size=2))
+        self.assertEqual([telemetry[0], telemetry[1], telemetry[3]], actual)
+
+    def test_save_and_get_telemetry_columns(self):
+        telemetry = [
+            Telemetry(1, 'cpu', 'n1', 32, 'expid1'),
+            Telemetry(2, 'cpu', 'n2', 33, 'expid1'),
+            Telemetry(3, 'cpu', 'n1', 31, 'expid2'),
+            Telemetry(4, 'rx', 'n1', 30, 'expid1', 'eth0'),
+        ]
+
+        self.db.save_telemetry(telemetry)
+
+        columns = self.db.get_telemetry_columns('expid1', chunk_size=2)
+
+        self.assertEqual(3, len(columns))
+        self.assertEqual([1., 2., 4.], columns['timestamp'].tolist())
+        self.assertEqual([32., 33., 30.], columns['value'].tolist())
+        self.assertEqual(['n1', 'n2', 'n1'], columns.decode('node').tolist())
+        self.assertEqual(['cpu', 'cpu', 'rx'], columns.decode('metric').tolist())
+        self.assertEqual([None, None, 'eth0'], columns.decode('subsystem').tolist())
+
     def test_save_and_touch_and_get_traces(self):
         traces = [
             RequestTrace('req1', 'c1', 's1', 1.1, 1.2, 1.3, server='h1', status=200),
@@ -145,6 +216,74 @@ class AbstractTestExperimentDatabase(abc.ABC):
         self.assertEqual(ExperimentEvent('exp1', 2.0, 'start', 'function1'), stored[1])
         self.assertEqual(ExperimentEvent('exp2', 3.0, 'stop', 'function1'), stored[2])
 
+    def test_save_and_iter_traces(self):
+        traces = [
+            RequestTrace('req1', 'c1', 's1', 1.1, 1.2, 1.3, server='h1', status=200, exp_id='exp1'),
+            RequestTrace('req2', 'c2', 's2', 2.1, 2.2, 2.3, server='h2', status=200, exp_id='exp2'),
+            RequestTrace('req3', 'c3', 's1', 3.1, 3.2, 3.3, server='h1', status=200, exp_id='exp1', response='hi'),
+        ]
+
+        self.db.save_traces(traces)
+
+        actual = list(self.db.iter_traces('exp1', chunk_size=1))
+        self.assertEqual([traces[0], traces[2]], actual)
+
+    def test_save_and_get_traces_columns(self):
+        traces = [
+            RequestTrace('req1', 'c1', 's1', 1.1, 1.2, 1.3, server='h1', status=200, exp_id='exp1'),
+            RequestTrace('req2', 'c2', 's2', 2.1, 2.2, 2.3, server='h2', exp_id='exp1'),
+        ]
+
+        self.db.save_traces(traces)
+
+        columns = self.db.get_traces_columns('exp1')
+
+        self.assertEqual(['req1', 'req2'], columns['request_id'].tolist())
+        self.assertEqual([1.1, 2.1], columns['created'].tolist())
+        self.assertEqual([1.3, 2.3], columns['done'].tolist())
+        self.assertEqual([200, -1], columns['status'].tolist())
+        self.assertEqual(['s1', 's2'], columns.decode('service').tolist())
+
+    def test_get_traces_with_filters(self):
+        traces = [
+            RequestTrace('req1', 'c1', 's1', 1.1, 1.2, 1.3, server='h1', status=200, exp_id='exp1'),
+            RequestTrace('req2', 'c2', 's2', 2.1, 2.2, 2.3, server='h2', status=200, exp_id='exp1'),
+            RequestTrace('req3', 'c1', 's1', 3.1, 3.2, 3.3, server='h1', status=500, exp_id='exp1'),
+            RequestTrace('req4', 'c1', 's1', 4.1, 4.2, 4.3, server='h1', status=200, exp_id='exp2'),
+        ]
+
+        self.db.save_traces(traces)
+
+        self.assertEqual([traces[0], traces[2]], self.db.get_traces('exp1', service='s1'))
+        self.assertEqual([traces[2]], self.db.get_traces('exp1', client='c1', status=500))
+        self.assertEqual([traces[1], traces[2]], self.db.get_traces('exp1', start=2, end=4))
+
+    def test_get_events_with_filters(self):
+        events = [
+            ExperimentEvent('exp1', 1, 'begin'),
+            ExperimentEvent('exp1', 2, 'start', 'function1'),
+            ExperimentEvent('exp1', 3, 'start', 'function2'),
+        ]
+
+        self.db.save_events(events)
+
+        self.assertEqual([ExperimentEvent('exp1', 2., 'start', 'function1')], self.db.get_events('exp1', 'start', end=3))
+
+    def test_save_and_iter_events(self):
+        events = [
+            ExperimentEvent('exp1', 1, 'begin'),
+            ExperimentEvent('exp1', 2, 'start', 'function1'),
+            ExperimentEvent('exp2', 3, 'stop', 'function1'),
+        ]
+
+        self.db.save_events(events)
+
+        iterator = self.db.iter_events(chunk_size=2)
+        self.assertEqual(ExperimentEvent('exp1', 1.0, 'begin', None), next(iterator))
+        self.assertEqual(ExperimentEvent('exp1', 2.0, 'start', 'function1'), next(iterator))
+        self.assertEqual(ExperimentEvent('exp2', 3.0, 'stop', 'function1'), next(iterator))
+        self.assertRaises(StopIteration, next, iterator)
+
     def test_save_and_get_events_for_experiment(self):
         events = [
             ExperimentEvent('exp1', 1, 'begin'),
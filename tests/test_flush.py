@@ -0,0 +1,115 @@
+import multiprocessing
+import time
+import unittest
+
+from galileodb.flush import FlushPolicy, FlushBuffer
+from galileodb.model import RequestTrace
+from galileodb.trace import TraceLogger, TraceWriter, POISON
+from tests.testutils import assert_poll
+
+
+class TestFlushPolicy(unittest.TestCase):
+
+    def test_flush_on_size(self):
+        policy = FlushPolicy(max_size=2)
+        policy.add()
+        self.assertFalse(policy.should_flush())
+        policy.add()
+        self.assertTrue(policy.should_flush())
+
+        policy.flushed()
+        self.assertFalse(policy.should_flush())
+
+    def test_flush_on_age(self):
+        policy = FlushPolicy(max_size=100, max_age=0.01)
+        self.assertIsNone(policy.time_until_due())
+
+        policy.add()
+        self.assertFalse(policy.should_flush())
+        time.sleep(0.02)
+        self.assertTrue(policy.should_flush())
+        self.assertEqual(0, policy.time_until_due())
+
+    def test_flush_on_bytes(self):
+        policy = FlushPolicy(max_size=100, max_bytes=20)
+        policy.add(('0123456789',))
+        self.assertFalse(policy.should_flush())
+        policy.add(('0123456789',))
+        self.assertTrue(policy.should_flush())
+
+    def test_adaptive_policy_grows_and_shrinks(self):
+        policy = FlushPolicy(max_size=10, adaptive=True, max_size_limit=30, target_latency=0.1)
+
+        for expected in [20, 30, 30]:
+            policy.add(n=policy.max_size)
+            policy.flushed(latency=0.2)
+            self.assertEqual(expected, policy.max_size)
+
+        policy.add(n=5)
+        policy.flushed(latency=0.2)
+        self.assertEqual(30, policy.max_size, 'a flush that was not caused by the size should not grow the batch')
+
+        policy.add(n=30)
+        policy.flushed(latency=0.001)
+        self.assertEqual(15, policy.max_size)
+        policy.flushed(latency=0.001)
+        self.assertEqual(10, policy.max_size)
+
+
+class TestFlushBuffer(unittest.TestCase):
+
+    def test_timer_flushes_old_records(self):
+        written = list()
+        buffer = FlushBuffer(written.extend, FlushPolicy(max_size=100, max_age=0.05))
+        buffer.start_timer()
+        try:
+            buffer.append(1)
+            assert_poll(lambda: written == [1], 'record should have been flushed by the timer')
+            self.assertEqual(0, len(buffer))
+        finally:
+            buffer.stop_timer()
+
+    def test_extend_flushes_on_size(self):
+        written = list()
+        buffer = FlushBuffer(written.append, FlushPolicy(max_size=3))
+
+        buffer.extend([1, 2])
+        self.assertEqual([], written)
+        buffer.extend([3, 4])
+        self.assertEqual([[1, 2, 3, 4]], written)
+        self.assertEqual(0, len(buffer))
+
+    def test_failed_write_keeps_records(self):
+        def write(records):
+            raise IOError()
+
+        buffer = FlushBuffer(write, FlushPolicy(max_size=2))
+        buffer.append(1)
+        self.assertRaises(IOError, buffer.append, 2)
+        self.assertEqual(2, len(buffer))
+
+
+class TestTraceLoggerFlushPolicy(unittest.TestCase):
+
+    def test_trace_logger_flushes_on_age(self):
+        queue = multiprocessing.Queue()
+        written = multiprocessing.Queue()
+
+        class QueueWriter(TraceWriter):
+            def write(self, traces):
+                for trace in traces:
+                    written.put(trace)
+
+        logger = TraceLogger(queue, QueueWriter(), flush_policy=FlushPolicy(max_size=100, max_age=0.1))
+        logger.start()
+        try:
+            trace = RequestTrace('req1', 'client', 'service', 1.1, 1.2, 1.3)
+            queue.put(trace)
+            self.assertEqual(trace, written.get(timeout=2))
+        finally:
+            queue.put(POISON)
+            logger.join(5)
+
+
+if __name__ == '__main__':
+    unittest.main()
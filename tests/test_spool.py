@@ -0,0 +1,170 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from galileodb.flush import FlushBuffer, FlushPolicy
+from galileodb.model import Telemetry
+from galileodb.spool import Spool, SpoolReplayer
+
+
+class TestSpool(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp(prefix='galileo_test_')
+        self.spool = Spool(self.tmp_dir)
+
+    def tearDown(self) -> None:
+        self.spool.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_replay_writes_batches_in_order_and_removes_segments(self):
+        self.spool.append('telemetry', [Telemetry(1, 'cpu', 'n1', 1, 'exp1')])
+        self.spool.append('telemetry', [Telemetry(2, 'cpu', 'n1', 2, 'exp1'), Telemetry(3, 'cpu', 'n1', 3, 'exp1')])
+        self.assertTrue(self.spool.pending())
+
+        written = list()
+        self.assertEqual(3, self.spool.replay('telemetry', written.append))
+
+        self.assertEqual([1, 2], [len(batch) for batch in written])
+        self.assertEqual([1, 2, 3], [t.timestamp for batch in written for t in batch])
+        self.assertFalse(self.spool.pending())
+        self.assertEqual([], os.listdir(os.path.join(self.tmp_dir, 'telemetry')))
+
+    def test_segments_are_sealed_at_segment_size(self):
+        spool = Spool(self.tmp_dir, segment_size=1)
+        spool.append('events', [1])
+        spool.append('events', [2])
+
+        self.assertEqual(2, len(spool.segments('events')))
+
+    def test_failed_replay_keeps_remaining_batches(self):
+        for i in range(3):
+            self.spool.append('traces', [i])
+
+        written = list()
+
+        def write(batch):
+            if batch == [1]:
+                raise IOError('database down')
+            written.append(batch)
+
+        self.assertRaises(IOError, self.spool.replay, 'traces', write)
+        self.assertEqual([[0]], written)
+
+        self.spool.replay('traces', written.append)
+        self.assertEqual([[0], [1], [2]], written)
+
+    def test_incomplete_batch_is_skipped(self):
+        self.spool.append('traces', [1])
+        self.spool.append('traces', [2])
+        self.spool.seal()
+
+        path = self.spool.segments('traces')[0]
+        with open(path, 'r+b') as fd:
+            fd.truncate(os.path.getsize(path) - 1)
+
+        self.assertEqual([[1]], list(Spool.read_segment(path)))
+
+    def test_open_segment_of_dead_process_is_replayable(self):
+        stream_dir = os.path.join(self.tmp_dir, 'events')
+        os.makedirs(stream_dir)
+        # pids never exceed 2^22 on linux
+        shutil.copy(self._segment_with([1]), os.path.join(stream_dir, '%020d-%d.open' % (1, 2 ** 22 + 1)))
+
+        written = list()
+        self.spool.replay('events', written.append)
+        self.assertEqual([[1]], written)
+
+    def test_open_segment_of_crashed_process_with_same_pid_is_replayable(self):
+        stream_dir = os.path.join(self.tmp_dir, 'events')
+        os.makedirs(stream_dir)
+        # a restarted process (e.g., pid 1 in a container) finds the segment of its crashed predecessor
+        shutil.copy(self._segment_with([1]), os.path.join(stream_dir, '%020d-%d.open' % (1, os.getpid())))
+        self.spool.append('events', [2])
+
+        written = list()
+        self.spool.replay('events', written.append)
+        self.assertEqual([[1], [2]], written)
+
+    def test_open_segment_of_running_process_is_not_replayable(self):
+        other = Spool(self.tmp_dir)
+        other.append('events', [1])
+
+        self.assertEqual([], self.spool.segments('events'))
+        other.close()
+        self.assertEqual(1, len(self.spool.segments('events')))
+
+    def test_replay_skips_segments_claimed_by_another_replayer(self):
+        self.spool.append('events', [1])
+        self.spool.seal()
+
+        fd, claimed = Spool._claim(self.spool.segments('events')[0])
+        try:
+            written = list()
+            self.assertEqual(0, Spool(self.tmp_dir).replay('events', written.append))
+            self.assertEqual([], written)
+        finally:
+            # the replayer crashed, its segment is replayed by the next one
+            fd.close()
+
+        self.assertEqual(1, Spool(self.tmp_dir).replay('events', written.append))
+        self.assertEqual([[1]], written)
+        self.assertFalse(os.path.exists(claimed))
+
+    def test_concurrent_replayers_write_each_batch_once(self):
+        spool = Spool(self.tmp_dir, segment_size=1)
+        for i in range(50):
+            spool.append('events', [i])
+
+        written = list()
+
+        def replay():
+            Spool(self.tmp_dir).replay('events', written.append)
+
+        threads = [threading.Thread(target=replay) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(list(range(50)), sorted(i for batch in written for i in batch))
+        self.assertEqual([], os.listdir(os.path.join(self.tmp_dir, 'events')))
+
+    def _segment_with(self, batch):
+        spool = Spool(os.path.join(self.tmp_dir, 'source'))
+        spool.append('events', batch)
+        spool.seal()
+        return spool.segments('events')[0]
+
+    def test_replayer_retries_after_failure(self):
+        self.spool.append('telemetry', [1])
+
+        def write(batch):
+            raise IOError('database down')
+
+        replayer = SpoolReplayer(self.spool, {'telemetry': write})
+        self.assertIsNone(replayer.replay())
+
+        written = list()
+        replayer.writers = {'telemetry': written.append}
+        self.assertEqual(1, replayer.replay())
+        self.assertEqual([[1]], written)
+
+    def test_flush_buffer_spools_failed_writes(self):
+        def write(records):
+            raise IOError('database down')
+
+        buffer = FlushBuffer(write, FlushPolicy(max_size=2), lambda records: self.spool.append('events', records))
+        buffer.append(1)
+        buffer.append(2)
+
+        self.assertEqual(0, len(buffer))
+        written = list()
+        self.spool.replay('events', written.append)
+        self.assertEqual([[1, 2]], written)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,16 +1,23 @@
+import csv
+import gzip
+import importlib.util
 import multiprocessing
+import os
 import shutil
 import threading
 import unittest
+import zlib
 from time import sleep
+from typing import List
 from unittest.mock import patch
 
 from timeout_decorator import timeout_decorator
 
-from galileodb.model import RequestTrace
+from galileodb.model import RequestTrace, Experiment
 from galileodb.reporter.traces import RedisTraceReporter
 from galileodb.trace import TraceLogger, POISON, START, PAUSE, FLUSH, TraceWriter, FileTraceWriter, \
     RedisTopicTraceWriter, DatabaseTraceWriter
+from galileodb.tracequeue import pack_traces
 from tests.testutils import RedisResource, SqliteResource, assert_poll, RedisSubscriber
 
 traces = [
@@ -93,6 +100,34 @@ class TestTraceLogger(unittest.TestCase):
 
         assert_poll(lambda: len(written) == self.flush_interval)
 
+    def test_batched_messages_are_buffered(self):
+        written = list()
+
+        class DummyWriter(TraceWriter):
+            def write(self, buffer):
+                written.extend(buffer)
+
+        self.logger.writer = DummyWriter()
+
+        self.queue.put([traces[0]])
+        self.queue.put(pack_traces(traces[1:]))
+
+        assert_poll(lambda: written == traces, 'batched traces were not written')
+
+    def test_undecodable_chunks_are_skipped(self):
+        written = list()
+
+        class DummyWriter(TraceWriter):
+            def write(self, buffer):
+                written.extend(buffer)
+
+        self.logger.writer = DummyWriter()
+
+        self.queue.put(b'\xffnot a chunk')
+        self.queue.put(pack_traces(traces))
+
+        assert_poll(lambda: written == traces, 'traces after an undecodable chunk were not written')
+
     def trigger_flush(self):
         for i in range(self.flush_interval):
             self.queue.put(RequestTrace(f'req{i}', 'client', 'service', 1, 1, 1, status=200, response='data'))
@@ -123,6 +158,67 @@ class TestDatabaseTraceWriter(unittest.TestCase):
         self.assertEqual(traces[1], actual[1])
         self.assertEqual(traces[2], actual[2])
 
+    @timeout_decorator.timeout(5)
+    def test_write_tags_traces_with_given_experiment(self):
+        self.writer = DatabaseTraceWriter(self.sql_resource.db, exp_id='exp2')
+        self.writer.write(traces)
+
+        actual = self.sql_resource.db.get_traces()
+
+        self.assertEqual(['exp2', 'exp1', 'exp2'], [t.exp_id for t in actual])
+
+    @timeout_decorator.timeout(5)
+    def test_write_tags_traces_with_running_experiment(self):
+        self.sql_resource.db.save_experiment(Experiment('exp3', start=2, status='RUNNING'))
+
+        self.writer = DatabaseTraceWriter(self.sql_resource.db)
+        self.writer.write(traces)
+
+        actual = self.sql_resource.db.get_traces()
+
+        # req1 was created before the experiment started
+        self.assertEqual([None, 'exp1', 'exp3'], [t.exp_id for t in actual])
+
+    @timeout_decorator.timeout(5)
+    def test_write_tags_traces_with_next_experiment_after_switch(self):
+        db = self.sql_resource.db
+        first = Experiment('first', start=1, status='RUNNING')
+        db.save_experiment(first)
+
+        self.writer = DatabaseTraceWriter(db, refresh_interval=60)
+        self.writer.write([RequestTrace('req1', 'client', 'service', 1.5, 1.6, 1.7)])
+
+        db.finalize_experiment(first, 'FINISHED')
+        db.save_experiment(Experiment('second', start=first.end, status='RUNNING'))
+        self.writer.write([RequestTrace('req2', 'client', 'service', first.end + 1, first.end + 2, first.end + 3)])
+
+        self.assertEqual(['first', 'second'], [t.exp_id for t in db.get_traces()])
+
+    @timeout_decorator.timeout(5)
+    def test_write_does_not_tag_traces_with_purged_experiment(self):
+        db = self.sql_resource.db
+        db.save_experiment(Experiment('exp3', start=2, status='RUNNING'))
+
+        self.writer = DatabaseTraceWriter(db, refresh_interval=60)
+        self.writer.write(traces[2:])
+
+        db.purge_experiment('exp3')
+        self.writer.write([RequestTrace('req4', 'client', 'service', 4.2, 4.3, 4.4)])
+
+        self.assertEqual([None], [t.exp_id for t in db.get_traces()])
+
+    @timeout_decorator.timeout(5)
+    def test_write_does_not_tag_traces_after_experiment_end(self):
+        self.sql_resource.db.save_experiment(Experiment('exp3', start=2, end=3, status='RUNNING'))
+
+        self.writer = DatabaseTraceWriter(self.sql_resource.db)
+        self.writer.write(traces)
+
+        actual = self.sql_resource.db.get_traces()
+
+        # req3 was created after the experiment ended
+        self.assertEqual([None, 'exp1', None], [t.exp_id for t in actual])
+
 
 class TestRedisTopicTraceWriter(unittest.TestCase):
     redis_resource = RedisResource()
@@ -158,8 +254,16 @@ class TestFileTraceWriter(unittest.TestCase):
         self.writer = FileTraceWriter('test', self.target_dir)
 
     def tearDown(self) -> None:
+        self.writer.close()
         shutil.rmtree(self.target_dir)
 
+    def read_files(self, open_file=open) -> List[str]:
+        contents = list()
+        for name in sorted(os.listdir(self.target_dir)):
+            with open_file(os.path.join(self.target_dir, name), 'rt') as fd:
+                contents.append(fd.read())
+        return contents
+
     def test_write(self):
         self.writer.write(traces[:1])
         self.writer.write(traces[1:])  # makes sure consecutive write calls append to file
@@ -175,3 +279,165 @@ class TestFileTraceWriter(unittest.TestCase):
             actual = fd.read()
 
         self.assertEqual(expected.strip(), actual.strip())
+
+    def test_append_to_existing_file(self):
+        self.writer.write(traces[:1])
+        self.writer.close()
+
+        self.writer = FileTraceWriter('test', self.target_dir)
+        self.writer.write(traces[1:2])
+
+        expected = \
+            'request_id,client,service,created,sent,done,status,server,exp_id,headers,response\n' + \
+            'req1,client,service,1.1,1.2,1.3,-1,,,,\n' + \
+            'req2,client,service,2.2,2.3,2.4,200,server1,exp1,"{""headers"": 1}",hello\n'
+
+        self.assertEqual([expected], self.read_files())
+
+    def test_write_after_close_reopens_file(self):
+        self.writer.write(traces[:1])
+        self.writer.close()
+        self.writer.write(traces[1:2])
+
+        expected = \
+            'request_id,client,service,created,sent,done,status,server,exp_id,headers,response\n' + \
+            'req1,client,service,1.1,1.2,1.3,-1,,,,\n' + \
+            'req2,client,service,2.2,2.3,2.4,200,server1,exp1,"{""headers"": 1}",hello\n'
+
+        self.writer.close()
+        self.assertEqual([expected], self.read_files())
+
+    def test_write_after_close_with_rotation(self):
+        self.writer.close()
+        shutil.rmtree(self.target_dir)
+        self.writer = FileTraceWriter('test', self.target_dir, max_bytes=100)
+
+        self.writer.write(traces[:1])
+        self.writer.close()
+        self.writer.write(traces[1:2])
+        self.writer.close()
+
+        self.assertEqual(2, sum(content.count('req') - 1 for content in self.read_files()))
+
+    def test_rotate_by_size(self):
+        self.writer.close()
+        shutil.rmtree(self.target_dir)
+        self.writer = FileTraceWriter('test', self.target_dir, max_bytes=100)
+
+        for trace in traces:
+            self.writer.write([trace])
+        self.writer.close()
+
+        files = self.read_files()
+        self.assertEqual(3, len(files))
+        for content in files:
+            self.assertTrue(content.startswith('request_id,client,'))
+        self.assertEqual(3, sum(content.count('req') - 1 for content in files))
+
+    def test_rotate_by_age(self):
+        self.writer.close()
+        shutil.rmtree(self.target_dir)
+        self.writer = FileTraceWriter('test', self.target_dir, max_age=0)
+
+        self.writer.write(traces[:1])
+        self.writer.write(traces[1:])
+
+        files = sorted(os.listdir(self.target_dir))
+        self.assertEqual(2, len(files))
+        self.assertEqual('traces-test.csv', files[-1])
+
+    def test_gzip_compression(self):
+        self.writer.close()
+        shutil.rmtree(self.target_dir)
+        self.writer = FileTraceWriter('test', self.target_dir, compression='gzip')
+
+        self.writer.write(traces[:1])
+        self.writer.close()
+        self.writer = FileTraceWriter('test', self.target_dir, compression='gzip')
+        self.writer.write(traces[1:])
+        self.writer.close()
+
+        self.assertEqual(['traces-test.csv.gz'], os.listdir(self.target_dir))
+        with gzip.open(os.path.join(self.target_dir, 'traces-test.csv.gz'), 'rt', newline='') as fd:
+            rows = list(csv.reader(fd))
+
+        self.assertEqual(4, len(rows))
+        self.assertEqual('foo=bar\nx=1,"2",3', rows[3][-1])
+
+    def test_gzip_compression_is_readable_before_close(self):
+        self.writer.close()
+        shutil.rmtree(self.target_dir)
+        self.writer = FileTraceWriter('test', self.target_dir, compression='gzip')
+        self.writer.write(traces)
+
+        with open(self.writer.file_path, 'rb') as fd:
+            content = zlib.decompressobj(wbits=31).decompress(fd.read()).decode('utf-8')
+
+        self.assertIn('req3', content)
+
+    @unittest.skipUnless(importlib.util.find_spec('zstandard'), 'zstandard is not installed')
+    def test_zstd_compression(self):
+        import zstandard
+        self.writer.close()
+        shutil.rmtree(self.target_dir)
+        self.writer = FileTraceWriter('test', self.target_dir, compression='zstd')
+        self.writer.write(traces)
+        self.writer.close()
+
+        with zstandard.open(os.path.join(self.target_dir, 'traces-test.csv.zst'), 'rt') as fd:
+            self.assertIn('req3', fd.read())
+
+    def test_unknown_compression_raises_error(self):
+        self.assertRaises(ValueError, FileTraceWriter, 'test', self.target_dir, compression='bz2')
+
+    @patch('galileodb.trace.os.fsync')
+    def test_fsync_policies(self, fsync):
+        for policy, expected in [('none', 0), ('flush', 4), ('interval', 2)]:
+            fsync.reset_mock()
+            writer = FileTraceWriter('test', self.target_dir, fsync=policy, fsync_interval=60)
+            for trace in traces:
+                writer.write([trace])
+            writer.close()
+            # 'flush' syncs after each write and on close, 'interval' after the first write and on close
+            self.assertEqual(expected, fsync.call_count, policy)
+
+    def test_trace_logger_closes_writer(self):
+        queue = multiprocessing.Queue()
+        closed = threading.Event()
+
+        class ClosingWriter(TraceWriter):
+            def write(self, traces):
+                pass
+
+            def close(self):
+                closed.set()
+
+        trace_logger = TraceLogger(queue, ClosingWriter())
+        thread = threading.Thread(target=trace_logger.run)
+        thread.start()
+        queue.put(POISON)
+        thread.join(5)
+
+        self.assertTrue(closed.is_set())
+
+    def test_trace_logger_process_owns_gzip_file(self):
+        self.writer.close()
+        shutil.rmtree(self.target_dir)
+        self.writer = FileTraceWriter('test', self.target_dir, compression='gzip')
+
+        queue = multiprocessing.Queue()
+        trace_logger = TraceLogger(queue, self.writer)
+        trace_logger.start()
+        queue.put(traces)
+        queue.put(POISON)
+        trace_logger.join(5)
+        self.assertEqual(0, trace_logger.exitcode)
+
+        # the writer of this process never opened the file, so closing it must not touch the file
+        self.writer.close()
+
+        with gzip.open(os.path.join(self.target_dir, 'traces-test.csv.gz'), 'rt', newline='') as fd:
+            rows = list(csv.reader(fd))
+
+        self.assertEqual(4, len(rows))
+        self.assertEqual('req3', rows[3][0])
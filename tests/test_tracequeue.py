@@ -0,0 +1,117 @@
+import multiprocessing
+import queue
+import unittest
+
+from galileodb.model import RequestTrace
+from galileodb.tracequeue import pack_traces, unpack_traces, TraceBatcher, RingBufferQueue
+from tests.testutils import assert_poll
+
+traces = [
+    RequestTrace('req1', 'client', 'service', 1.1, 1.2, 1.3),
+    RequestTrace('req2', 'client', 'service', 2.2, 2.3, 2.4, 200, 'server1', 'exp1', '{"headers": 1}', 'hello'),
+    RequestTrace('req3', 'client', 'service', 3.2, 3.3, 3.4, status=200, server='server1', response='x\n1,"2"'),
+]
+
+
+def produce(q, n):
+    for i in range(n):
+        q.put(pack_traces([RequestTrace('req%d' % i, 'client', 'service', i, i, i)]))
+
+
+class TestTraceChunks(unittest.TestCase):
+
+    def test_pack_and_unpack(self):
+        self.assertEqual(traces, unpack_traces(pack_traces(traces)))
+
+    def test_unpack_rejects_unknown_version(self):
+        self.assertRaises(ValueError, unpack_traces, b'\x00data')
+        self.assertRaises(ValueError, unpack_traces, b'')
+
+
+class TestTraceBatcher(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.queue = queue.Queue()
+
+    def test_puts_full_batches(self):
+        batcher = TraceBatcher(self.queue, batch_size=2, max_age=10)
+        batcher.put_many(traces)
+
+        self.assertEqual(traces[:2], self.queue.get_nowait())
+        self.assertTrue(self.queue.empty())
+
+        batcher.close()
+        self.assertEqual(traces[2:], self.queue.get_nowait())
+
+    def test_puts_packed_batches(self):
+        batcher = TraceBatcher(self.queue, batch_size=3, max_age=10, packed=True)
+        batcher.put_many(traces)
+        batcher.close()
+
+        self.assertEqual(traces, unpack_traces(self.queue.get_nowait()))
+
+    def test_puts_old_traces(self):
+        batcher = TraceBatcher(self.queue, batch_size=100, max_age=0.1)
+        try:
+            batcher.put(traces[0])
+            assert_poll(lambda: not self.queue.empty(), 'trace was not put after max_age')
+            self.assertEqual([traces[0]], self.queue.get_nowait())
+        finally:
+            batcher.close()
+
+
+class TestRingBufferQueue(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.queue = RingBufferQueue(size=256)
+
+    def tearDown(self) -> None:
+        self.queue.unlink()
+
+    def test_put_and_get(self):
+        self.queue.put('__FLUSH__')
+        self.queue.put(b'chunk')
+        self.queue.put(traces[0])
+
+        self.assertEqual('__FLUSH__', self.queue.get())
+        self.assertEqual(b'chunk', self.queue.get())
+        self.assertEqual(traces[0], self.queue.get())
+        self.assertTrue(self.queue.empty())
+
+    def test_messages_wrap_around(self):
+        for i in range(20):
+            message = bytes([i]) * 60
+            self.queue.put(message)
+            self.assertEqual(message, self.queue.get())
+
+    def test_get_raises_empty(self):
+        self.assertRaises(queue.Empty, self.queue.get, timeout=0.01)
+        self.assertRaises(queue.Empty, self.queue.get_nowait)
+
+    def test_put_raises_full(self):
+        self.queue.put(b'x' * 200)
+        self.assertRaises(queue.Full, self.queue.put, b'x' * 200, timeout=0.01)
+
+    def test_put_rejects_oversized_message(self):
+        self.assertRaises(ValueError, self.queue.put, b'x' * 256)
+
+    def test_messages_from_other_processes(self):
+        q = RingBufferQueue(size=1024)
+        try:
+            producers = [multiprocessing.Process(target=produce, args=(q, 100)) for _ in range(2)]
+            for p in producers:
+                p.start()
+
+            received = [unpack_traces(q.get(timeout=5))[0] for _ in range(200)]
+
+            for p in producers:
+                p.join(5)
+
+            self.assertEqual(200, len(received))
+            self.assertEqual(2, sum(1 for t in received if t.request_id == 'req99'))
+        finally:
+            q.unlink()
+
+
+if __name__ == '__main__':
+    unittest.main()